@@ -0,0 +1,120 @@
+"""情节、章節題目的全文检索：字二元组（bigram）倒排索引，加载时建一次并随快照保存"""
+import html
+import re
+
+import numpy as np
+import pyarrow as pa
+
+FIELD_END = "\x00"  # 字段结束符：不与前后文字组成二元组，每个字段最后一个字也有一个二元组
+CODE_BITS = 21  # Unicode码位最多21位，二元组编码 = 前字码位 << 21 | 后字码位
+
+
+def document(plot, title):
+    """一行的检索文本：情节 + 章節題目（各自以结束符收尾，统一转小写）"""
+    plot = plot if isinstance(plot, str) else ""
+    title = title if isinstance(title, str) else ""
+    return (plot + FIELD_END + title + FIELD_END).casefold()
+
+
+def query_terms(query):
+    """检索词：按空白拆分，多个词同时命中才算命中（统一转小写，去掉重复）"""
+    if not query:
+        return []
+    return list(dict.fromkeys(t.casefold() for t in query.split() if t))
+
+
+def _codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+
+
+def build_index(documents):
+    """
+    建倒排索引：每个 (二元组, 行) 一条，按二元组编码、行号排序去重
+    返回Arrow表：gram（int64，升序）、rows（list<int32>，该二元组出现的行号，升序）
+    所有文本拼成一个码位数组后整体向量化处理，不逐字循环
+    """
+    lengths = np.fromiter((len(d) for d in documents), dtype=np.int64, count=len(documents))
+    codes = _codepoints("".join(documents))
+    row_of = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+    first, second = codes[:-1], codes[1:]
+    keep = first != 0  # 丢掉以结束符开头的二元组（跨字段、跨行）
+    grams = (first[keep] << CODE_BITS) | second[keep]
+    rows = row_of[:-1][keep]
+    if not len(grams):
+        return pa.table({'gram': pa.array([], pa.int64()), 'rows': pa.array([], pa.list_(pa.int32()))})
+    order = np.lexsort((rows, grams))
+    grams, rows = grams[order], rows[order]
+    distinct = np.r_[True, (grams[1:] != grams[:-1]) | (rows[1:] != rows[:-1])]
+    grams, rows = grams[distinct], rows[distinct]
+    starts = np.flatnonzero(np.r_[True, grams[1:] != grams[:-1]])
+    offsets = np.r_[starts, len(grams)].astype(np.int32)
+    postings = pa.ListArray.from_arrays(pa.array(offsets), pa.array(rows.astype(np.int32)))
+    return pa.table({'gram': pa.array(grams[starts]), 'rows': postings})
+
+
+class SearchIndex:
+    """倒排索引查询：二元组的行号列表求交得到候选行（结果是超集，需再按原文核对）"""
+
+    def __init__(self, table):
+        rows = table.column('rows').combine_chunks()
+        self.grams = table.column('gram').to_numpy()
+        self.offsets = rows.offsets.to_numpy()
+        self.postings = rows.values.to_numpy()
+
+    def _postings(self, lo, hi):
+        """第lo到hi-1个二元组的行号（相邻二元组的行号在数组里连续）"""
+        return self.postings[self.offsets[lo]:self.offsets[hi]]
+
+    def term_candidates(self, term):
+        """单个检索词的候选行：一个字取以它开头的所有二元组，多个字对各二元组求交"""
+        codes = _codepoints(term)
+        if len(codes) == 1:
+            lo, hi = np.searchsorted(self.grams, [codes[0] << CODE_BITS, (codes[0] + 1) << CODE_BITS])
+            return np.unique(self._postings(lo, hi))
+        result = None
+        for gram in np.unique((codes[:-1] << CODE_BITS) | codes[1:]):
+            lo = np.searchsorted(self.grams, gram)
+            if lo == len(self.grams) or self.grams[lo] != gram:
+                return np.array([], dtype=np.int32)
+            rows = self._postings(lo, lo + 1)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def candidates(self, terms):
+        """多个检索词的候选行（各词候选求交，升序）"""
+        result = None
+        for term in terms:
+            rows = self.term_candidates(term)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result if result is not None else np.array([], dtype=np.int32)
+
+
+def read_index(path):
+    """内存映射读取索引快照（Arrow IPC，读取时不拷贝）"""
+    with pa.memory_map(path, 'r') as source:
+        return SearchIndex(pa.ipc.open_file(source).read_all())
+
+
+def highlight(text, terms):
+    """把命中的检索词用<mark>标出（其余文字转义），供详情面板用unsafe_allow_html显示"""
+    if not terms:
+        return html.escape(text)
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts, last = [], 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+
+def snippet(text, terms, width=40):
+    """命中处前后各width字的片段（没有命中时取开头）"""
+    lowered = text.casefold()
+    hits = [lowered.find(t) for t in terms if lowered.find(t) >= 0]
+    start = max(min(hits) - width, 0) if hits else 0
+    end = min(start + 2 * width + max(map(len, terms), default=0), len(text))
+    return ("..." if start > 0 else "") + text[start:end] + ("..." if end < len(text) else "")
@@ -0,0 +1,147 @@
+"""
+人物共现：人物出现表即 单元×人物 的稀疏关联矩阵（COO，单元=行/章回/地点）
+共现权重 = 关联矩阵转置乘自身（AᵀA）的非对角元素，按单元分组后分块成对展开、逐块累加，不做人物两两循环
+"""
+import numpy as np
+import pandas as pd
+
+from 缓存 import LRUCache, state_key
+
+# 共现计算的单元：共同出现的行 / 章回 / 地点
+UNITS = {
+    "同一条记录": "row",
+    "同一章回": "chapter",
+    "同一地点": "location"
+}
+
+DENSE_LIMIT = 2 ** 24  # 人物数平方不超过此值时，权重在稠密计数数组上累加
+PAIR_CHUNK = 2 ** 20  # 每块最多展开的人物对数（逐块累加到权重上，中间数组约几十MB，不随总对数增长）
+
+# 共现索引缓存：语料版本 → CooccurrenceIndex
+index_cache = LRUCache(max_entries=4)
+
+
+def _pair_chunks(units, chars, max_pairs=PAIR_CHUNK):
+    """
+    已按单元排序的关联矩阵非零元 → 同一单元内的人物对 (a, b)，a < b，分块产出
+    单元内第i个元素与其后的元素各组成一对：每块取连续的一段元素，用repeat与偏移一次生成该段的全部对，
+    每块不超过max_pairs对（只有单个元素的对数就超过时才单独成块），内存不随总对数增长
+    """
+    n = len(units)
+    if n < 2:
+        return
+    starts = np.flatnonzero(np.r_[True, units[1:] != units[:-1]])
+    ends = np.r_[starts[1:], n]
+    group_end = np.repeat(ends, ends - starts)
+    partners = group_end - np.arange(n) - 1  # 每个元素之后同单元的元素个数
+    done = np.r_[0, np.cumsum(partners)]  # done[i]：前i个元素共有多少对
+    lo = 0
+    while lo < n:
+        hi = min(max(np.searchsorted(done, done[lo] + max_pairs, side='right') - 1, lo + 1), n)
+        counts = partners[lo:hi]
+        left = np.repeat(np.arange(lo, hi), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        right = left + 1 + (np.arange(len(left)) - first)
+        if len(left):
+            a, b = chars[left], chars[right]
+            yield np.minimum(a, b), np.maximum(a, b)
+        lo = hi
+
+
+def _merge_counts(parts):
+    """[(对, 次数), ...] → 合并相同的对（对升序）"""
+    keys = np.concatenate([p for p, _ in parts])
+    counts = np.concatenate([c for _, c in parts])
+    pairs, pair_ids = np.unique(keys, return_inverse=True)
+    return pairs, np.bincount(pair_ids, weights=counts, minlength=len(pairs)).astype(np.int64)
+
+
+class CooccurrenceIndex:
+    """
+    一个语料一个实例：人物出现记录按章回排序一次，章回范围 → searchsorted切出关联矩阵的一段行
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        occ = corpus.occurrences
+        row_ids = occ['row_id'].to_numpy()
+        chapter = corpus.df['chapter'].to_numpy()[row_ids]
+        order = np.argsort(chapter, kind='stable')
+        self.chapter = chapter[order]
+        self.row_id = row_ids[order].astype(np.int64)
+        self.char_id = occ['char_id'].to_numpy()[order].astype(np.int64)
+        self.loc_code = corpus.df['location'].cat.codes.to_numpy()[self.row_id].astype(np.int64)
+        self.n_chars = len(corpus.characters)
+
+    def incidence(self, unit="row", chapters=None, query=None, locs=None):
+        """章回范围内的关联矩阵非零元 (单元, 人物)，去重后按单元排序；locs：只用这些地点的记录，None表示全部"""
+        lo, hi = 0, len(self.chapter)
+        if chapters is not None:
+            lo = np.searchsorted(self.chapter, chapters[0], side='left')
+            hi = np.searchsorted(self.chapter, chapters[1], side='right')
+        units = {"row": self.row_id, "chapter": self.chapter.astype(np.int64), "location": self.loc_code}[unit][lo:hi]
+        chars = self.char_id[lo:hi]
+        keep = units >= 0  # 没有地点的记录不参与“同一地点”共现
+        if locs is not None or (query and query.strip()):
+            keep &= self.corpus.filters.mask(locs=locs, query=query)[self.row_id[lo:hi]]
+        pairs = np.unique(units[keep] * self.n_chars + chars[keep])  # 去重并按单元排序
+        return pairs // self.n_chars, pairs % self.n_chars
+
+    def _selected(self, units, members, chars):
+        """关联矩阵非零元只保留这些人物（人物名），chars为None时不变"""
+        if chars is None:
+            return units, members
+        selected = np.zeros(self.n_chars, dtype=bool)
+        selected[self.corpus.char_codes(chars)] = True
+        keep = selected[members]
+        return units[keep], members[keep]
+
+    def edges(self, unit="row", chapters=None, query=None, chars=None, locs=None):
+        """
+        共现边表：a、b（人物编码，a < b）、weight（共同的单元数），按权重降序
+        chars：只保留这些人物（人物名），None表示全部
+        """
+        units, members = self._selected(*self.incidence(unit, chapters, query, locs), chars)
+        if self.n_chars ** 2 <= DENSE_LIMIT:
+            # 人物不多时直接在 人物×人物 的计数数组上累加（即稠密的AᵀA），比哈希去重快
+            counts = np.zeros(self.n_chars ** 2, dtype=np.int64)
+            for a, b in _pair_chunks(units, members):
+                block = np.bincount(a * self.n_chars + b)
+                counts[:len(block)] += block
+            pairs = np.flatnonzero(counts)
+            weights = counts[pairs]
+        else:
+            # 每块先去重计数，待合并的块累计到不少于已合并的对数时再合并（合并次数随对数对数增长）
+            pairs, weights = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+            pending = []
+            for a, b in _pair_chunks(units, members):
+                pending.append(np.unique(a * self.n_chars + b, return_counts=True))
+                if sum(len(p) for p, _ in pending) >= max(len(pairs), PAIR_CHUNK):
+                    pairs, weights = _merge_counts([(pairs, weights)] + pending)
+                    pending = []
+            pairs, weights = _merge_counts([(pairs, weights)] + pending)
+        if not len(pairs):
+            return pd.DataFrame({'a': [], 'b': [], 'weight': []}, dtype=np.int64)
+        table = pd.DataFrame({'a': pairs // self.n_chars, 'b': pairs % self.n_chars, 'weight': weights})
+        return table.sort_values(['weight', 'a', 'b'], ascending=[False, True, True], ignore_index=True)
+
+    def neighbors(self, char, k=10, unit="row", chapters=None, query=None, locs=None, chars=None):
+        """某人物共现权重最高的k个人物：返回含 人物、共现次数 的表；chars与edges相同（该人物不在其中时为空表）"""
+        code = self.corpus.char_codes([char])
+        if not len(code):
+            return pd.DataFrame({'人物': [], '共现次数': []})
+        units, members = self._selected(*self.incidence(unit, chapters, query, locs), chars)
+        # 只需关联矩阵的一列：该人物所在的单元，再数这些单元里其他人物出现的次数
+        own = np.isin(units, units[members == code[0]])
+        others = members[own & (members != code[0])]
+        counts = np.bincount(others, minlength=self.n_chars)
+        top = np.flatnonzero(counts)
+        top = top[np.lexsort((top, -counts[top]))][:k]
+        return pd.DataFrame({'人物': self.corpus.characters.take(top).astype(str), '共现次数': counts[top]})
+
+
+def cooccurrence_index(corpus):
+    """语料的共现索引（按语料版本缓存，多会话共用）"""
+    return index_cache.get_or_build(
+        state_key(kind="cooccurrence", version=corpus.version), lambda: CooccurrenceIndex(corpus)
+    )
@@ -0,0 +1,568 @@
+"""关联网络图：由筛选条件生成pyvis图谱HTML（直接在内存生成，不落盘），并按筛选状态缓存"""
+import hashlib
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from pyvis.network import Network
+
+from 统计 import occurrences_in, char_loc_index
+from 共现 import cooccurrence_index
+from 缓存 import LRUCache, state_key
+
+# 图谱HTML缓存：筛选状态哈希 → HTML（None表示该筛选条件下没有数据），全部会话共用
+graph_cache = LRUCache(max_entries=64, max_bytes=64 * 1024 * 1024)
+# 节点坐标缓存：筛选状态+布局方式 → {节点ID: (x, y)}
+layout_cache = LRUCache(max_entries=128)
+
+# 布局方式：physics=浏览器实时模拟；force=服务器力导向布局；geo=地点按经纬度固定、其余节点力导向
+LAYOUTS = {
+    "浏览器实时模拟": "physics",
+    "服务器力导向布局（固定坐标）": "force",
+    "地理锚定布局（按经纬度）": "geo"
+}
+EDGE_LENGTH = 150.0  # 服务器布局的理想边长（像素）
+# 服务器布局的节点数上限：每轮迭代有几个n×n的float32临时数组（1000个节点每个约4MB），超出时改用浏览器实时模拟
+LAYOUT_NODE_LIMIT = 1000
+LOC_SHARE = 0.5  # 细节层次：地点节点最多占节点上限的比例
+# 低频人物的处理方式：直接隐藏 / 按地点合并成“其他人物”节点 / 按社区合并
+COLLAPSE_MODES = {
+    "不合并（直接隐藏）": None,
+    "按地点合并": "location",
+    "按社区合并": "community"
+}
+# 默认细节层次（页面控件的默认值，预渲染与基准测试也用它，三处一致）
+DEFAULT_LOD = {"max_nodes": 200, "max_edges": 500, "min_degree": 1, "collapse": None}
+
+
+def _seed_positions(node_ids, size):
+    """由节点ID哈希得到确定的初始坐标：同一节点每次起点相同，筛选变化时布局不会大幅跳动"""
+    digests = [hashlib.md5(str(nid).encode('utf-8')).digest() for nid in node_ids]
+    raw = np.array([[int.from_bytes(d[:4], 'little'), int.from_bytes(d[4:8], 'little')] for d in digests], dtype=float)
+    return (raw / 2**32 - 0.5).reshape(-1, 2) * size
+
+
+def force_layout(node_ids, edge_pairs, anchors=None, iterations=120, edge_length=EDGE_LENGTH):
+    """
+    Fruchterman-Reingold力导向布局（NumPy向量化，每轮一次性计算全部节点的斥力与全部边的引力）
+    anchors：{节点ID: (x, y)}，这些节点坐标固定不动；返回 {节点ID: (x, y)}
+    """
+    n = len(node_ids)
+    if n == 0:
+        return {}
+    index = {nid: i for i, nid in enumerate(node_ids)}
+    spread = edge_length * np.sqrt(n)  # 画布范围随节点数增长，节点多时不至于挤成一团
+    pos = _seed_positions(node_ids, spread)
+    src = np.array([index[a] for a, b in edge_pairs], dtype=int)
+    dst = np.array([index[b] for a, b in edge_pairs], dtype=int)
+    fixed = np.zeros(n, dtype=bool)
+    if anchors:
+        for nid, xy in anchors.items():
+            if nid in index:
+                pos[index[nid]] = xy
+                fixed[index[nid]] = True
+        # 非固定节点从相连固定节点的中心出发（加少量抖动），布局更快收敛也更稳定
+        neighbor_sum = np.zeros((n, 2))
+        neighbor_cnt = np.zeros(n)
+        for a, b in ((src, dst), (dst, src)):
+            mask = fixed[b] & ~fixed[a]
+            np.add.at(neighbor_sum, a[mask], pos[b[mask]])
+            np.add.at(neighbor_cnt, a[mask], 1)
+        has_anchor = neighbor_cnt > 0
+        pos[has_anchor] = neighbor_sum[has_anchor] / neighbor_cnt[has_anchor, None] + pos[has_anchor] * 0.1
+    pos = pos.astype(np.float32)
+    k2 = np.float32(edge_length ** 2)
+    gravity = np.float32(0.5)  # 中心引力：防止不相连的节点无限远离
+    center = pos[fixed].mean(axis=0) if fixed.any() else np.zeros(2, dtype=np.float32)
+    temperature = spread / 10
+    for _ in range(iterations):
+        # 斥力：所有节点两两之间（x、y分开计算，避免n×n×2的临时数组）
+        dx = pos[:, 0, None] - pos[None, :, 0]
+        dy = pos[:, 1, None] - pos[None, :, 1]
+        force = k2 / np.maximum(dx * dx + dy * dy, np.float32(1e-4))
+        np.fill_diagonal(force, 0)
+        disp = np.stack([(dx * force).sum(axis=1), (dy * force).sum(axis=1)], axis=1)
+        # 引力：仅相连节点之间
+        edge_delta = pos[src] - pos[dst]
+        pull = edge_delta * (np.linalg.norm(edge_delta, axis=1) / edge_length)[:, None]
+        np.add.at(disp, src, -pull)
+        np.add.at(disp, dst, pull)
+        disp -= (pos - center) * gravity
+        length = np.maximum(np.linalg.norm(disp, axis=1), 0.01)
+        disp *= (np.minimum(length, temperature) / length)[:, None]
+        disp[fixed] = 0
+        pos += disp
+        temperature *= 0.95
+    return {nid: (float(x), float(y)) for nid, (x, y) in zip(node_ids, pos)}
+
+
+def geo_anchors(gazetteer, prefix, edge_length=EDGE_LENGTH):
+    """按全部地点的经纬度范围等距投影到画布（范围取全书地点，筛选变化时地点位置不变）"""
+    coords = gazetteer.set_index('location')[['lon', 'lat']]
+    lat0 = np.radians(coords['lat'].mean())
+    x = (coords['lon'] - coords['lon'].mean()) * np.cos(lat0)
+    y = -(coords['lat'] - coords['lat'].mean())  # 画布y轴向下，北方在上
+    size = edge_length * 2 * np.sqrt(len(coords))  # 地点越多画布越大
+    scale = size / max(float(x.max() - x.min()), float(y.max() - y.min()), 1e-6)
+    return {f"{prefix}{loc}": (float(px * scale), float(py * scale)) for loc, px, py in zip(coords.index, x, y)}
+
+
+def apply_layout(net, layout, cache_key, anchors=None):
+    """
+    force/geo：在服务器计算坐标写入节点并关闭物理引擎；physics：保持浏览器实时模拟
+    节点数超过LAYOUT_NODE_LIMIT时不在服务器计算，同样保持浏览器实时模拟
+    """
+    if layout == "physics" or len(net.nodes) > LAYOUT_NODE_LIMIT:
+        return
+    node_ids = [node['id'] for node in net.nodes]
+    edge_pairs = [(edge['from'], edge['to']) for edge in net.edges]
+    positions = layout_cache.get_or_build(
+        cache_key, lambda: force_layout(node_ids, edge_pairs, anchors if layout == "geo" else None)
+    )
+    for node in net.nodes:
+        node['x'], node['y'] = positions[node['id']]
+        node['physics'] = False
+    net.toggle_physics(False)
+
+
+def _weighted_mode(edges, key):
+    """每个key取边权重之和最大的标签（权重相同取先出现的）"""
+    votes = edges.groupby([key, 'label'], sort=False)['weight'].sum().reset_index()
+    votes = votes.sort_values('weight', ascending=False, kind='stable')
+    return votes.drop_duplicates(key).set_index(key)['label'].sort_index()
+
+
+def bipartite_communities(edges, iterations=10):
+    """
+    人物×地点二部图上的加权标签传播（以地点为初始社区），返回 (人物→社区, 地点→社区)
+    社区名取其核心地点，如“南京”
+    """
+    loc_label = pd.Series(edges['loc'].unique(), index=edges['loc'].unique()).sort_index()
+    char_label = pd.Series(dtype=object)
+    for _ in range(iterations):
+        char_label = _weighted_mode(edges.assign(label=edges['loc'].map(loc_label).to_numpy()), 'char')
+        new_loc_label = _weighted_mode(edges.assign(label=edges['char'].map(char_label).to_numpy()), 'loc')
+        if new_loc_label.equals(loc_label):
+            break
+        loc_label = new_loc_label
+    return char_label, loc_label
+
+
+def _merge_lists(lists):
+    """合并多条边的章回/活动列表（去重，保持首次出现顺序）"""
+    return list(dict.fromkeys(chain.from_iterable(lists)))
+
+
+def level_of_detail(loc_freq, char_freq, edges, max_nodes=200, max_edges=500, min_degree=1, collapse=None):
+    """
+    关联图细节层次：控制节点、边的数量上限，数据再多浏览器端的节点/边数也有上限
+    1. 地点最多占节点上限的LOC_SHARE，超出时只保留频次最高的地点（剩下的预算留给人物）
+    2. 人物按出现次数排序，关联地点数 < min_degree 或超出节点预算的记为低频人物
+    3. 低频人物直接隐藏，或按地点/按社区合并成“其他人物”节点（members列出被合并的人物）；
+       “其他人物”节点也在节点上限之内，放不下时只保留合并人数多的
+    4. 边超过上限时按权重（共同出现行数）保留前max_edges条，再去掉没有边的人物、地点节点
+    """
+    loc_cap = max(int(max_nodes * LOC_SHARE), 1)
+    if len(loc_freq) > loc_cap:
+        top_locs = loc_freq.sort_values('freq', ascending=False, kind='stable')['node'].head(loc_cap)
+        loc_freq = loc_freq[loc_freq['node'].isin(top_locs)]
+        edges = edges[edges['loc'].isin(top_locs)]
+    degree = edges.groupby('char', sort=False).size()
+    char_freq = char_freq[char_freq['node'].isin(degree.index)]
+    char_slots = max(max_nodes - len(loc_freq), 0)  # 人物（含“其他人物”）可用的节点数
+    # “其他人物”节点预留：按地点合并最多每个地点一个，按社区合并每个社区一个（最多预留一半）
+    if collapse == "community":
+        char_community, loc_community = bipartite_communities(edges)
+        reserve = loc_community.nunique()
+    elif collapse == "location":
+        reserve = len(loc_freq)
+    else:
+        reserve = 0
+    reserve = min(reserve, char_slots // 2)
+    eligible = char_freq[char_freq['node'].map(degree) >= min_degree]
+    kept_chars = eligible.sort_values('freq', ascending=False, kind='stable')['node'].head(char_slots - reserve)
+    node_freq = char_freq[char_freq['node'].isin(kept_chars)].assign(members=None)
+    edge_parts = [edges[edges['char'].isin(kept_chars)]]
+    low_edges = edges[~edges['char'].isin(kept_chars)]
+    super_slots = char_slots - len(node_freq)
+    if collapse is not None and not low_edges.empty and super_slots > 0:
+        group = low_edges['loc'] if collapse == "location" else low_edges['char'].map(char_community)
+        low_edges = low_edges.assign(member=low_edges['char'], char="其他人物·" + group.astype(str))
+        super_nodes = low_edges.groupby('char', sort=False).agg(
+            freq=('weight', 'sum'),
+            members=('member', lambda x: list(dict.fromkeys(x)))
+        ).reset_index().rename(columns={'char': 'node'})
+        if len(super_nodes) > super_slots:
+            order = super_nodes['members'].str.len().sort_values(ascending=False, kind='stable').index
+            super_nodes = super_nodes.loc[order[:super_slots]].sort_index()
+            low_edges = low_edges[low_edges['char'].isin(super_nodes['node'])]
+        super_edges = low_edges.groupby(['char', 'loc'], sort=False).agg(
+            weight=('weight', 'sum'),
+            chapters=('chapters', lambda x: sorted(_merge_lists(x))),
+            acts=('acts', _merge_lists)
+        ).reset_index()
+        super_nodes['type'] = '人物'
+        node_freq = pd.concat([node_freq, super_nodes], ignore_index=True)
+        edge_parts.append(super_edges)
+    edges = pd.concat(edge_parts, ignore_index=True)
+    if len(edges) > max_edges:
+        edges = edges.loc[edges['weight'].sort_values(ascending=False, kind='stable').index[:max_edges]].sort_index()
+    node_freq = node_freq[node_freq['node'].isin(edges['char'])].reset_index(drop=True)
+    loc_freq = loc_freq[loc_freq['node'].isin(edges['loc'])].reset_index(drop=True)
+    return loc_freq, node_freq, edges.reset_index(drop=True)
+
+
+def char_loc_counts(corpus, locs, chars, chapters, query=None):
+    """
+    人物-地点关联的节点频次与边（图谱与导出共用），无数据时返回None
+    返回 (loc_freq, char_freq, edge_index)：地点/人物节点表（node、freq、type）与倒排索引得到的边表
+    """
+    # 第一步：筛选数据（按章回、地点、人物）
+    net_df = corpus.filters.rows(chapters=chapters, locs=locs, query=query)
+    # 处理人物数据：从人物出现表中取选中的人物（按人物编码筛选，不再逐行拆分字符串）
+    net_occ = occurrences_in(corpus, net_df, chars)
+    net_df = net_df[net_df.index.isin(net_occ['row_id'])]  # 过滤掉无选中人物的行
+    if net_df.empty:
+        return None
+    # 第二步：统计节点频次（用于动态调整节点大小）
+    # 1. 地点频次：按loc_total_freq求和（总出现次数）
+    net_df_unique = net_df.drop_duplicates(
+        subset=['chapter', 'location'],  # 关键：按“章回+地点”去重，替换“chapter”为你的章回列名（如“章回”）
+        keep='first'  # 保留每组第一行数据（同一章回+地点的行，loc_total_freq相同，保留哪行都一样）
+        )
+    loc_freq = net_df_unique.groupby('location', observed=True)['loc_total_freq'].sum().reset_index()
+    loc_freq.columns = ['node', 'freq']
+    loc_freq['node'] = loc_freq['node'].astype(str)
+    loc_freq['type'] = '地点'  # 标记节点类型
+    # 2. 人物频次：统计人物在筛选数据中的出现次数
+    char_freq = net_occ['character'].astype(str).value_counts().reset_index()
+    char_freq.columns = ['node', 'freq']
+    char_freq['type'] = '人物'  # 标记节点类型
+    # 人物-地点倒排索引：一次分组得到每条边的章回/活动
+    edge_index, _, _ = char_loc_index(net_occ, net_df)
+    return loc_freq, char_freq, edge_index
+
+
+def char_loc_graph_html(corpus, locs, chars, chapters, layout="physics", lod=None, query=None):
+    """
+    人物-地点关联图谱：按章回、地点、人物筛选后生成HTML，无数据时返回None
+    lod：细节层次参数（见level_of_detail），None表示显示全部节点和边；query：全文检索词（空表示不检索）
+    """
+    counts = char_loc_counts(corpus, locs, chars, chapters, query)
+    if counts is None:
+        return None
+    loc_freq, char_freq, edge_index = counts
+    char_freq['members'] = None
+    # 细节层次：按节点/边预算裁剪，低频人物隐藏或合并
+    if lod is not None:
+        loc_freq, char_freq, edge_index = level_of_detail(loc_freq, char_freq, edge_index, **lod)
+        if edge_index.empty:
+            return None
+    # 人物→地点、地点→人物（节点的悬浮提示用）
+    char_locs = edge_index.groupby('char', sort=False)['loc'].agg(list)
+    loc_chars = edge_index.groupby('loc', sort=False)['char'].agg(list)
+    # 节点大小映射：频次→大小（地点、人物统一按全部节点的频次范围缩放）
+    min_size = 20
+    max_size = 80
+    all_freq = pd.concat([loc_freq['freq'], char_freq['freq']])
+    for node_freq in (loc_freq, char_freq):
+        if all_freq.max() > all_freq.min():
+            node_freq['size'] = min_size + (max_size - min_size) * (node_freq['freq'] - all_freq.min()) / (all_freq.max() - all_freq.min())
+        else:
+            node_freq['size'] = 30
+
+    # 第三步：构建人物-地点双节点网络
+    # 初始化网络图（设置尺寸、背景色，关闭notebook模式）
+    net = Network(
+        directed=False,  # 无向图，双向关联）
+        notebook=False,
+        height="800px",  # 高
+        width="100%",    # 宽
+        bgcolor="#f8f9fa", 
+        font_color="#333333" 
+    )
+    # 1. 添加节点（先添加地点，再添加人物，避免重叠）
+    # 地点节点，标签显示“地点（频次）”
+    for loc, freq, size in zip(loc_freq['node'], loc_freq['freq'], loc_freq['size']):
+        # Hover提示：显示地点关联的所有人物
+        related_chars = loc_chars.get(loc, [])
+        title = f"地点：{loc}\n总出现次数：{freq}次\n关联人物：{', '.join(related_chars) if len(related_chars) > 0 else '无'}"
+        net.add_node(
+            n_id=f"loc_{loc}",  # 节点ID前缀：loc_，避免与人物ID冲突
+            label=f"{loc}\n（{freq}次）",  # 标签：地点+频次
+            size=size,
+            color="#5D2B09",  # 区分地点节点
+            title=title,  # Hover提示
+            font={"size": 12, "weight": "bold"}  # 字体加粗，提升辨识度
+        )
+    # 人物节点：标签显示“人物（频次）”
+    for char, freq, size, members in zip(char_freq['node'], char_freq['freq'], char_freq['size'], char_freq['members']):
+        # Hover提示：显示人物关联的所有地点
+        related_locs = char_locs.get(char, [])
+        title = f"人物：{char}\n关联地点数：{freq}个\n关联地点：{', '.join(related_locs) if len(related_locs) > 0 else '无'}"
+        if members is not None:
+            # 合并节点：列出被合并的低频人物（最多30个）
+            member_str = ', '.join(members[:30]) + ('等' if len(members) > 30 else '')
+            title = f"{char}（合并{len(members)}人）\n关联地点：{', '.join(related_locs)}\n包含人物：{member_str}"
+            net.add_node(
+                n_id=f"char_{char}",
+                label=f"{char}\n（{len(members)}人）",
+                size=size,
+                color="#C9C9C9",  # 灰色：区分合并节点
+                shape="box",
+                title=title,
+                font={"size": 12}
+            )
+            continue
+        net.add_node(
+            n_id=f"char_{char}",  # 节点ID前缀：char_，避免与地点ID冲突
+            label=f"{char}\n（{freq}个地点）",  # 标签：人物+关联地点数
+            size=size,
+            color="#DAC6B2",  # 区分人物节点
+            title=title,  # Hover提示
+            font={"size": 12, "weight": "bold"}
+        )
+    # 2. 添加边（人物-地点关联，倒排索引里每个人物-地点只有一行，不会重复）
+    for char, loc, edge_chapters, acts in zip(edge_index['char'], edge_index['loc'], edge_index['chapters'], edge_index['acts']):
+        # 边的hover提示：显示关联的章回和活动类型
+        edge_title = f"关联：{char} ↔ {loc}\n涉及章回：{', '.join(map(str, edge_chapters))}\n参与活动：{', '.join(acts)}"
+        net.add_edge(
+            f"char_{char}",
+            f"loc_{loc}",
+            color="#9AA0A6",  # 灰色边：不抢节点视觉焦点
+            width=2,  # 边宽度：适中，便于识别
+            title=edge_title,  # Hover提示：显示关联细节
+            smooth=True  # 平滑边：提升图谱美观度
+        )
+
+    # 第四步：优化图谱布局与交互
+    # 1. 设置物理引擎参数（避免节点过度重叠）
+    net.barnes_hut(
+        gravity=-3000,  # 引力：负值，让节点分散
+        central_gravity=0.3,  # 中心引力：适中，避免节点偏离中心
+        spring_length=200,  # 弹簧长度：控制节点间距
+        spring_strength=0.05,  # 弹簧强度：避免节点过近
+        damping=0.4  # 阻尼：控制节点运动速度，避免震荡
+    )
+    # 2. 服务器端布局：坐标按筛选状态缓存，浏览器不再做物理模拟
+    apply_layout(
+        net, layout,
+        state_key(
+            graph="char_loc", version=corpus.version, layout=layout, lod=lod,
+            locs=set(locs), chars=set(chars), chapters=chapters, query=query or ""
+        ),
+        anchors=geo_anchors(corpus.gazetteer, "loc_")
+    )
+    # 3. 显示关键调节按钮（仅保留物理参数、节点、边，避免冗余）
+    net.show_buttons(["physics", "nodes", "edges"])
+    # 4. 直接在内存生成HTML（不写临时文件）
+    return net.generate_html()
+
+
+def loc_act_counts(corpus, locs, acts, chapters, query=None):
+    """
+    地点-活动类型关联的节点与边（图谱与导出共用），无数据时返回None
+    返回 (loc_nodes, act_nodes, edges)：
+    loc_nodes：location、freq（总出现次数）、acts（关联活动“活动（n次）”）
+    act_nodes：activity_type、locations（关联地点列表）、loc_count
+    edges：location、activity_type、edge_freq、chapters（涉及章回列表）
+    """
+    # 应用筛选（地点、章回、活动类型）
+    net_df_loc_act = corpus.filters.rows(chapters=chapters, locs=locs, acts=acts, query=query)
+    net_df_loc_act_unique = net_df_loc_act.drop_duplicates(
+        subset=['chapter', 'location'],  # 按“章回+地点”去重，核心去重条件
+        keep='first'  # 保留每组第一行（同一章回+地点的loc_total_freq相同
+    )
+    if net_df_loc_act_unique.empty:
+        return None
+    #1.地点节点（大小=总出现次数）
+    loc_stats_act = net_df_loc_act_unique.groupby('location', observed=True)['loc_total_freq'].sum()
+    # 关联活动：每个地点各活动的次数，按次数降序拼成“活动（n次）”
+    loc_act_freq = net_df_loc_act_unique.groupby(['location', 'activity_type'], sort=False, observed=True).size()
+    loc_act_freq = loc_act_freq.reset_index(name='freq').sort_values('freq', ascending=False, kind='stable')
+    loc_act_str = (loc_act_freq['activity_type'].astype(str) + "（" + loc_act_freq['freq'].astype(str) + "次）").groupby(
+        loc_act_freq['location'].astype(str)).agg(", ".join)
+    loc_nodes = pd.DataFrame({'location': loc_stats_act.index.astype(str), 'freq': loc_stats_act.to_numpy()})
+    loc_nodes['acts'] = loc_nodes['location'].map(loc_act_str).fillna("")
+    #2. 活动类型节点
+    act_nodes = net_df_loc_act.groupby('activity_type', observed=True).agg({
+        'location': lambda x: list(set(x)),
+        'loc_total_freq': 'sum'
+    }).reset_index()
+    act_nodes = act_nodes.rename(columns={'location': 'locations'})
+    act_nodes['loc_count'] = act_nodes['locations'].apply(len)
+    #3.地点-活动边（频次=活动在该地点的loc_total_freq之和）
+    edges = net_df_loc_act.groupby(['location', 'activity_type'], observed=True)['loc_total_freq'].sum().reset_index()
+    edges.columns = ['location', 'activity_type', 'edge_freq']
+    # 每条边涉及的章回：一次分组得到，不再逐边筛选全表
+    edge_chapters = net_df_loc_act[['location', 'activity_type', 'chapter']].drop_duplicates().sort_values('chapter')
+    edge_chapters = edge_chapters.groupby(['location', 'activity_type'], observed=True)['chapter'].agg(list)
+    edges['chapters'] = [edge_chapters[key] for key in zip(edges['location'], edges['activity_type'])]
+    return loc_nodes, act_nodes, edges
+
+
+def loc_act_graph_html(corpus, locs, acts, chapters, layout="physics", query=None):
+    """地点-活动类型关联图谱：按章回、地点、活动类型（及全文检索词）筛选后生成HTML，无数据时返回None"""
+    counts = loc_act_counts(corpus, locs, acts, chapters, query)
+    if counts is None:
+        return None
+    loc_nodes, act_nodes, edges = counts
+    # 初始化地点-活动网络图
+    net_loc_act = Network(
+        directed=False, height="600px", width="100%",
+        bgcolor="#f8f9fa", font_color="#333333"
+    )
+    #1.添加地点节点（大小=总出现次数）
+    for loc, total_freq, act_str in zip(loc_nodes['location'], loc_nodes['freq'].tolist(), loc_nodes['acts']):
+        # Hover提示：地点+总次数+关联活动
+        net_loc_act.add_node(
+            f"loc_act_{loc}",  # 前缀区分，避免与人物-地点图谱ID冲突
+            label=f"{loc}\n（{total_freq}次）",
+            size=25 + total_freq * 2,  
+            color="#591F24", 
+            title=f"地点：{loc}\n总出现次数：{total_freq}次\n关联活动：{act_str}"
+        )  
+    #2. 添加活动类型节点
+    for act, locations, loc_count in zip(act_nodes['activity_type'], act_nodes['locations'], act_nodes['loc_count']):
+        # Hover提示：活动+关联地点数+具体地点
+        loc_str = ", ".join(locations)
+        net_loc_act.add_node(
+            f"act_loc_{act}", 
+            label=f"{act}\n（{loc_count}地）",
+            size=20 + loc_count * 3,  # 大小随关联地点数变化
+            color="#ebbcbf",  
+            title=f"活动类型：{act}\n关联地点数：{loc_count}个\n涉及地点：{loc_str}"
+        )
+    #3.添加地点-活动边（灰色，粗细=活动在该地点的频次）
+    max_freq = edges['edge_freq'].max()
+    for loc, act, edge_freq, related_chapters in zip(edges['location'], edges['activity_type'], edges['edge_freq'], edges['chapters']):
+        edge_width = 2 + (edge_freq / max_freq) * 6  # 粗细随频次变化
+        # Hover提示：地点-活动+频次+涉及章回
+        chapter_str = ", ".join(map(str, related_chapters))
+        net_loc_act.add_edge( #边
+            f"loc_act_{loc}", f"act_loc_{act}",
+            color="#7f8c8d", 
+            width=edge_width,
+            title=f"{loc} ↔ {act}\n频次：{edge_freq}次\n章回：{chapter_str}"
+        )
+
+    #4.布局与交互设置
+    net_loc_act.barnes_hut(gravity=-2500, spring_length=200)  
+    apply_layout(
+        net_loc_act, layout,
+        state_key(
+            graph="loc_act", version=corpus.version, layout=layout,
+            locs=set(locs), acts=set(acts), chapters=chapters, query=query or ""
+        ),
+        anchors=geo_anchors(corpus.gazetteer, "loc_act_")
+    )
+    net_loc_act.show_buttons(["physics", "nodes", "edges"]) 
+    return net_loc_act.generate_html()
+
+
+def char_char_graph_html(corpus, chars, chapters, unit="row", layout="physics", max_edges=300, query=None, locs=None):
+    """
+    人物共现图谱：人物之间按共同出现的 行/章回/地点 数加权（关联矩阵乘积，见共现.py），无数据时返回None
+    只画权重最高的max_edges条边，节点大小=加权度数；locs：只用这些地点的记录，None表示全部
+    """
+    edges = cooccurrence_index(corpus).edges(unit, chapters, query, chars=chars, locs=locs).head(max_edges)
+    if edges.empty:
+        return None
+    names = corpus.characters
+    a, b, weight = edges['a'].to_numpy(), edges['b'].to_numpy(), edges['weight'].to_numpy()
+    degree = pd.Series(np.r_[weight, weight]).groupby(np.r_[a, b]).sum()
+    net = Network(directed=False, height="700px", width="100%", bgcolor="#f8f9fa", font_color="#333333")
+    # 1. 人物节点（大小=与其他人物共现的总次数）
+    for code, total in zip(degree.index.tolist(), degree.tolist()):
+        net.add_node(
+            f"co_{names[code]}",
+            label=names[code],
+            size=15 + 35 * total / degree.max(),
+            color="#DAC6B2",
+            title=f"人物：{names[code]}\n共现总次数：{total}次",
+            font={"size": 12, "weight": "bold"}
+        )
+    # 2. 共现边（粗细=共现次数）
+    for x, y, w in zip(a.tolist(), b.tolist(), weight.tolist()):
+        net.add_edge(
+            f"co_{names[x]}", f"co_{names[y]}",
+            color="#9AA0A6",
+            width=1 + 7 * w / weight.max(),
+            title=f"{names[x]} ↔ {names[y]}\n共现：{w}次"
+        )
+    net.barnes_hut(gravity=-3000, spring_length=150)
+    apply_layout(
+        net, layout,
+        state_key(
+            graph="char_char", version=corpus.version, layout=layout, unit=unit, max_edges=max_edges,
+            chars=set(chars), chapters=chapters, query=query or "", locs=set(locs) if locs is not None else None
+        )
+    )
+    net.show_buttons(["physics", "nodes", "edges"])
+    return net.generate_html()
+
+
+def _prefixed(prefix, values):
+    """节点ID：前缀+名称（与图谱中的节点ID一致）"""
+    return prefix + pd.Series(values, dtype=object).astype(str)
+
+
+def char_loc_graph_frames(corpus, locs, chars, chapters, query=None):
+    """人物-地点关联的节点表、边表（导出用，不做细节层次裁剪），无数据时返回None"""
+    counts = char_loc_counts(corpus, locs, chars, chapters, query)
+    if counts is None:
+        return None
+    loc_freq, char_freq, edge_index = counts
+    nodes = pd.concat([
+        pd.DataFrame({'id': _prefixed("loc_", loc_freq['node']), 'label': loc_freq['node'], 'type': '地点', 'freq': loc_freq['freq']}),
+        pd.DataFrame({'id': _prefixed("char_", char_freq['node']), 'label': char_freq['node'], 'type': '人物', 'freq': char_freq['freq']})
+    ], ignore_index=True)
+    edges = pd.DataFrame({
+        'source': _prefixed("char_", edge_index['char']),
+        'target': _prefixed("loc_", edge_index['loc']),
+        'weight': edge_index['weight'],
+        'chapters': edge_index['chapters'],
+        'acts': edge_index['acts']
+    })
+    return nodes, edges
+
+
+def loc_act_graph_frames(corpus, locs, acts, chapters, query=None):
+    """地点-活动类型关联的节点表、边表（导出用），无数据时返回None"""
+    counts = loc_act_counts(corpus, locs, acts, chapters, query)
+    if counts is None:
+        return None
+    loc_nodes, act_nodes, edges = counts
+    nodes = pd.concat([
+        pd.DataFrame({
+            'id': _prefixed("loc_act_", loc_nodes['location']), 'label': loc_nodes['location'],
+            'type': '地点', 'freq': loc_nodes['freq'], 'acts': loc_nodes['acts']
+        }),
+        pd.DataFrame({
+            'id': _prefixed("act_loc_", act_nodes['activity_type']), 'label': act_nodes['activity_type'].astype(str),
+            'type': '活动类型', 'freq': act_nodes['loc_count']
+        })
+    ], ignore_index=True)
+    edges = pd.DataFrame({
+        'source': _prefixed("loc_act_", edges['location']),
+        'target': _prefixed("act_loc_", edges['activity_type']),
+        'weight': edges['edge_freq'],
+        'chapters': edges['chapters']
+    })
+    return nodes, edges
+
+
+def char_char_graph_frames(corpus, chars, chapters, unit="row", query=None, locs=None):
+    """人物共现的节点表、边表（导出用，不限边数），无数据时返回None"""
+    edges = cooccurrence_index(corpus).edges(unit, chapters, query, chars=chars, locs=locs)
+    if edges.empty:
+        return None
+    names = np.asarray(corpus.characters, dtype=object)
+    a, b, weight = edges['a'].to_numpy(), edges['b'].to_numpy(), edges['weight'].to_numpy()
+    degree = pd.Series(np.r_[weight, weight]).groupby(np.r_[a, b]).sum()
+    nodes = pd.DataFrame({
+        'id': _prefixed("co_", names[degree.index]), 'label': names[degree.index],
+        'type': '人物', 'freq': degree.to_numpy()
+    })
+    edges = pd.DataFrame({'source': _prefixed("co_", names[a]), 'target': _prefixed("co_", names[b]), 'weight': weight})
+    return nodes, edges
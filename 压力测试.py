@@ -0,0 +1,190 @@
+"""
+并发会话压力测试：用streamlit.testing.v1.AppTest无界面运行可视化.py，
+模拟N个会话同时按真实的控件操作序列使用页面（同一进程，共用模块级缓存，与一个streamlit服务进程相同）
+报告每种操作的p50/p95/p99延迟、吞吐量和进程峰值内存（RSS）
+
+用法：python 压力测试.py --sessions 8 --iterations 20 --json 压力测试结果.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import patch_config_options
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "可视化.py")
+# 页面选择控件的选项（与可视化.py中VIEWS的键一致）
+VIEW_MAP, VIEW_NETWORK, VIEW_STATS = "1. 地点坐标地图", "2. 双维度关联网络图", "3. 地点-人物-活动统计表"
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB）：Linux上ru_maxrss单位为KB，macOS上为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def shared_runtime():
+    """
+    AppTest每次重跑都把全局的Runtime._instance换成自己的模拟运行时、结束时清空，多个会话并发时会互相清掉
+    压测期间让Runtime.instance()固定返回同一个模拟运行时（各会话共用，与一个真实服务进程相同）
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    saved = Runtime.__dict__["instance"], Runtime.__dict__["exists"]
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    try:
+        with patch_config_options({"global.appTest": True}):  # 先设好，各会话进出时不会互相还原
+            yield runtime
+    finally:
+        Runtime.instance, Runtime.exists = saved
+
+
+def _subset(rng, options, low=1):
+    """随机选一部分选项（保持原顺序）"""
+    options = list(options)
+    k = rng.randint(min(low, len(options)), len(options))
+    chosen = set(rng.sample(options, k))
+    return [o for o in options if o in chosen]
+
+
+def _chapter_range(rng, slider):
+    """在滑块范围内随机取一个章回范围"""
+    start = rng.randint(slider.min, slider.max)
+    return start, rng.randint(start, slider.max)
+
+
+def _show(at, view):
+    """切换到某个页面（已在该页面时不操作）"""
+    radio = at.radio(key="active_view")
+    if radio.value != view:
+        radio.set_value(view)
+        return True
+    return False
+
+
+# 操作：名称 → (所在页面, 设置控件的函数)；每次操作设置一个控件后重跑
+INTERACTIONS = {
+    "tab1_location": (VIEW_MAP, lambda at, rng: at.multiselect(key="tab1_location").set_value(
+        _subset(rng, at.multiselect(key="tab1_location").options))),
+    "tab1_activity": (VIEW_MAP, lambda at, rng: at.multiselect(key="tab1_activity").set_value(
+        _subset(rng, at.multiselect(key="tab1_activity").options))),
+    "tab1_chapter_slider": (VIEW_MAP, lambda at, rng: at.slider(key="tab1_chapter_slider").set_value(
+        _chapter_range(rng, at.slider(key="tab1_chapter_slider")))),
+    "net_char_filter": (VIEW_NETWORK, lambda at, rng: at.multiselect(key="net_char_filter").set_value(
+        _subset(rng, at.multiselect(key="net_char_filter").options))),
+    "net_chapter_slider": (VIEW_NETWORK, lambda at, rng: at.slider(key="net_chapter_slider").set_value(
+        _chapter_range(rng, at.slider(key="net_chapter_slider")))),
+    "stat_dimension": (VIEW_STATS, lambda at, rng: at.radio(key="stat_dimension").set_value(
+        rng.choice(at.radio(key="stat_dimension").options)))
+}
+
+
+def run_session(session, iterations, seed, timeout, records, lock, start_delay=0.0):
+    """一个会话：首次加载后随机执行iterations次操作，每次记录 (操作, 耗时, 是否出错)"""
+    rng = random.Random(seed * 1000 + session)
+    time.sleep(start_delay)
+
+    def timed(name, at):
+        start = time.perf_counter()
+        error = None
+        try:
+            at.run(timeout=timeout)
+            if at.exception:
+                error = at.exception[0].value
+        except Exception as exc:  # 超时等也计入错误，不中断其他会话
+            error = repr(exc)
+        record = {"session": session, "interaction": name, "ms": (time.perf_counter() - start) * 1000, "error": error}
+        with lock:
+            records.append(record)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    timed("initial_load", at)
+    for _ in range(iterations):
+        name = rng.choice(list(INTERACTIONS))
+        view, apply = INTERACTIONS[name]
+        if _show(at, view):
+            timed("switch_view", at)
+        apply(at, rng)
+        timed(name, at)
+
+
+def run_load_test(sessions=4, iterations=10, seed=0, timeout=120, ramp=0.0):
+    """启动sessions个并发会话，返回 (每次操作的记录表, 总耗时秒)"""
+    os.chdir(APP_DIR)  # 可视化.py按相对路径读取数据文件
+    records, lock = [], threading.Lock()
+    start = time.perf_counter()
+    with shared_runtime(), ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, s, iterations, seed, timeout, records, lock, ramp * s / max(sessions, 1))
+            for s in range(sessions)
+        ]
+        for future in futures:
+            future.result()
+    return pd.DataFrame(records), time.perf_counter() - start
+
+
+def latency_table(records):
+    """每种操作的次数、错误数与p50/p95/p99延迟（毫秒）"""
+    rows = []
+    for name, group in records.groupby("interaction", sort=False):
+        ms = group["ms"].to_numpy()
+        rows.append({
+            "interaction": name, "n": len(ms), "errors": int(group["error"].notna().sum()),
+            "p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95), "p99_ms": np.percentile(ms, 99)
+        })
+    all_ms = records["ms"].to_numpy()
+    rows.append({
+        "interaction": "全部", "n": len(all_ms), "errors": int(records["error"].notna().sum()),
+        "p50_ms": np.percentile(all_ms, 50), "p95_ms": np.percentile(all_ms, 95), "p99_ms": np.percentile(all_ms, 99)
+    })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发会话压力测试（AppTest无界面运行可视化.py）")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--iterations", type=int, default=10, help="每个会话的操作次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="单次重跑超时（秒）")
+    parser.add_argument("--ramp", type=float, default=0.0, help="会话在多少秒内陆续启动（0表示同时启动）")
+    parser.add_argument("--json", default=None, help="结果另存为JSON")
+    args = parser.parse_args()
+    records, elapsed = run_load_test(args.sessions, args.iterations, args.seed, args.timeout, args.ramp)
+    table = latency_table(records)
+    throughput = len(records) / elapsed
+    with pd.option_context("display.width", 200):
+        print(table.round(1).to_string(index=False))
+    print(f"\n会话数：{args.sessions}  总重跑次数：{len(records)}  总耗时：{elapsed:.1f}秒")
+    print(f"吞吐量：{throughput:.2f}次重跑/秒  进程峰值内存：{peak_rss_mb():.0f} MB")
+    errors = records[records["error"].notna()]
+    if not errors.empty:
+        print(f"\n出错{len(errors)}次，例如：{errors['error'].iloc[0]}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "sessions": args.sessions, "iterations": args.iterations, "seed": args.seed,
+                "elapsed_s": elapsed, "throughput_per_s": throughput, "peak_rss_mb": peak_rss_mb(),
+                "latency": table.to_dict(orient="records")
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
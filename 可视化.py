@@ -1,58 +1,42 @@
+import os
+import time
+import uuid
+
 import pandas as pd
 import numpy as np
-import folium
 import streamlit as st
 from streamlit_folium import st_folium #anaconda environment里apply
-from pyvis.network import Network
 import streamlit.components.v1 as components
 
-# 读取数据
+from 数据加载 import load_corpus
+from 导入 import SCAN_SECONDS, load_ingested
+from 统计 import location_marker_table, occurrences_in, location_stat_table, character_stat_table, activity_stat_table
+from 关联图 import graph_cache, char_loc_graph_html, loc_act_graph_html, char_char_graph_html, LAYOUTS, COLLAPSE_MODES, DEFAULT_LOD
+from 关联图 import char_loc_graph_frames, loc_act_graph_frames, char_char_graph_frames, LAYOUT_NODE_LIMIT
+from 共现 import UNITS, cooccurrence_index
+from 缓存 import state_key
+from 全文检索 import query_terms, highlight, snippet
+from 地图 import ACT_COLOR_MAP, base_map, location_layer, location_markers
+from 轨迹 import character_trajectories, trajectory_layer
+from 回放 import playback_frames, playback_map, playback_network_html
+from 后台构建 import ViewBuilds
+from 导出 import FORMATS, export_file, table_writers, location_writers, graph_writers
+from 性能 import StageRecorder, enabled_by_default, summarize
+
+# 读取数据（按文件版本缓存：重跑、新会话直接复用整理好的数据，源文件变化后才重新解析）
 #df = pd.read_csv("/Users/ye/CHC 5904/my_streamlit_app/读取1.csv", encoding='utf-8')
-df = pd.read_csv("读取1.csv", encoding='utf-8') #在github里 streamlit里
-#改名字用于调用
-df.rename(columns={
-    '回次': 'chapter',
-    '地名': 'location',
-    '经度': 'lon',
-    '纬度': 'lat',
-    '城市出现次数': 'loc_total_freq',  # 地点总出现次数
-    '涉及主要人物': 'characters',
-    '活动类型': 'activity_type',
-    '情节': 'plot_summary'
-}, inplace=True)
-
-# 做关联图，生成节点唯一ID（
-# 1. 地点ID
-locations = df['location'].unique()
-loc_id_map = {loc: f'loc_{str(i+1).zfill(3)}' for i, loc in enumerate(locations)}
-df['location_id'] = df['location'].map(loc_id_map)
-
-# 2. 人物ID（拆分多人物）
-all_chars = []
-for chars in df['characters']:
-    all_chars.extend([c.strip() for c in chars.split('，')])
-all_chars = list(set(all_chars))  # 去重
-char_id_map = {char: f'char_{str(i+1).zfill(3)}' for i, char in enumerate(all_chars)}
-
-# 3. 活动类型ID
-activities = df['activity_type'].unique()
-act_id_map = {act: f'act_{str(i+1).zfill(3)}' for i, act in enumerate(activities)}
-df['activity_type_id'] = df['activity_type'].map(act_id_map)
-
-# 统计地点的章回分布（每个地点出现在哪些章回、每章出现次数）
-loc_chapter_stats = df.groupby('location').agg({
-    'chapter': lambda x: list(set(x)),  # 出现在的章回（去重）
-    'loc_total_freq': 'first'  # 地点总出现次数
-}).reset_index()
-loc_chapter_stats['chapter_count'] = loc_chapter_stats['chapter'].apply(len)  # 出现在的章回数
-# 统计每章出现次数（如：京师在第10回出现2次）
-loc_chapter_detail = df.groupby(['location', 'chapter']).size().reset_index(name='chapter_freq')
-loc_chapter_detail['chapter_freq_str'] = loc_chapter_detail.apply(
-    lambda x: f"第{x['chapter']}回：{x['chapter_freq']}次", axis=1
-)
-loc_chapter_detail = loc_chapter_detail.groupby('location')['chapter_freq_str'].apply(list).reset_index()
-# 合并统计结果
-loc_stats = loc_chapter_stats.merge(loc_chapter_detail, on='location')
+load_start = time.perf_counter()
+# 设了RULIN_DATA_DIR时从标注数据目录增量导入（可选RULIN_CORPUS只看其中一部语料），否则读默认的单个CSV
+# 数据目录只在启动时、每隔SCAN_SECONDS秒或点了侧边栏“重新扫描数据目录”时扫描，其余重跑直接用已加载的语料
+if os.environ.get("RULIN_DATA_DIR"):
+    corpus = load_ingested(
+        os.environ["RULIN_DATA_DIR"], corpus=os.environ.get("RULIN_CORPUS") or None,
+        refresh=st.session_state.get("rescan_data_dir", False)
+    )
+else:
+    corpus = load_corpus("读取1.csv") #在github里 streamlit里
+load_ms = (time.perf_counter() - load_start) * 1000
+df = corpus.df  # 已改名、已补地点ID/活动类型ID，多会话共用，只读
 # 标题
 def fix_title_to_top():
     with st.container():
@@ -61,14 +45,125 @@ def fix_title_to_top():
         st.markdown('以《儒林外史》第10-29章回为材料进行可视化分析地点与人物活动之间的关联，探究不同地点的人物活动特征')
         st.markdown('</div>', unsafe_allow_html=True)
 fix_title_to_top()
-#页面，设计三个页面显示地图、关联图、表格
-tab1, tab2, tab3 = st.tabs([
-    "1. 地点坐标地图", 
-    "2. 双维度关联网络图", 
-    "3. 地点-人物-活动统计表"
-])
+
+# 侧边栏控件默认值（统一放进session_state，控件不再传default/value）
+min_chapter = int(df['chapter'].min())
+max_chapter = int(df['chapter'].max())
+WIDGET_DEFAULTS = {
+    "tab1_location": list(df['location'].cat.categories),  # 默认全选
+    "tab1_activity": list(df['activity_type'].cat.categories),
+    "tab1_chapter_slider": (min_chapter, max_chapter),
+    "tab1_compact_map": True,
+    "tab1_viewport": False,
+    "tab1_trajectories": False,
+    "tab1_trajectory_top": 10,
+    "net_location_filter": list(df['location'].cat.categories),
+    "net_char_filter": sorted(corpus.characters),
+    "net_chapter_slider": (min_chapter, max_chapter),
+    "net_act_filter": list(df['activity_type'].cat.categories),
+    "net_layout": "浏览器实时模拟",
+    "net_node_budget": DEFAULT_LOD["max_nodes"],
+    "net_edge_budget": DEFAULT_LOD["max_edges"],
+    "net_min_degree": DEFAULT_LOD["min_degree"],
+    "net_collapse": next(label for label, mode in COLLAPSE_MODES.items() if mode == DEFAULT_LOD["collapse"]),
+    "net_cooc_unit": "同一条记录",
+    "net_cooc_edges": 300,
+    "net_cooc_focus": sorted(corpus.characters)[0],
+    "net_cooc_k": 10,
+    "stat_dimension": "按地点统计",
+    "stat_chapter_slider": (min_chapter, max_chapter),
+    "play_window": 1,
+    "play_interval": 800,
+    "search_query": "",
+    "debug_perf": enabled_by_default()
+}
+def keep_widget_state(defaults):
+    """初始化控件默认值；并在每次重跑时重新赋值，切换页面后未显示页面的筛选条件不会被清除"""
+    for key, value in defaults.items():
+        st.session_state[key] = st.session_state.get(key, value)
+keep_widget_state(WIDGET_DEFAULTS)
+def visible_locations(bounds):
+    """st_folium回传的地图视野 → 视野内的地点名（用空间索引查询）；没有视野信息时返回None"""
+    if not bounds or not bounds.get("_southWest") or not bounds.get("_northEast"):
+        return None
+    sw, ne = bounds["_southWest"], bounds["_northEast"]
+    return corpus.spatial.within(sw["lat"], sw["lng"], ne["lat"], ne["lng"]).tolist()
+def select_visible_locations():
+    """按钮回调：网络图的地点筛选改为地图视野内的地点"""
+    visible = set(st.session_state.get("map_visible_locations") or [])
+    st.session_state["net_location_filter"] = [loc for loc in df['location'].cat.categories if loc in visible]
+def render_location_detail(marker_table, clicked, act_color_map):
+    """地图下方的地点详情（服务端按最近一次点击的坐标查地点，代替每个标记内嵌的弹窗）"""
+    st.subheader("地点详情")
+    if not clicked:
+        st.info("点击地图上的地点查看详细信息")
+        return
+    # 点击坐标 → 最近的地点（点击的是标记本身，坐标与地点坐标一致）
+    dist = (marker_table['lat'] - clicked['lat']) ** 2 + (marker_table['lon'] - clicked['lng']) ** 2
+    if dist.min() > 1e-6:
+        st.info("所选地点不在当前筛选结果中，请重新点击地图上的地点")
+        return
+    row = marker_table.loc[dist.idxmin()]
+    terms = query_terms(st.session_state["search_query"])
+    if pd.isna(row['plot_summary']):
+        plot_content = "无相关情节"
+    elif terms:
+        plot_content = highlight(snippet(row['plot_summary'], terms, width=60), terms)  # 检索时显示命中处并标出检索词
+    else:
+        plot_content = row['plot_summary'][:120]
+    marker_color = act_color_map.get(row['main_act'], act_color_map["其他"])
+    st.markdown(f"<h4 style='color:{marker_color}'>{row['location']}</h4>", unsafe_allow_html=True)
+    st.markdown(f"""
+**1. 出现统计**
+
+总出现次数：{row['total_freq']}次  
+涉及章回：{row['chapter_count']}回（{', '.join(map(str, row['chapter_list']))}）  
+每章出现次数：{'；'.join(row['chapter_freq_str'])}
+
+**2. 核心信息**
+
+涉及主要人物：{row['characters'] if pd.notna(row['characters']) else "无"}  
+主要活动类型：{row['main_act']}
+
+**3. 情节示例**
+
+{plot_content}...
+""", unsafe_allow_html=bool(terms))
+    # 附近地点：空间索引按网格逐圈查找最近的地点
+    nearby = corpus.spatial.nearest(row['lat'], row['lon'], n=5, exclude=[row['location_id']])
+    if not nearby.empty:
+        st.markdown("**4. 附近地点**：" + "，".join(
+            f"{loc}（约{dist:.0f}公里）" for loc, dist in zip(nearby['location'], nearby['distance_km'])
+        ))
+def render_search_hits(rows, query, limit=50):
+    """检索命中的记录：章回、章節題目、地点与命中处的情节片段（检索词高亮）"""
+    terms = query_terms(query)
+    with st.expander(f"检索命中（{len(rows)}条记录）", expanded=True):
+        plots = corpus.plot_text(rows.index[:limit])
+        lines = [
+            f"**第{row.chapter}回** {highlight(str(row.章節題目), terms)} · {row.location}："
+            f"{highlight(snippet(plot, terms), terms) if isinstance(plot, str) else '无相关情节'}"
+            for row, plot in zip(rows.head(limit).itertuples(), plots.to_numpy())
+        ]
+        st.markdown("\n\n".join(lines), unsafe_allow_html=True)
+        if len(rows) > limit:
+            st.caption(f"只显示前{limit}条")
+def render_export(name, key, writers):
+    """导出当前筛选结果：选格式后分块写成文件（同一筛选状态复用已写好的文件），再提供下载"""
+    with st.expander(f"导出{name}"):
+        option = st.selectbox("导出格式", list(writers), key=f"export_{name}")
+        fmt, write = writers[option]
+        if st.button("生成导出文件", key=f"export_{name}_build"):
+            path = export_file(name, state_key(data=key, option=option), fmt, write)
+            extension, mime = FORMATS[fmt]
+            with open(path, "rb") as f:
+                st.download_button(
+                    f"下载（{os.path.getsize(path) / 1024:.0f} KB）", f, file_name=f"{name}.{extension}", mime=mime,
+                    on_click="ignore", key=f"export_{name}_download"  # 下载不触发重跑
+                )
 #tab1-地点坐标地图
-with tab1:
+def render_map_view():
+    """页面1：地点坐标地图"""
     st.title("《儒林外史》地点坐标地图")
     st.caption("侧边栏滑动筛选章回可查看不同章回地点地图")
     st.caption("筛选活动类型了解不同分布")
@@ -76,423 +171,312 @@ with tab1:
     #1.地点筛选（用rename后的location字段）
     selected_locs = st.sidebar.multiselect(
         "选择地点", 
-        df['location'].unique(), 
-        default=df['location'].unique(),  # 默认全选
-        key="tab1_location"   
+        df['location'].cat.categories, 
+        key="tab1_location"  # 默认全选
     )
     #2.活动类型筛选（用rename后的activity_type字段）
     selected_acts = st.sidebar.multiselect(
         "选择活动类型", 
-        df['activity_type'].unique(), 
-        default=df['activity_type'].unique(),
+        df['activity_type'].cat.categories, 
         key="tab1_activity" 
     )
     #3.章回范围筛选（用rename后的chapter字段，确保整数类型）
-    min_chapter = int(df['chapter'].min())
-    max_chapter = int(df['chapter'].max())
     selected_chapters = st.sidebar.slider(
         "选择章回范围", 
         min_value=min_chapter, 
         max_value=max_chapter, 
-        value=(min_chapter, max_chapter)
+        key="tab1_chapter_slider"
     )
-    # 应用筛选条件（基于rename后的字段）
-    filtered_df = df[
-        (df['location'].isin(selected_locs)) &
-        (df['activity_type'].isin(selected_acts)) &
-        (df['chapter'] >= selected_chapters[0]) &
-        (df['chapter'] <= selected_chapters[1])
-    ]
-    if filtered_df.empty:
-        st.warning("暂无符合条件的数据，请调整筛选条件！")
-    else:
+    #4.精简地图：一个GeoJSON图层+服务端详情面板，地图数据量小，平移缩放不触发重跑
+    compact_map = st.sidebar.toggle("精简地图模式", key="tab1_compact_map")
+    #5.视野筛选：回传地图视野，统计表只列视野内的地点（开启后平移缩放会重跑）
+    viewport_filter = st.sidebar.toggle("统计表只含地图视野内的地点", key="tab1_viewport")
+    #6.人物行迹：按章回连接人物出现的地点，地图上画出总距离最长的几位人物
+    show_trajectories = st.sidebar.toggle("显示人物行迹", key="tab1_trajectories")
+    trajectory_top = st.sidebar.slider(
+        "行迹人物数（按总距离）", min_value=1, max_value=30, key="tab1_trajectory_top", disabled=not show_trajectories
+    )
+    search_query = st.session_state["search_query"]
+    view = perf.view
+
+    def build():
+        """筛选、汇总、生成地图（工作线程）"""
+        # 应用筛选条件（各维度掩码按选择缓存，只重算变化的维度）
+        with perf.stage("filter", rows_in=len(df), view=view) as rec:
+            filtered_df = corpus.filters.rows(
+                chapters=selected_chapters, locs=selected_locs, acts=selected_acts, query=search_query
+            )
+            rec["rows_out"] = len(filtered_df)
+        if filtered_df.empty:
+            return None
         # 1. 创建地图-调整经纬度和大小 更方便直接显示相关地点
-        m = folium.Map(location=[36.0000, 117.0000], zoom_start=5, tiles="CartoDB positron")
-        # 2. 为每个地点添加标记（核心：用rename后的loc_total_freq字段统计）
-        for loc in filtered_df['location'].unique():
-            # 提取当前地点的筛选数据（含多活动标签行）
-            loc_filtered_data = filtered_df[filtered_df['location'] == loc]
-            loc_base_data = loc_filtered_data.iloc[0]  # 取1行获取经纬度/情节等基础信息
-            # 统计（基于loc_total_freq）
-            #1.总出现次数：按“地点+章回”去重后，求和loc_total_freq
-            #同一地点同一章回只保留1行（同一章回同一地点不同活动分不同行，防止重复统计次数）
-            loc_chapter_unique = loc_filtered_data[['chapter', 'loc_total_freq']].drop_duplicates()
-            total_freq = int(loc_chapter_unique['loc_total_freq'].sum())  # 求和得到总出现次数
-            #2.每章出现次数：读取去重后的loc_total_freq
-            chapter_freq_dict = dict(zip(loc_chapter_unique['chapter'], loc_chapter_unique['loc_total_freq']))
-            chapter_freq_str = [f"第{int(chap)}回：{int(freq)}次" for chap, freq in chapter_freq_dict.items()]
-            #3.涉及章回统计-去除重复统计版
-            chapter_list = sorted(loc_chapter_unique['chapter'].tolist())  # 排序章回
-            chapter_count = len(chapter_list)  # 涉及章回数
-            #活动类型统计
-            act_freq_dict = loc_filtered_data['activity_type'].value_counts().to_dict()
-            act_freq_str = "\n".join([f"{act}：{int(freq)}次" for act, freq in act_freq_dict.items()])
-            main_act = max(act_freq_dict, key=act_freq_dict.get) if act_freq_dict else "其他"
-            
-            # 活动类型颜色映射
-            act_color_map = {
-                 "官场任职": "#2232E6",  
-                 "家庭生活": "#EEAA9C",  
-                 "科举备考": "#3498DB",  
-                 "商业经济": "#8E44AD",  
-                 "社交往来": "#F39C12",  
-                 "特殊变故": "#E74C3C",  
-                 "文人雅集": "#b9dec9",  
-                 "其他": "#95A5A6"     
-            }
-            marker_color = act_color_map.get(main_act, act_color_map["其他"])
-            # 先计算筛选后所有地点的最大总次数 大小按比例
-            max_total_freq = max([
-                int(filtered_df[filtered_df['location'] == temp_loc][['chapter', 'loc_total_freq']].drop_duplicates()['loc_total_freq'].sum())
-                for temp_loc in filtered_df['location'].unique()
-            ])
-            marker_radius = 12 + (total_freq / max_total_freq) * 20
-            #处理空值（避免情节为NaN报错）
-            plot_content = loc_base_data['plot_summary'][:120] if pd.notna(loc_base_data['plot_summary']) else "无相关情节"
-            #添加地图标记（hover+弹窗）
-            folium.CircleMarker(
-                location=[loc_base_data['lat'], loc_base_data['lon']],  # folium要求：纬度在前，经度在后
-                radius=marker_radius,
-                color=marker_color,
-                fill=True,
-                fill_color=marker_color,
-                fill_opacity=0.8,
-                # Hover提示：核心信息快速预览
-                tooltip=f"""
-                    <b>{loc}</b><br>
-                    总出现次数：{total_freq}次<br>
-                    涉及章回：{chapter_count}回<br>
-                    主要活动：{main_act}
-                """,
-                # 点击弹窗：详细信息（含人物、情节）
-                popup=folium.Popup(f"""
-                    <div style='width:280px; font-size:14px; line-height:1.5'>
-                        <h4 style='margin:0; color:{marker_color}; font-size:16px'>{loc}</h4>
-                        <p><b>1. 出现统计</b></p>
-                        <p>总出现次数：{total_freq}次</p>
-                        <p>涉及章回：{chapter_count}回（{', '.join(map(str, map(int, chapter_list)))}）</p>
-                        <p>每章出现次数：<br>{'<br>'.join(chapter_freq_str)}</p>
-                        <p><b>2. 核心信息</b></p>
-                        <p>涉及主要人物：{loc_base_data['characters'] if pd.notna(loc_base_data['characters']) else "无"}</p>
-                        <p>主要活动类型：{main_act}</p>
-                        <p><b>3. 情节示例</b></p>
-                        <p>{plot_content}...</p>
-                    </div>
-                """, max_width=300)
-            ).add_to(m)
-        # 3. 渲染地图（占满页面宽度，高度700px适配屏幕）
-        st_folium(m, width="100%", height=700)
-        st.caption("悬浮可见小视窗，了解该城市总出现次数，涉及章回数目，主要活动类型")
-        st.caption("点击地点可查看详细信息,了解具体章回，主要人物，情节示例")
-        # 4. 筛选结果统计表格（基于loc_total_freq字段，与地图逻辑一致）
-        st.subheader("筛选结果统计（地点维度）")
-        result_stats = []
-        for loc in filtered_df['location'].unique():
-            loc_data = filtered_df[filtered_df['location'] == loc]
-            # 按“章回+loc_total_freq”去重后统计
-            loc_chapter_unique = loc_data[['chapter', 'loc_total_freq']].drop_duplicates()
-            total_freq = int(loc_chapter_unique['loc_total_freq'].sum())
-            chapter_list = sorted(loc_chapter_unique['chapter'].tolist())
-            chapter_str = f"{len(chapter_list)}回（{', '.join(map(str, map(int, chapter_list)))}）"
-            # 活动类型统计
-            act_freq = loc_data['activity_type'].value_counts().to_dict()
-            act_str = "\n".join([f"{act}：{int(freq)}次" for act, freq in act_freq.items()])
-            # 主要人物
-            main_char = loc_data['characters'].value_counts().index[0] if len(loc_data['characters'].dropna()) > 0 else "无"
-            result_stats.append({
-                '序号': len(result_stats) + 1,
-                '地点': loc,
-                '总出现次数': total_freq,
-                '涉及章回': chapter_str,
-                '主要涉及人物': main_char,
-                '活动类型统计': act_str
-            })
+        m = base_map(corpus)  # 初始视野按地点索引的整体范围自动定位
+        # 2. 按地点一次分组汇总（地图标记与下方统计表共用同一张表）
+        # 活动类型全选时，地点总次数直接由章回前缀和得到
+        with perf.stage("aggregate", rows_in=len(filtered_df), view=view) as rec:
+            all_acts = set(selected_acts) >= set(df['activity_type'].cat.categories)
+            total_freq = corpus.filters.location_freq(selected_chapters, dedup='distinct', query=search_query) if all_acts else None
+            marker_table = location_marker_table(corpus, filtered_df, total_freq=total_freq)
+            rec["rows_out"] = len(marker_table)
+        # 3. 为每个地点添加标记（核心：用rename后的loc_total_freq字段统计）
+        with perf.stage("folium_markers", rows_in=len(marker_table), view=view):
+            if compact_map:
+                location_layer(marker_table, ACT_COLOR_MAP).add_to(m)
+            else:
+                location_markers(marker_table, ACT_COLOR_MAP).add_to(m)
+        # 人物行迹（按筛选状态缓存，全部人物的各段距离一次向量化计算）
+        trajectories = None
+        if show_trajectories:
+            with perf.stage("trajectories", rows_in=len(filtered_df), view=view) as rec:
+                trajectories = character_trajectories(
+                    corpus, chapters=selected_chapters, locs=selected_locs, acts=selected_acts, query=search_query
+                )
+                trajectory_layer(trajectories, top=trajectory_top).add_to(m)
+                rec["rows_out"] = len(trajectories.legs)
+        return filtered_df, m, marker_table, trajectories
+
+    def show(result):
+        """显示地图、地点详情与统计表（脚本线程）"""
+        if result is None:
+            st.warning("暂无符合条件的数据，请调整筛选条件！")
+            return
+        filtered_df, m, marker_table, trajectories = result
+        act_color_map = ACT_COLOR_MAP  # 活动类型颜色映射
+        # 4. 渲染地图（占满页面宽度，高度700px适配屏幕）
+        # 只回传需要的对象：精简模式要最近一次点击，开启视野筛选时要地图范围；
+        # 完整模式弹窗在浏览器里打开，不开视野筛选时什么都不回传（平移缩放不重跑）
+        returned_objects = (["last_object_clicked"] if compact_map else []) + (["bounds"] if viewport_filter else [])
+        with perf.stage("st_folium", rows_in=len(marker_table), view=view) as rec:
+            if perf.enabled:
+                rec["bytes"] = len(m.get_root().render().encode("utf-8"))  # 只在调试时多渲染一次，统计发送的HTML大小
+            map_state = st_folium(m, width="100%", height=700, key="tab1_map", returned_objects=returned_objects)
+        visible = visible_locations((map_state or {}).get("bounds")) if viewport_filter else None
+        if visible is not None:
+            st.session_state["map_visible_locations"] = visible  # 网络图页可一键改用这些地点
+        if compact_map:
+            st.caption("悬浮可见地点名与总出现次数，点击地点在下方查看具体章回，主要人物，情节示例")
+            render_location_detail(marker_table, (map_state or {}).get("last_object_clicked"), act_color_map)
+        else:
+            st.caption("悬浮可见小视窗，了解该城市总出现次数，涉及章回数目，主要活动类型")
+            st.caption("点击地点可查看详细信息,了解具体章回，主要人物，情节示例")
+        # 5. 筛选结果统计表格（直接用上面的地点汇总表，与地图逻辑一致）
+        if visible is not None:
+            marker_table = marker_table[marker_table['location'].isin(visible)].reset_index(drop=True)
+            st.subheader("筛选结果统计（地点维度，地图视野内）")
+        else:
+            st.subheader("筛选结果统计（地点维度）")
+        result_df = pd.DataFrame({
+            '序号': range(1, len(marker_table) + 1),
+            '地点': marker_table['location'],
+            '总出现次数': marker_table['total_freq'],
+            '涉及章回': marker_table['chapter_count'].astype(str) + "回（" + marker_table['chapter_list'].apply(lambda x: ', '.join(map(str, x))) + "）",
+            '主要涉及人物': marker_table['main_char'],
+            '活动类型统计': marker_table['act_freq_str']
+        })
         # 显示表格（序号设为索引，提升可读性）
-        result_df = pd.DataFrame(result_stats)
         st.dataframe(result_df.set_index('序号'), height=400)
+        render_export("地点汇总", state_key(
+            data="locations", version=corpus.version, locs=set(selected_locs), acts=set(selected_acts),
+            chapters=selected_chapters, query=search_query, visible=None if visible is None else set(visible)
+        ), location_writers(marker_table.drop(columns='radius')))
+        # 6. 人物行迹统计（点击列名可排序）
+        if trajectories is not None:
+            st.subheader("人物行迹统计")
+            st.dataframe(
+                trajectories.summary.drop(columns='char_id'), height=400, hide_index=True,
+                column_config={
+                    "总距离（公里）": st.column_config.NumberColumn(format="%.1f"),
+                    "最远一段（公里）": st.column_config.NumberColumn(format="%.1f")
+                }
+            )
+            st.caption("移动=按章回顺序相邻两次出现在不同地点；距离为两地经纬度之间的球面距离")
+        if query_terms(search_query):
+            render_search_hits(filtered_df, search_query)
+
+    # 地图对象可变，不在会话间共用（不传key）
+    builds.add("地点坐标地图", build, show)
 
 # tab2-关联网络图，人物-地点，活动-地点
-with tab2:
+def render_network_view():
+    """页面2：双维度关联网络图"""
     st.title("《儒林外史》双维度关联网络图")
     st.caption("侧边栏滑动筛选章回可查看不同章回关联内容")
     st.markdown("### 一、人物-地点关联图谱")
     st.sidebar.header("网络图筛选条件")  # 侧边栏筛选：控制网络图数据范围
-    # 1. 地点筛选（支持多选，默认全选）
+    # 1. 地点筛选（支持多选，默认全选；可一键改为地点地图当前视野内的地点）
+    st.sidebar.button(
+        "只选地图视野内的地点", on_click=select_visible_locations,
+        disabled=not st.session_state.get("map_visible_locations"),
+        help="先在地点坐标地图页开启“统计表只含地图视野内的地点”，再移动或缩放地图"
+    )
     selected_locs_net = st.sidebar.multiselect(
         "选择关联地点（默认全选）",
-        df['location'].unique(),
-        default=df['location'].unique(),
+        df['location'].cat.categories,
         key="net_location_filter"
     )
     # 2. 人物筛选（支持多选，默认全选，处理空值）
-    all_chars = list(set([
-        c.strip() for chars in df['characters'].dropna() 
-        for c in chars.split('，') if c.strip()
-    ]))
     selected_chars_net = st.sidebar.multiselect(
         "选择关联人物（默认全选）",
-        sorted(all_chars),  # 按字母排序，便于选择
-        default=sorted(all_chars),
+        sorted(corpus.characters),  # 按字母排序，便于选择
         key="net_char_filter"
     )
     # 3. 章回范围筛选（控制数据时间范围）
     selected_chapters_net = st.sidebar.slider(
         "选择章回范围",
-        min_value=int(df['chapter'].min()),
-        max_value=int(df['chapter'].max()),
-        value=(int(df['chapter'].min()), int(df['chapter'].max())),
+        min_value=min_chapter,
+        max_value=max_chapter,
         key="net_chapter_slider"
     )
-    # 第一步：筛选数据（按章回、地点、人物）
-    net_df = df[
-        (df['chapter'] >= selected_chapters_net[0]) &
-        (df['chapter'] <= selected_chapters_net[1]) &
-        (df['location'].isin(selected_locs_net))
-    ].copy()
-    # 处理人物数据：拆分多人物，仅保留选中的人物
-    def filter_chars(char_str):
-        """拆分人物字符串，保留选中的人物"""
-        if pd.isna(char_str):
-            return []
-        return [c.strip() for c in char_str.split('，') if c.strip() in selected_chars_net]
-    net_df['filtered_chars'] = net_df['characters'].apply(filter_chars)
-    # 过滤掉无选中人物的行
-    net_df = net_df[net_df['filtered_chars'].apply(len) > 0].reset_index(drop=True)
-    
-    if net_df.empty:
-        st.warning("暂无符合条件的人物-地点关联数据，请调整筛选条件！")
-    else:
-        # 第二步：统计节点频次（用于动态调整节点大小）
-        # 1. 地点频次：按loc_total_freq求和（总出现次数）
-        net_df_unique = net_df.drop_duplicates(
-            subset=['chapter', 'location'],  # 关键：按“章回+地点”去重，替换“chapter”为你的章回列名（如“章回”）
-            keep='first'  # 保留每组第一行数据（同一章回+地点的行，loc_total_freq相同，保留哪行都一样）
-            )
-        loc_freq = net_df_unique.groupby('location')['loc_total_freq'].sum().reset_index()
-        loc_freq.columns = ['node', 'freq']
-        loc_freq['type'] = '地点'  # 标记节点类型
-        # 2. 人物频次：统计人物在筛选数据中的出现次数
-        char_freq_list = []
-        for _, row in net_df.iterrows():
-            for char in row['filtered_chars']:
-                char_freq_list.append({'char': char, 'loc': row['location']})
-        char_freq_df = pd.DataFrame(char_freq_list)
-        char_freq = char_freq_df['char'].value_counts().reset_index()
-        char_freq.columns = ['node', 'freq']
-        char_freq['type'] = '人物'  # 标记节点类型
-        # 合并节点频次，统一处理
-        node_freq = pd.concat([loc_freq, char_freq], ignore_index=True)
-        # 节点大小映射：频次→大小
-        min_size = 20
-        max_size = 80
-        node_freq['size'] = node_freq['freq'].apply(
-            lambda x: min_size + (max_size - min_size) * (x - node_freq['freq'].min()) / 
-            (node_freq['freq'].max() - node_freq['freq'].min()) if node_freq['freq'].max() > node_freq['freq'].min() else 30
-        )
-    
-        # 第三步：构建人物-地点双节点网络
-        from pyvis.network import Network
-        # 初始化网络图（设置尺寸、背景色，关闭notebook模式）
-        net = Network(
-            directed=False,  # 无向图，双向关联）
-            notebook=False,
-            height="800px",  # 高
-            width="100%",    # 宽
-            bgcolor="#f8f9fa", 
-            font_color="#333333" 
-        )
-        # 1. 添加节点（先添加地点，再添加人物，避免重叠）
-        # 地点节点，标签显示“地点（频次）”
-        for _, row in loc_freq.iterrows():
-            loc = row['node']
-            freq = row['freq']
-            size = node_freq[node_freq['node'] == loc]['size'].iloc[0]
-            # Hover提示：显示地点关联的所有人物
-            related_chars = char_freq_df[char_freq_df['loc'] == loc]['char'].unique()
-            title = f"地点：{loc}\n总出现次数：{freq}次\n关联人物：{', '.join(related_chars) if len(related_chars) > 0 else '无'}"
-            net.add_node(
-                n_id=f"loc_{loc}",  # 节点ID前缀：loc_，避免与人物ID冲突
-                label=f"{loc}\n（{freq}次）",  # 标签：地点+频次
-                size=size,
-                color="#5D2B09",  # 区分地点节点
-                title=title,  # Hover提示
-                font={"size": 12, "weight": "bold"}  # 字体加粗，提升辨识度
-            )
-        # 人物节点：标签显示“人物（频次）”
-        for _, row in char_freq.iterrows():
-            char = row['node']
-            freq = row['freq']
-            size = node_freq[node_freq['node'] == char]['size'].iloc[0]
-            # Hover提示：显示人物关联的所有地点
-            related_locs = char_freq_df[char_freq_df['char'] == char]['loc'].unique()
-            title = f"人物：{char}\n关联地点数：{freq}个\n关联地点：{', '.join(related_locs) if len(related_locs) > 0 else '无'}"
-            net.add_node(
-                n_id=f"char_{char}",  # 节点ID前缀：char_，避免与地点ID冲突
-                label=f"{char}\n（{freq}个地点）",  # 标签：人物+关联地点数
-                size=size,
-                color="#DAC6B2",  # 区分人物节点
-                title=title,  # Hover提示
-                font={"size": 12, "weight": "bold"}
+    search_query = st.session_state["search_query"]  # 侧边栏的全文检索词
+    # 4. 布局方式：节点多时选服务器布局，坐标固定、关闭浏览器物理模拟，打开即可交互
+    net_layout = LAYOUTS[st.sidebar.radio(
+        "图谱布局", list(LAYOUTS), key="net_layout",
+        help=f"图中节点超过{LAYOUT_NODE_LIMIT}个时不在服务器计算布局，改用浏览器实时模拟"
+    )]
+    # 5. 细节层次：节点/边数量上限，低频人物隐藏或合并（全书数据下图谱依然清晰、加载快）
+    with st.sidebar.expander("人物-地点图谱细节层次"):
+        net_lod = {
+            "max_nodes": st.slider("节点上限", min_value=20, max_value=1000, step=10, key="net_node_budget"),
+            "max_edges": st.slider("边上限", min_value=20, max_value=3000, step=10, key="net_edge_budget"),
+            "min_degree": st.slider("人物最少关联地点数", min_value=1, max_value=10, key="net_min_degree"),
+            "collapse": COLLAPSE_MODES[st.selectbox("低频人物", list(COLLAPSE_MODES), key="net_collapse")]
+        }
+    # 人物-地点图谱：按筛选状态缓存HTML（只改统计表等其他条件时不重新生成）
+    char_loc_key = state_key(
+        graph="char_loc", version=corpus.version, layout=net_layout, lod=net_lod,
+        locs=set(selected_locs_net), chars=set(selected_chars_net), chapters=selected_chapters_net, query=search_query
+    )
+    view = perf.view
+
+    def build_char_loc():
+        with perf.stage("pyvis_char_loc", view=view) as rec:
+            html = graph_cache.get_or_build(
+                char_loc_key,
+                lambda: char_loc_graph_html(
+                    corpus, selected_locs_net, selected_chars_net, selected_chapters_net, net_layout, net_lod, query=search_query
+                )
             )
-        # 2. 添加边（人物-地点关联，仅添加一次，避免重复）
-        edge_set = set()  # 用集合去重，避免同一人物-地点添加多条边
-        for _, row in net_df.iterrows():
-            loc = row['location']
-            loc_node_id = f"loc_{loc}"
-            for char in row['filtered_chars']:
-                char_node_id = f"char_{char}"
-                edge_key = tuple(sorted([char_node_id, loc_node_id]))
-                if edge_key not in edge_set:
-                    edge_set.add(edge_key)
-                    # 边的hover提示：显示关联的章回和活动类型
-                    chapters = sorted(net_df[(net_df['location'] == loc) & (net_df['filtered_chars'].apply(lambda x: char in x))]['chapter'].unique())
-                    acts = net_df[(net_df['location'] == loc) & (net_df['filtered_chars'].apply(lambda x: char in x))]['activity_type'].unique()
-                    edge_title = f"关联：{char} ↔ {loc}\n涉及章回：{', '.join(map(str, chapters))}\n参与活动：{', '.join(acts)}"
-                    net.add_edge(
-                        char_node_id,
-                        loc_node_id,
-                        color="#9AA0A6",  # 灰色边：不抢节点视觉焦点
-                        width=2,  # 边宽度：适中，便于识别
-                        title=edge_title,  # Hover提示：显示关联细节
-                        smooth=True  # 平滑边：提升图谱美观度
-                    )
-        
-        # 第四步：优化图谱布局与交互
-        # 1. 设置物理引擎参数（避免节点过度重叠）
-        net.barnes_hut(
-            gravity=-3000,  # 引力：负值，让节点分散
-            central_gravity=0.3,  # 中心引力：适中，避免节点偏离中心
-            spring_length=200,  # 弹簧长度：控制节点间距
-            spring_strength=0.05,  # 弹簧强度：避免节点过近
-            damping=0.4  # 阻尼：控制节点运动速度，避免震荡
-        )
-        # 2. 显示关键调节按钮（仅保留物理参数、节点、边，避免冗余）
-        net.show_buttons(["physics", "nodes", "edges"])
-        # 3. 保存图谱到本地-适配macOS路径，避免/mnt问题）
-        # 替换保存和显示逻辑：用Streamlit临时目录+components.v1.html加载
-        import streamlit.components.v1 as components
-        import os
-        import tempfile
-        # 保存图谱到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as f:
-           net.save_graph(f.name)
-           temp_path = f.name
-        #import os
-        #net_save_path = "/Users/ye/Desktop/人物地点双节点网络图.html"
-        #net.save_graph(net_save_path)
-        # 4. 在Streamlit中显示图谱【用iframe嵌入，支持交互
+            rec["bytes"] = len(html.encode("utf-8")) if html else 0
+        return html
+
+    def show_char_loc(html_content):
+        if html_content is None:
+            st.warning("暂无符合条件的人物-地点关联数据，请调整筛选条件！")
+            return
+        # 在Streamlit中显示图谱【用iframe嵌入，支持交互
         st.subheader("人物-地点关联图谱")
-        with open(temp_path, "r", encoding="utf-8") as f:
-             html_content = f.read()
-             components.html(html_content, width="100%", height=800, scrolling=True)
+        components.html(html_content, width="100%", height=800, scrolling=True)
         st.caption("深色=地点（大小=总出现次数）" \
-                   "浅色=人物角色" 
+                   "浅色=人物角色" \
+                   "灰色方框=合并的低频人物"
         )
+        render_export("人物-地点关联", state_key(
+            data="char_loc", version=corpus.version, locs=set(selected_locs_net), chars=set(selected_chars_net),
+            chapters=selected_chapters_net, query=search_query
+        ), graph_writers(lambda: char_loc_graph_frames(
+            corpus, selected_locs_net, selected_chars_net, selected_chapters_net, query=search_query
+        )))
+    builds.add("人物-地点关联图谱", build_char_loc, show_char_loc, key=char_loc_key)
 
     st.markdown("### 二、地点-活动类型关联图谱")  
     # 1. 地点-活动关联图谱
     selected_acts_net = st.sidebar.multiselect(
         "选择关联活动类型（默认全选）",
-        df['activity_type'].unique(),
-        default=df['activity_type'].unique(),
+        df['activity_type'].cat.categories,
         key="net_act_filter"
     )
-    # 应用筛选（地点、章回、活动类型）
-    net_df_loc_act = df[
-        (df['chapter'] >= selected_chapters_net[0]) &
-        (df['chapter'] <= selected_chapters_net[1]) &
-        (df['location'].isin(selected_locs_net)) &
-        (df['activity_type'].isin(selected_acts_net))
-    ].copy()
-    
-    net_df_loc_act_unique = net_df_loc_act.drop_duplicates(
-    subset=['chapter', 'location'],  # 按“章回+地点”去重，核心去重条件
-    keep='first'  # 保留每组第一行（同一章回+地点的loc_total_freq相同
+    # 2. 地点-活动图谱：生成与显示（同样按筛选状态缓存）
+    loc_act_key = state_key(
+        graph="loc_act", version=corpus.version, layout=net_layout,
+        locs=set(selected_locs_net), acts=set(selected_acts_net), chapters=selected_chapters_net, query=search_query
     )
-    # 2. 地点-活动图谱：生成与显示
-    if net_df_loc_act_unique.empty:
-        st.warning("暂无符合条件的地点-活动关联数据，请调整筛选条件！")
-    else:
-        # 初始化地点-活动网络图
-        net_loc_act = Network(
-            directed=False, height="600px", width="100%",
-            bgcolor="#f8f9fa", font_color="#333333"
-        )
-        #1.添加地点节点（大小=总出现次数）
-        loc_stats_act = net_df_loc_act_unique.groupby('location').agg({
-            'loc_total_freq': 'sum',
-            'activity_type': lambda x: x.value_counts().to_dict()
-        }).reset_index()
-        for _, row in loc_stats_act.iterrows():
-            loc = row['node'] if 'node' in row else row['location']  # 兼容字段名
-            loc = row['location']
-            total_freq = row['loc_total_freq']
-            # Hover提示：地点+总次数+关联活动
-            act_str = ", ".join([f"{act}（{freq}次）" for act, freq in row['activity_type'].items()])
-            net_loc_act.add_node(
-                f"loc_act_{loc}",  # 前缀区分，避免与人物-地点图谱ID冲突
-                label=f"{loc}\n（{total_freq}次）",
-                size=25 + total_freq * 2,  
-                color="#591F24", 
-                title=f"地点：{loc}\n总出现次数：{total_freq}次\n关联活动：{act_str}"
-            )  
-        #2. 添加活动类型节点
-        act_stats_loc = net_df_loc_act.groupby('activity_type').agg({
-            'location': lambda x: list(set(x)),
-            'loc_total_freq': 'sum'
-        }).reset_index()
-        act_stats_loc['related_loc_count'] = act_stats_loc['location'].apply(len)
-        for _, row in act_stats_loc.iterrows():
-            act = row['activity_type']
-            loc_count = row['related_loc_count']
-            # Hover提示：活动+关联地点数+具体地点
-            loc_str = ", ".join(row['location'])
-            net_loc_act.add_node(
-                f"act_loc_{act}", 
-                label=f"{act}\n（{loc_count}地）",
-                size=20 + loc_count * 3,  # 大小随关联地点数变化
-                color="#ebbcbf",  
-                title=f"活动类型：{act}\n关联地点数：{loc_count}个\n涉及地点：{loc_str}"
-            )
-        #3.添加地点-活动边（灰色，粗细=活动在该地点的频次）
-        edge_stats_loc = net_df_loc_act.groupby(['location', 'activity_type'])['loc_total_freq'].sum().reset_index()
-        edge_stats_loc.columns = ['location', 'activity_type', 'edge_freq']
-        for _, row in edge_stats_loc.iterrows():
-            loc_id = f"loc_act_{row['location']}"
-            act_id = f"act_loc_{row['activity_type']}"
-            edge_width = 2 + (row['edge_freq'] / edge_stats_loc['edge_freq'].max()) * 6  # 粗细随频次变化
-            # Hover提示：地点-活动+频次+涉及章回
-            related_chapters = sorted(net_df_loc_act[
-                (net_df_loc_act['location'] == row['location']) & 
-                (net_df_loc_act['activity_type'] == row['activity_type'])
-            ]['chapter'].unique())
-            chapter_str = ", ".join(map(str, related_chapters))
-            net_loc_act.add_edge( #边
-                loc_id, act_id,
-                color="#7f8c8d", 
-                width=edge_width,
-                title=f"{row['location']} ↔ {row['activity_type']}\n频次：{row['edge_freq']}次\n章回：{chapter_str}"
+
+    def build_loc_act():
+        with perf.stage("pyvis_loc_act", view=view) as rec:
+            html = graph_cache.get_or_build(
+                loc_act_key,
+                lambda: loc_act_graph_html(
+                    corpus, selected_locs_net, selected_acts_net, selected_chapters_net, net_layout, query=search_query
+                )
             )
-        
-        #4.布局与交互设置
-        net_loc_act.barnes_hut(gravity=-2500, spring_length=200)  
-        net_loc_act.show_buttons(["physics", "nodes", "edges"]) 
-        
+            rec["bytes"] = len(html.encode("utf-8")) if html else 0
+        return html
+
+    def show_loc_act(loc_act_html):
+        if loc_act_html is None:
+            st.warning("暂无符合条件的地点-活动关联数据，请调整筛选条件！")
+            return
         st.subheader("活动-地点关联图谱")
-        #5.临时文件加载,避免本地路径问题
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as f:
-            net_loc_act.save_graph(f.name)
-            with open(f.name, "r", encoding="utf-8") as f_html:
-                components.html(f_html.read(), width="100%", height=600, scrolling=False)
+        components.html(loc_act_html, width="100%", height=600, scrolling=False)
         
         #6.图谱说明
         st.caption("深色=地点（大小=总出现次数）" \
         "浅色=活动类型（大小=关联地点数）" \
         "边粗细=活动在该地点频次")
+        render_export("地点-活动类型关联", state_key(
+            data="loc_act", version=corpus.version, locs=set(selected_locs_net), acts=set(selected_acts_net),
+            chapters=selected_chapters_net, query=search_query
+        ), graph_writers(lambda: loc_act_graph_frames(
+            corpus, selected_locs_net, selected_acts_net, selected_chapters_net, query=search_query
+        )))
+    builds.add("地点-活动类型关联图谱", build_loc_act, show_loc_act, key=loc_act_key)
+
+    st.markdown("### 三、人物共现图谱")
+    # 共现权重的单元与边数上限（地点、人物、章回范围、检索词沿用上面的筛选条件）
+    with st.sidebar.expander("人物共现图谱"):
+        cooc_unit = UNITS[st.radio("共现权重：共同出现在", list(UNITS), key="net_cooc_unit")]
+        cooc_edges = st.slider("边上限", min_value=20, max_value=2000, step=10, key="net_cooc_edges")
+    char_char_key = state_key(
+        graph="char_char", version=corpus.version, layout=net_layout, unit=cooc_unit, max_edges=cooc_edges,
+        locs=set(selected_locs_net), chars=set(selected_chars_net), chapters=selected_chapters_net, query=search_query
+    )
+
+    def build_char_char():
+        with perf.stage("pyvis_char_char", view=view) as rec:
+            html = graph_cache.get_or_build(
+                char_char_key,
+                lambda: char_char_graph_html(
+                    corpus, selected_chars_net, selected_chapters_net, cooc_unit, net_layout, cooc_edges,
+                    query=search_query, locs=selected_locs_net
+                )
+            )
+            rec["bytes"] = len(html.encode("utf-8")) if html else 0
+        return html
+
+    def show_char_char(char_char_html):
+        if char_char_html is None:
+            st.warning("暂无符合条件的人物共现数据，请调整筛选条件！")
+            return
+        st.subheader("人物共现图谱")
+        components.html(char_char_html, width="100%", height=700, scrolling=False)
+        st.caption("节点=人物（大小=共现总次数）" \
+                   "边粗细=两人共现次数")
+        render_export("人物共现", state_key(
+            data="char_char", version=corpus.version, unit=cooc_unit, locs=set(selected_locs_net),
+            chars=set(selected_chars_net), chapters=selected_chapters_net, query=search_query
+        ), graph_writers(lambda: char_char_graph_frames(
+            corpus, selected_chars_net, selected_chapters_net, cooc_unit, query=search_query, locs=selected_locs_net
+        )))
+    builds.add("人物共现图谱", build_char_char, show_char_char, key=char_char_key)
+    # 某人物共现最多的k个人物（只取关联矩阵中该人物的一列计算）
+    focus_col, k_col = st.columns([3, 1])
+    focus_char = focus_col.selectbox("查看与某人物共现最多的人物", sorted(corpus.characters), key="net_cooc_focus")
+    cooc_k = k_col.number_input("人数", min_value=1, max_value=50, key="net_cooc_k")
+    builds.add(
+        "共现人物表",
+        lambda: cooccurrence_index(corpus).neighbors(
+            focus_char, cooc_k, cooc_unit, selected_chapters_net, search_query,
+            locs=selected_locs_net, chars=selected_chars_net
+        ),
+        lambda neighbors: st.dataframe(neighbors, hide_index=True)
+    )
+    cache_stats = graph_cache.stats()
+    st.sidebar.caption(f"关联图缓存：命中{cache_stats['hits']}次，未命中{cache_stats['misses']}次，已缓存{cache_stats['entries']}张图")
 
 # tab3-各种统计表
 
-with tab3:
+def render_stat_view():
+    """页面3：地点-人物-活动统计表"""
     st.title("《儒林外史》地点-人物-活动类型统计表")
     st.caption("侧边栏选择可查看地点、人物、活动分别统计表格")
     #表格呈现 把原表格拆开重新统计
@@ -500,118 +484,142 @@ with tab3:
     # 1. 统计维度选择
     stat_dimension = st.sidebar.radio(
         "选择统计维度",
-        ["按地点统计", "按人物统计", "按活动类型统计"]
+        ["按地点统计", "按人物统计", "按活动类型统计"],
+        key="stat_dimension"
     )
     # 2. 章回范围筛选，来自df['chapter']的最值）
-    min_chapter = int(df['chapter'].min())
-    max_chapter = int(df['chapter'].max())
     selected_chapters_stat = st.sidebar.slider(
         "选择章回范围", 
         min_value=min_chapter, 
         max_value=max_chapter, 
-        value=(min_chapter, max_chapter),
         key="stat_chapter_slider" 
     )
     
-    # 应用章回筛选，先筛选指定章回范围的数据
-    stat_df = df[
-        (df['chapter'] >= selected_chapters_stat[0]) &
-        (df['chapter'] <= selected_chapters_stat[1])
-    ].copy()  # 复制数据，避免修改原df
-    
-    # 按不同维度生成统计表格
-    if stat_dimension == "按地点统计":
-        st.subheader(f"按地点统计（第{selected_chapters_stat[0]}-{selected_chapters_stat[1]}回）")
-        # 1. 按“地点+章回”分组，取每组首次出现的行（确保每个地点在每个章回只统计1次）
-        loc_chapter_first = stat_df.groupby(['location', 'chapter']).first().reset_index()
-        # 2. 按“地点”分组，求和首次出现的loc_total_freq（得到每个地点的总次数）
-        loc_total_freq = loc_chapter_first.groupby('location')['loc_total_freq'].sum().reset_index()
-        loc_total_freq.columns = ['location', '总出现次数']  # 重命名列，便于后续合并
-        
-        # 3. 统计其他维度信息（涉及章回、关联人物、活动类型等）
-        loc_other_stats = stat_df.groupby('location').agg({
-            # 涉及章回：去重后格式化为“X回（回次1, 回次2）”
-            'chapter': lambda x: f"{len(set(x))}回（{', '.join(map(str, sorted(set(x))))}）",
-            # 关联人物：拆分多人物、去重后合并
-            'characters': lambda x: ', '.join(list(set([
-                c.strip() for chars in x.dropna() for c in chars.split('，')
-            ])) or ['无']),
-            # 活动类型：统计每种活动的次数，生成字典
-            'activity_type': lambda x: x.value_counts().to_dict(),
-            # 情节示例，取第一条非空情节的前100字
-            'plot_summary': lambda x: next((p[:100] + "..." for p in x.dropna() if p), "无相关情节")
-        }).reset_index()
-        
-        # 4. 合并“总出现次数”与其他统计信息
-        loc_stat_table = loc_other_stats.merge(loc_total_freq, on='location', how='left')
-        loc_stat_table['活动类型统计'] = loc_stat_table['activity_type'].apply(
-            lambda x: ", ".join([f"{act}（{freq}次）" for act, freq in x.items()])
-        )
-        display_table = loc_stat_table[
-            ['location', '总出现次数', 'chapter', 'characters', '活动类型统计', 'plot_summary']
-        ].rename(columns={
-            'location': '地点',
-            'chapter': '涉及章回',
-            'characters': '关联人物',
-            'plot_summary': '情节示例'
-        })
-        st.dataframe(display_table, height=400)
+    search_query = st.session_state["search_query"]
+    view = perf.view
+    # 按不同维度生成统计表格（在整数编码上分组，只对最后的小表格式化字符串）
+    stat_tables = {
+        "按地点统计": lambda rows, occ: location_stat_table(corpus, rows, occ, selected_chapters_stat, query=search_query),
+        "按人物统计": lambda rows, occ: character_stat_table(corpus, occ),
+        "按活动类型统计": lambda rows, occ: activity_stat_table(corpus, rows, occ, selected_chapters_stat, query=search_query)
+    }
 
-    elif stat_dimension == "按人物统计":
-        # 按人物统计
-        st.subheader(f"按人物统计（第{selected_chapters_stat[0]}-{selected_chapters_stat[1]}回）")
-        char_stat_list = []
-        for _, row in stat_df.iterrows():
-            # 拆分多人物（处理“，”分隔的情况）
-            chars = [c.strip() for c in row['characters'].split('，')] if pd.notna(row['characters']) else []
-            for char in chars:
-                char_stat_list.append({
-                    '人物': char,
-                    '涉及章回': row['chapter'],
-                    '关联地点': row['location'],
-                    '参与活动': row['activity_type'],
-                    '情节': row['plot_summary'][:60] + "..." if pd.notna(row['plot_summary']) else "无相关情节"
-                })
-        # 去重后按人物分组统计
-        char_stat_df = pd.DataFrame(char_stat_list).drop_duplicates()
-        char_stat_table = char_stat_df.groupby('人物').agg({
-            '涉及章回': lambda x: f"{len(set(x))}回（{', '.join(map(str, sorted(set(x))))}）",
-            '关联地点': lambda x: ', '.join(list(set(x)) or ['无']),
-            '参与活动': lambda x: x.value_counts().to_dict(),
-            '情节': lambda x: x.iloc[0] if not x.empty else "无相关情节"
-        }).reset_index()
-        # 格式化活动统计
-        char_stat_table['参与活动统计'] = char_stat_table['参与活动'].apply(
-            lambda x: ", ".join([f"{act}（{freq}次）" for act, freq in x.items()])
-        )
-        # 显示表格
-        display_table = char_stat_table[['人物', '涉及章回', '关联地点', '参与活动统计', '情节']]
-        st.dataframe(display_table, height=400)
-    
-    else:  # 按活动类型统计
-        st.subheader(f"按活动类型统计（第{selected_chapters_stat[0]}-{selected_chapters_stat[1]}回）")
-        # 统计活动类型的基础信息
-        act_stat_table = stat_df.groupby('activity_type').agg({
-            'chapter': lambda x: f"{len(set(x))}回（{', '.join(map(str, sorted(set(x))))}）",
-            'location': lambda x: ', '.join(list(set(x)) or ['无']),
-            'characters': lambda x: ', '.join(list(set([
-                c.strip() for chars in x.dropna() for c in chars.split('，')
-            ])) or ['无']),
-            'plot_summary': lambda x: next((p[:80] + "..." for p in x.dropna() if p), "无相关情节")
-        }).reset_index()
-        # 计算活动总次数（去重“活动类型+章回”，避免重复统计）
-        act_freq = stat_df.groupby(['activity_type', 'chapter']).first().reset_index()
-        act_freq = act_freq['activity_type'].value_counts().reset_index()
-        act_freq.columns = ['activity_type', '活动总次数']
-        # 合并总次数与基础信息
-        act_stat_table = act_stat_table.merge(act_freq, on='activity_type', how='left')
-        display_table = act_stat_table[
-            ['activity_type', '活动总次数', 'chapter', 'location', 'characters', 'plot_summary']
-        ].rename(columns={
-            'activity_type': '活动类型',
-            'chapter': '涉及章回',
-            'location': '关联地点',
-            'characters': '关联人物',
-            'plot_summary': '情节示例'
-        })
+    def build():
+        # 应用章回筛选，先筛选指定章回范围的数据
+        with perf.stage("filter", rows_in=len(df), view=view) as rec:
+            stat_df = corpus.filters.rows(chapters=selected_chapters_stat, query=search_query)  # 只读使用，不再整表复制
+            stat_occ = occurrences_in(corpus, stat_df)  # 章回范围内的人物出现记录
+            rec["rows_out"] = len(stat_df)
+        with perf.stage("stat_table", rows_in=len(stat_df), view=view) as rec:
+            display_table = stat_tables[stat_dimension](stat_df, stat_occ)
+            rec["rows_out"] = len(display_table)
+        return display_table
+
+    st.subheader(f"{stat_dimension}（第{selected_chapters_stat[0]}-{selected_chapters_stat[1]}回）")
+    table_key = state_key(table=stat_dimension, version=corpus.version, chapters=selected_chapters_stat, query=search_query)
+
+    def show(display_table):
         st.dataframe(display_table, height=400)
+        render_export(stat_dimension, table_key, table_writers(display_table))
+    builds.add(stat_dimension, build, show, key=table_key)
+
+# tab4-章回回放
+def render_playback_view():
+    """页面4：逐章回播放地点、人物-地点关联的出现与消失（全部帧一次生成，播放在浏览器端进行）"""
+    st.title("《儒林外史》章回回放")
+    st.caption("点击播放或拖动进度条，按章回查看地点与人物-地点关联的变化")
+    st.sidebar.header("回放设置")
+    play_window = st.sidebar.slider(
+        "显示最近几回", min_value=1, max_value=5, key="play_window",
+        help="每一帧显示当前章回及之前若干回出现过的地点和关联"
+    )
+    play_interval = st.sidebar.slider("每帧间隔（毫秒）", min_value=200, max_value=3000, step=100, key="play_interval")
+    search_query = st.session_state["search_query"]
+    with perf.stage("playback_frames", rows_in=len(df)) as rec:
+        frames = playback_frames(corpus, window=play_window, query=search_query)
+        rec["rows_out"] = len(frames.chapters)
+    if frames.locations.empty:
+        st.warning("暂无符合条件的数据，请调整检索词！")
+        return
+    # 地图、图谱的HTML和帧数据一起缓存（播放、拖动进度条都不触发重跑）
+    view = perf.view
+    map_key = state_key(graph="playback_map", version=corpus.version, window=play_window, interval=play_interval, query=search_query)
+    net_key = state_key(graph="playback_net", version=corpus.version, window=play_window, interval=play_interval, query=search_query)
+
+    def build_map():
+        with perf.stage("playback_map", view=view) as rec:
+            html = graph_cache.get_or_build(map_key, lambda: playback_map(frames, play_interval).get_root().render())
+            rec["bytes"] = len(html.encode("utf-8")) if html else 0
+        return html
+
+    def build_network():
+        with perf.stage("playback_network", view=view) as rec:
+            html = graph_cache.get_or_build(net_key, lambda: playback_network_html(corpus, frames, play_interval))
+            rec["bytes"] = len(html.encode("utf-8")) if html else 0
+        return html
+
+    st.markdown("### 一、地点回放")
+    builds.add("地点回放", build_map, lambda html: components.html(html, width="100%", height=600), key=map_key)
+    st.markdown("### 二、人物-地点关联回放")
+    def show_network(html):
+        if html is None:
+            st.warning("符合条件的记录里没有人物，无法回放人物-地点关联，请调整检索词！")
+            return
+        components.html(html, width="100%", height=720)
+
+    builds.add("人物-地点关联回放", build_network, show_network, key=net_key)
+    st.caption(f"共{len(frames.chapters)}帧（第{int(frames.chapters[0])}-{int(frames.chapters[-1])}回）" \
+               "深色=地点 浅色=人物")
+
+
+#页面，设计四个页面显示地图、关联图、表格、章回回放
+VIEWS = {
+    "1. 地点坐标地图": render_map_view,
+    "2. 双维度关联网络图": render_network_view,
+    "3. 地点-人物-活动统计表": render_stat_view,
+    "4. 章回回放": render_playback_view
+}
+st.sidebar.header("页面")
+# 全文检索：三个页面共用的筛选条件（倒排索引查询，只保留情节或章節題目命中的行）
+st.sidebar.text_input(
+    "全文检索（情节、章節題目）", key="search_query",
+    placeholder="如：西湖 詩會（空格分隔，需同时包含）"
+)
+if os.environ.get("RULIN_DATA_DIR"):
+    st.sidebar.button(
+        "重新扫描数据目录", key="rescan_data_dir",
+        help=f"新增或修改了标注CSV后点此立即导入（否则每{SCAN_SECONDS:g}秒最多扫描一次）"
+    )
+# 只计算当前页面：改动某个控件时只重跑当前页面（标签页模式下三个页面每次都要全部计算）
+view_isolation = st.sidebar.toggle("只计算当前页面（更快）", value=True, key="view_isolation")
+# 性能调试：记录各阶段耗时、行数、HTML字节数（写入JSON行日志，侧边栏显示本会话p50/p95）
+perf = StageRecorder(
+    enabled=st.sidebar.toggle("记录各阶段耗时（调试）", key="debug_perf"),
+    session_id=st.session_state.setdefault("perf_session", uuid.uuid4().hex[:12]),
+    history=st.session_state.setdefault("perf_history", {})
+)
+perf.add({"stage": "load_corpus", "ms": load_ms, "rows_in": None, "rows_out": len(df), "bytes": None})
+# 各页面只放占位、提交生成任务，最后统一等待：哪个视图先生成完先显示哪个
+builds = ViewBuilds()
+try:
+    if view_isolation:
+        active_view = st.sidebar.radio("选择页面", list(VIEWS), key="active_view")
+        perf.view = active_view
+        VIEWS[active_view]()
+    else:
+        for tab, (view_name, render_view) in zip(st.tabs(list(VIEWS)), VIEWS.items()):
+            with tab:
+                perf.view = view_name
+                render_view()
+    builds.render()
+finally:
+    # 有新的重跑请求时render()抛出重跑异常：已完成阶段的记录照样写入日志
+    last_run = perf.last_run()
+    perf.flush()
+if perf.enabled:
+    with st.sidebar.expander("性能调试", expanded=True):
+        st.caption("本次重跑")
+        st.dataframe(last_run, hide_index=True)
+        st.caption("本会话各页面各阶段（按p95降序）")
+        st.dataframe(summarize(st.session_state["perf_history"]), hide_index=True)
+        st.caption(f"JSON行日志：{perf.log_path}")
@@ -0,0 +1,125 @@
+"""
+一次重跑中互不依赖的视图（地图、各张关联图、统计表）放到线程池里同时生成：
+每个视图先放一个占位，哪个先生成完就先显示哪个（首屏时间≈最快的视图，而不是各视图耗时之和）
+有新的控件状态到来（重跑）时，本次重跑里还没开始的生成任务直接取消
+
+线程池是进程级的、所有会话共用（BUILD_WORKERS个线程）；为了不让一个会话的大量重计算占满全部线程、
+其他会话的视图都排在它后面，每个会话的一次重跑最多同时占用SESSION_BUILDS个任务，其余任务在本会话里排队，
+前面的完成一个再提交一个。BUILD_WORKERS ≥ 2×SESSION_BUILDS 时至少两个会话可同时生成视图
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import streamlit as st
+
+# 线程数（默认4，所有会话共用；可用环境变量RULIN_BUILD_WORKERS调整）
+BUILD_WORKERS = int(os.environ.get("RULIN_BUILD_WORKERS", 4))
+# 每个会话同时提交到线程池的生成任务数上限（默认2；可用环境变量RULIN_SESSION_BUILDS调整）
+SESSION_BUILDS = int(os.environ.get("RULIN_SESSION_BUILDS", 2))
+POLL_SECONDS = 0.1  # 等待期间检查重跑请求的间隔
+
+# 多个会话共用一个线程池（与各模块的缓存一样放在模块级）
+executor = ThreadPoolExecutor(max_workers=BUILD_WORKERS, thread_name_prefix="view-build")
+# 排队或运行中的任务：键 → [future, 等待它的批次数]
+_inflight = {}
+_inflight_lock = threading.RLock()  # 可重入：任务取消时的完成回调在持锁的线程里同步执行
+
+
+def _forget(key, future):
+    """任务结束（完成、出错或取消）后不再共用"""
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        if entry is not None and entry[0] is future:
+            del _inflight[key]
+
+
+def _acquire(key, build):
+    """提交生成任务；同一键的任务还在排队或运行时直接共用（多个会话、连续几次重跑不重复生成）"""
+    if key is None:
+        return executor.submit(build)
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        if entry is None:
+            entry = _inflight[key] = [executor.submit(build), 0]
+            entry[0].add_done_callback(lambda future: _forget(key, future))
+        entry[1] += 1
+        return entry[0]
+
+
+def _release(key, future):
+    """批次不再等待该任务：没有其他批次在等、且还没开始运行时取消（已在运行的任务照常完成，结果进各视图的缓存）"""
+    if key is None:
+        future.cancel()
+        return
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        if entry is None or entry[0] is not future:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            future.cancel()
+
+
+def yield_to_rerun():
+    """
+    重跑请求的检查点：streamlit不会打断正在运行的脚本线程，只在脚本调用st.*或访问session_state时
+    检查有无新的重跑/停止请求（SafeSessionState每次被访问都会回调ScriptRunner的执行控制检查），有则就地抛出重跑异常
+    render()等待期间不调用st.*，所以每轮等待后访问一次session_state，让新的控件状态能及时打断等待
+    """
+    return "active_view" in st.session_state  # 读哪个键都可以，只为触发检查，结果不用
+
+
+class ViewBuilds:
+    """
+    一次重跑的视图生成批次
+    add()：在当前位置放一个占位并提交生成任务；render()：按完成先后把结果显示到各自的占位里
+    build在工作线程里运行，只能做计算（不能调用st.*）；show在脚本线程里运行，负责显示
+    同时提交到线程池的任务不超过max_running个，其余按添加顺序排队（见模块说明）
+    """
+
+    def __init__(self, max_running=SESSION_BUILDS):
+        self.jobs = []  # [键, build, future（排队中为None）, 占位, show]
+        self.max_running = max_running
+
+    def add(self, label, build, show, key=None):
+        """
+        key：生成结果的缓存键（结果只读、可在会话间共用时才传；相同键的任务只跑一次）
+        """
+        placeholder = st.empty()
+        placeholder.info(f"正在生成{label}…")
+        self.jobs.append([key, build, None, placeholder, show])
+        self._submit_queued()
+
+    def _submit_queued(self):
+        """未完成的任务不足max_running个时，按添加顺序提交排队的任务"""
+        running = sum(1 for job in self.jobs if job[2] is not None and not job[2].done())
+        for job in self.jobs:
+            if running >= self.max_running:
+                break
+            if job[2] is None:
+                job[2] = _acquire(job[0], job[1])
+                running += 1
+
+    def render(self):
+        """
+        等待全部任务，完成一个显示一个（每显示一个补交排队的任务）
+        有新的重跑请求时yield_to_rerun()抛出重跑异常，finally中取消本批还没开始的任务
+        """
+        pending = list(self.jobs)
+        try:
+            while pending:
+                self._submit_queued()
+                submitted = [job[2] for job in pending if job[2] is not None]
+                done, _ = wait(submitted, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for job in [job for job in pending if job[2] in done]:
+                    pending.remove(job)
+                    _, _, future, placeholder, show = job
+                    with placeholder.container():
+                        show(future.result())
+                yield_to_rerun()
+        finally:
+            for key, _, future, _, _ in pending:
+                if future is not None:
+                    _release(key, future)
+            self.jobs = []
@@ -0,0 +1,253 @@
+"""章回回放：逐章回增量计算地点、人物-地点关联的出现与消失，全部帧一次生成，浏览器端播放"""
+import json
+from dataclasses import dataclass
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import TimestampedGeoJson
+from pyvis.network import Network
+
+from 关联图 import force_layout, geo_anchors, layout_cache
+from 统计 import occurrences_in
+from 缓存 import LRUCache, state_key
+
+# 回放帧缓存：(语料版本, 窗口, 检索词) → PlaybackFrames，全部会话共用
+frames_cache = LRUCache(max_entries=16)
+
+# 浏览器端播放器：按帧差异显示/隐藏节点和边（节点坐标固定，不重新布局）
+PLAYER_TEMPLATE = """
+<div id="playback-controls" style="position:absolute; top:8px; left:8px; z-index:10; background:#fffc; padding:6px 10px; border-radius:6px; font-size:14px">
+  <button id="playback-toggle">▶ 播放</button>
+  <input id="playback-slider" type="range" min="0" max="__LAST__" value="0" style="width:320px; vertical-align:middle">
+  <span id="playback-label"></span>
+</div>
+<script type="text/javascript">
+(function () {
+  var frames = __FRAMES__;
+  var interval = __INTERVAL__;
+  var current = -1, timer = null;
+  var slider = document.getElementById("playback-slider");
+  var label = document.getElementById("playback-label");
+  var toggle = document.getElementById("playback-toggle");
+  function apply(frame, show) {
+    var nodeIds = show ? frame.show_nodes : frame.hide_nodes;
+    var edgeIds = show ? frame.show_edges : frame.hide_edges;
+    nodes.update(nodeIds.map(function (id) { return {id: id, hidden: !show}; }));
+    edges.update(edgeIds.map(function (id) { return {id: id, hidden: !show}; }));
+  }
+  function step(frame) {
+    // 顺序前进只应用一帧的差异；跳转时从头重放差异（不需要每帧的完整状态）
+    apply(frame, false);
+    apply(frame, true);
+  }
+  function seek(target) {
+    if (target === current + 1) {
+      step(frames[target]);
+    } else if (target !== current) {
+      nodes.update(nodes.getIds().map(function (id) { return {id: id, hidden: true}; }));
+      edges.update(edges.getIds().map(function (id) { return {id: id, hidden: true}; }));
+      for (var i = 0; i <= target; i++) { step(frames[i]); }
+    }
+    current = target;
+    slider.value = target;
+    label.textContent = frames[target].label;
+  }
+  function play() {
+    toggle.textContent = "⏸ 暂停";
+    timer = setInterval(function () { seek((current + 1) % frames.length); }, interval);
+  }
+  function pause() {
+    toggle.textContent = "▶ 播放";
+    clearInterval(timer);
+    timer = null;
+  }
+  toggle.onclick = function () { timer ? pause() : play(); };
+  slider.oninput = function () { pause(); seek(parseInt(slider.value, 10)); };
+  seek(0);
+})();
+</script>
+"""
+
+
+@dataclass
+class PlaybackFrames:
+    """全部回放帧：每帧一个章回，记录相对上一帧新增、移除的地点/节点/边"""
+    chapters: np.ndarray  # 每帧对应的章回
+    locations: pd.DataFrame  # 地图上的地点：location、lat、lon、frames（出现在哪些帧）
+    nodes: pd.DataFrame  # 关联图节点：id、label、kind（loc/char）
+    edges: pd.DataFrame  # 关联图边：id、from、to
+    node_deltas: list  # 每帧 (新增节点下标, 移除节点下标)
+    edge_deltas: list  # 每帧 (新增边下标, 移除边下标)
+
+
+def _frame_items(frame_idx, item_ids, n_frames):
+    """(帧, 条目) 去重后按帧切分：返回每帧出现的条目编号数组"""
+    n_items = int(item_ids.max()) + 1 if len(item_ids) else 1
+    pairs = np.unique(frame_idx.astype(np.int64) * n_items + item_ids)
+    frames, items = pairs // n_items, pairs % n_items
+    bounds = np.searchsorted(frames, np.arange(n_frames + 1))
+    return [items[bounds[i]:bounds[i + 1]] for i in range(n_frames)]
+
+
+def window_deltas(frame_items, n_items, window=1):
+    """
+    滑动窗口增量：窗口包含最近window帧，条目在窗口内出现过即可见
+    每帧只处理进入窗口（本帧）和离开窗口（window帧之前）的条目，按计数增减判断出现/消失
+    返回每帧的 (新增条目, 移除条目)
+    """
+    counts = np.zeros(n_items, dtype=np.int32)
+    empty = np.array([], dtype=np.int64)
+    deltas = []
+    for i, entering in enumerate(frame_items):
+        leaving = frame_items[i - window] if i >= window else empty
+        touched = np.union1d(entering, leaving)
+        before = counts[touched] > 0
+        counts[entering] += 1  # 每帧内条目已去重，可以直接按下标加减
+        counts[leaving] -= 1
+        after = counts[touched] > 0
+        deltas.append((touched[after & ~before], touched[before & ~after]))
+    return deltas
+
+
+def active_frames(deltas, n_items):
+    """由增量还原每个条目可见的帧（地图时间轴要列出每个地点出现的时刻）"""
+    since = np.full(n_items, -1)
+    spans = [[] for _ in range(n_items)]
+    for i, (added, removed) in enumerate(deltas):
+        for item in removed:
+            spans[item].extend(range(since[item], i))
+        since[removed] = -1
+        since[added] = i
+    for item in np.flatnonzero(since >= 0):
+        spans[item].extend(range(since[item], len(deltas)))
+    return spans
+
+
+def playback_frames(corpus, window=1, query=None):
+    """计算全部回放帧（按 语料版本+窗口+检索词 缓存）"""
+    key = state_key(kind="playback", version=corpus.version, window=window, query=query or "")
+    return frames_cache.get_or_build(key, lambda: _build_frames(corpus, window, query))
+
+
+def _build_frames(corpus, window, query):
+    chapters = corpus.filters.chapters
+    rows = corpus.filters.rows(query=query)
+    loc_codes = corpus.df['location'].cat.codes.to_numpy()
+    loc_names = corpus.df['location'].cat.categories
+    n_locs, n_frames = len(loc_names), len(chapters)
+    frame_of_row = np.searchsorted(chapters, corpus.df['chapter'].to_numpy())
+    # 地图：地点在本帧章回出现即可见
+    row_ids = rows.index.to_numpy()
+    valid = loc_codes[row_ids] >= 0
+    loc_deltas = window_deltas(
+        _frame_items(frame_of_row[row_ids[valid]], loc_codes[row_ids[valid]], n_frames), n_locs, window
+    )
+    spans = active_frames(loc_deltas, n_locs)
+    shown = [code for code in range(n_locs) if spans[code]]
+    coords = corpus.gazetteer.set_index('location')
+    locations = pd.DataFrame({
+        'location': loc_names[shown].astype(str),
+        'lat': coords.loc[loc_names[shown], 'lat'].to_numpy(),
+        'lon': coords.loc[loc_names[shown], 'lon'].to_numpy(),
+        'frames': [spans[code] for code in shown]
+    })
+    # 关联图：边=人物-地点，节点=地点（0..n_locs-1）与人物（n_locs+char_id）
+    occ = occurrences_in(corpus, rows)
+    occ_rows = occ['row_id'].to_numpy()
+    occ_locs = loc_codes[occ_rows]
+    keep = occ_locs >= 0
+    occ_rows, occ_locs, occ_chars = occ_rows[keep], occ_locs[keep], occ['char_id'].to_numpy()[keep]
+    edge_ids, edge_keys = pd.factorize(occ_chars.astype(np.int64) * n_locs + occ_locs)
+    occ_frames = frame_of_row[occ_rows]
+    edge_deltas = window_deltas(_frame_items(occ_frames, edge_ids, n_frames), len(edge_keys), window)
+    node_frames = np.r_[occ_frames, occ_frames]
+    node_items = np.r_[occ_locs.astype(np.int64), n_locs + occ_chars.astype(np.int64)]
+    n_nodes = n_locs + len(corpus.characters)
+    node_deltas = window_deltas(_frame_items(node_frames, node_items, n_frames), n_nodes, window)
+    labels = np.r_[np.asarray(loc_names.astype(str)), np.asarray(corpus.characters.astype(str))]
+    kinds = np.r_[np.repeat('loc', n_locs), np.repeat('char', len(corpus.characters))]
+    nodes = pd.DataFrame({'id': [f"{k}_{name}" for k, name in zip(kinds, labels)], 'label': labels, 'kind': kinds})
+    edge_keys = np.asarray(edge_keys)
+    edges = pd.DataFrame({
+        'id': [f"edge_{i}" for i in range(len(edge_keys))],
+        'from': nodes['id'].to_numpy()[n_locs + edge_keys // n_locs],
+        'to': nodes['id'].to_numpy()[edge_keys % n_locs]
+    })
+    return PlaybackFrames(chapters, locations, nodes, edges, node_deltas, edge_deltas)
+
+
+def chapter_time(chapter):
+    """章回 → 时间轴上的时刻（第N回记为公元N年1月1日，按年播放，显示为“第N回”）"""
+    return f"{int(chapter):04d}-01-01T00:00:00"
+
+
+def playback_map(frames, interval_ms=800):
+    """地图回放：每个地点一个MultiPoint，出现的每一帧一个点，交给TimestampedGeoJson在浏览器播放"""
+    m = folium.Map(tiles="CartoDB positron")
+    if frames.locations.empty:
+        return m
+    m.fit_bounds([
+        [frames.locations['lat'].min(), frames.locations['lon'].min()],
+        [frames.locations['lat'].max(), frames.locations['lon'].max()]
+    ])
+    features = [{
+        "type": "Feature",
+        "geometry": {"type": "MultiPoint", "coordinates": [[float(row.lon), float(row.lat)]] * len(row.frames)},
+        "properties": {
+            "times": [chapter_time(frames.chapters[f]) for f in row.frames],
+            "tooltip": row.location,
+            "icon": "circle",
+            "iconstyle": {"radius": 10, "color": "#591F24", "fillColor": "#591F24", "fillOpacity": 0.8}
+        }
+    } for row in frames.locations.itertuples(index=False)]
+    TimestampedGeoJson(
+        {"type": "FeatureCollection", "features": features},
+        period="P1Y",
+        duration="P1M",  # 每个点只在自己那一帧显示
+        transition_time=interval_ms,
+        auto_play=False,
+        loop=True,
+        date_options="第Y回",
+        add_last_point=False
+    ).add_to(m)
+    return m
+
+
+def playback_network_html(corpus, frames, interval_ms=800):
+    """
+    关联图回放：全部节点、边一次写入（地理锚定布局、关闭物理引擎），再附上每帧的显示/隐藏差异
+    浏览器端按帧应用差异，不再请求服务器
+    """
+    used = np.unique(np.concatenate([added for added, _ in frames.node_deltas] + [np.array([], dtype=np.int64)]))
+    if not len(used):
+        return None
+    nodes = frames.nodes.iloc[used]
+    edge_pairs = list(zip(frames.edges['from'], frames.edges['to']))
+    node_ids = nodes['id'].tolist()
+    positions = layout_cache.get_or_build(
+        state_key(kind="playback", version=corpus.version, nodes=node_ids, edges=edge_pairs),
+        lambda: force_layout(node_ids, edge_pairs, geo_anchors(corpus.gazetteer, "loc_"))
+    )
+    net = Network(directed=False, height="700px", width="100%", bgcolor="#f8f9fa", font_color="#333333")
+    for node_id, label, kind in nodes.itertuples(index=False):
+        x, y = positions[node_id]
+        net.add_node(
+            node_id, label=label, x=x, y=y, physics=False, hidden=True,
+            color="#5D2B09" if kind == 'loc' else "#DAC6B2",
+            size=20 if kind == 'loc' else 12,
+            font={"size": 12, "weight": "bold"}
+        )
+    for edge_id, src, dst in frames.edges.itertuples(index=False):
+        net.add_edge(src, dst, id=edge_id, color="#9AA0A6", width=2, hidden=True)
+    net.toggle_physics(False)
+    node_ids, edge_ids = frames.nodes['id'].to_numpy(), frames.edges['id'].to_numpy()
+    payload = [{
+        "label": f"第{int(chapter)}回",
+        "show_nodes": node_ids[n_add].tolist(), "hide_nodes": node_ids[n_del].tolist(),
+        "show_edges": edge_ids[e_add].tolist(), "hide_edges": edge_ids[e_del].tolist()
+    } for chapter, (n_add, n_del), (e_add, e_del) in zip(frames.chapters, frames.node_deltas, frames.edge_deltas)]
+    player = (PLAYER_TEMPLATE.replace("__FRAMES__", json.dumps(payload, ensure_ascii=False))
+              .replace("__INTERVAL__", str(int(interval_ms)))
+              .replace("__LAST__", str(len(payload) - 1)))
+    return net.generate_html().replace("</body>", player + "</body>")
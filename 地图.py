@@ -0,0 +1,94 @@
+"""地点坐标地图的folium图层（页面1与离线预渲染共用，不依赖streamlit）"""
+import folium
+import pandas as pd
+
+# 活动类型颜色映射
+ACT_COLOR_MAP = {
+    "官场任职": "#2232E6",
+    "家庭生活": "#EEAA9C",
+    "科举备考": "#3498DB",
+    "商业经济": "#8E44AD",
+    "社交往来": "#F39C12",
+    "特殊变故": "#E74C3C",
+    "文人雅集": "#b9dec9",
+    "其他": "#95A5A6"
+}
+
+
+def base_map(corpus):
+    """底图：初始视野按地点索引的整体范围自动定位（没有带坐标的地点时用folium的默认视野）"""
+    m = folium.Map(tiles="CartoDB positron")
+    bounds = corpus.spatial.bounds()
+    if bounds is not None:
+        m.fit_bounds(bounds)
+    return m
+
+
+def location_layer(marker_table, act_color_map=ACT_COLOR_MAP):
+    """精简地图：所有地点放进一个GeoJSON图层，每个点只带地点名和总次数，样式按点写入"""
+    features = [{
+        "type": "Feature",
+        "id": row.location_id,
+        "geometry": {"type": "Point", "coordinates": [float(row.lon), float(row.lat)]},
+        "properties": {
+            "name": row.location,
+            "freq": int(row.total_freq),
+            "radius": float(row.radius),
+            "color": act_color_map.get(row.main_act, act_color_map["其他"])
+        }
+    } for row in marker_table.itertuples(index=False)]
+    return folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        marker=folium.CircleMarker(fill=True, fill_opacity=0.8),
+        style_function=lambda f: {
+            "radius": f["properties"]["radius"],
+            "color": f["properties"]["color"],
+            "fillColor": f["properties"]["color"]
+        },
+        tooltip=folium.GeoJsonTooltip(fields=["name", "freq"], aliases=["地点", "总出现次数"])
+    )
+
+
+def location_markers(marker_table, act_color_map=ACT_COLOR_MAP):
+    """完整地图：每个地点一个标记，悬浮提示+点击弹窗（详细信息直接写进页面，不需要服务器）"""
+    group = folium.FeatureGroup(name="地点")
+    for row in marker_table.itertuples(index=False):
+        loc = row.location
+        total_freq = row.total_freq
+        chapter_count = row.chapter_count
+        main_act = row.main_act
+        marker_color = act_color_map.get(main_act, act_color_map["其他"])
+        #处理空值（避免情节为NaN报错）
+        plot_content = row.plot_summary[:120] if pd.notna(row.plot_summary) else "无相关情节"
+        #添加地图标记（hover+弹窗）
+        folium.CircleMarker(
+            location=[row.lat, row.lon],  # folium要求：纬度在前，经度在后
+            radius=row.radius,
+            color=marker_color,
+            fill=True,
+            fill_color=marker_color,
+            fill_opacity=0.8,
+            # Hover提示：核心信息快速预览
+            tooltip=f"""
+                <b>{loc}</b><br>
+                总出现次数：{total_freq}次<br>
+                涉及章回：{chapter_count}回<br>
+                主要活动：{main_act}
+            """,
+            # 点击弹窗：详细信息（含人物、情节）
+            popup=folium.Popup(f"""
+                <div style='width:280px; font-size:14px; line-height:1.5'>
+                    <h4 style='margin:0; color:{marker_color}; font-size:16px'>{loc}</h4>
+                    <p><b>1. 出现统计</b></p>
+                    <p>总出现次数：{total_freq}次</p>
+                    <p>涉及章回：{chapter_count}回（{', '.join(map(str, row.chapter_list))}）</p>
+                    <p>每章出现次数：<br>{'<br>'.join(row.chapter_freq_str)}</p>
+                    <p><b>2. 核心信息</b></p>
+                    <p>涉及主要人物：{row.characters if pd.notna(row.characters) else "无"}</p>
+                    <p>主要活动类型：{main_act}</p>
+                    <p><b>3. 情节示例</b></p>
+                    <p>{plot_content}...</p>
+                </div>
+            """, max_width=300)
+        ).add_to(group)
+    return group
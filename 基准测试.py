@@ -0,0 +1,248 @@
+"""
+基准测试：按读取1.csv的格式生成合成数据（10³–10⁶行，地点/人物/章回/活动类型数可调），
+不启动streamlit，逐规模计时各处理阶段，输出规模曲线（各阶段耗时及相对行数的增长指数），
+可保存为基线，之后与基线比较发现性能退化
+
+用法：
+    python 基准测试.py --sizes 1000 10000 100000 --save-baseline 基准结果.json
+    python 基准测试.py --sizes 1000 10000 100000 --compare 基准结果.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+import 数据加载
+from 数据加载 import load_corpus
+from 统计 import location_marker_table, occurrences_in, char_loc_index, location_stat_table, character_stat_table, activity_stat_table
+from 关联图 import char_loc_graph_html, loc_act_graph_html, DEFAULT_LOD
+from 地图 import ACT_COLOR_MAP
+
+CSV_COLUMNS = ['回次', '章節題目', '地名', '经度', '纬度', '城市出现次数', '涉及主要人物', '活动类型', '情节']
+# 常用汉字范围（生成地名、人名、章节题目、情节用）
+CJK_FIRST, CJK_LAST = 0x4E00, 0x9FA5
+
+
+def _cjk_strings(rng, count, length):
+    """count个随机汉字串（每个length个字）：一次生成码位数组再整体解码"""
+    if count == 0:
+        return np.array([], dtype=object)
+    codes = rng.integers(CJK_FIRST, CJK_LAST + 1, size=count * length, dtype=np.uint32)
+    text = codes.tobytes().decode('utf-32-le')
+    return np.array([text[i * length:(i + 1) * length] for i in range(count)], dtype=object)
+
+
+def _unique_names(rng, count, length):
+    """count个互不相同的随机汉字名"""
+    names = []
+    seen = set()
+    while len(names) < count:
+        for name in _cjk_strings(rng, count - len(names), length):
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return np.array(names, dtype=object)
+
+
+def synthetic_frame(n_rows, n_chapters=56, n_locations=500, n_characters=2000, n_acts=None,
+                    max_chars_per_row=4, plot_length=60, seed=0):
+    """
+    生成与读取1.csv列名、格式相同的合成数据（DataFrame，列名为CSV原始中文列名）
+    人物按“，”连接；城市出现次数 = 该地点在该回的行数（同一地点同一回的值一致）
+    地点、人物的出现频率按Zipf分布（少数地点、人物出现得多，与原书相近）
+    """
+    rng = np.random.default_rng(seed)
+    acts = np.array(list(ACT_COLOR_MAP)[:n_acts], dtype=object)
+    titles = _cjk_strings(rng, n_chapters, 14)
+    loc_names = _unique_names(rng, n_locations, 2)
+    lon = rng.uniform(100.0, 122.0, n_locations).round(6)
+    lat = rng.uniform(22.0, 41.0, n_locations).round(6)
+    char_names = _unique_names(rng, n_characters, 3)
+    loc_weights = 1.0 / np.arange(1, n_locations + 1)
+    char_weights = 1.0 / np.arange(1, n_characters + 1)
+    chapter = np.sort(rng.integers(1, n_chapters + 1, n_rows))
+    loc = rng.choice(n_locations, n_rows, p=loc_weights / loc_weights.sum())
+    # 每行1..max_chars_per_row个人物（同一行内不重复）
+    picks = rng.choice(n_characters, (n_rows, max_chars_per_row), p=char_weights / char_weights.sum())
+    counts = rng.integers(1, max_chars_per_row + 1, n_rows)
+    people = [
+        "，".join(dict.fromkeys(char_names[row[:k]]))
+        for row, k in zip(picks, counts)
+    ]
+    plots = pd.Series(loc_names[loc]) + pd.Series(_cjk_strings(rng, n_rows, plot_length))
+    frame = pd.DataFrame({
+        '回次': chapter,
+        '章節題目': titles[chapter - 1],
+        '地名': loc_names[loc],
+        '经度': lon[loc],
+        '纬度': lat[loc],
+        '涉及主要人物': people,
+        '活动类型': acts[rng.integers(0, len(acts), n_rows)],
+        '情节': plots
+    })
+    frame['城市出现次数'] = frame.groupby(['回次', '地名'])['地名'].transform('size')
+    return frame[CSV_COLUMNS]
+
+
+def write_synthetic_csv(path, n_rows, **options):
+    """生成合成数据并写成CSV（与读取1.csv同样的utf-8编码）"""
+    synthetic_frame(n_rows, **options).to_csv(path, index=False, encoding='utf-8')
+    return path
+
+
+def _time(run, repeat):
+    """运行repeat次，返回每次的耗时（毫秒）"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def benchmark_corpus(csv_path, repeat=3):
+    """对一份数据逐阶段计时，返回 {阶段: [各次耗时]}"""
+    results = {}
+    # 1. 加载：首次解析CSV（含建索引、写快照；先删掉同内容的旧快照），之后从快照读取
+    for path in 数据加载.snapshot_paths(csv_path, 数据加载.file_digest(csv_path)).values():
+        if os.path.exists(path):
+            os.remove(path)
+    数据加载._corpus_cache.clear()
+    start = time.perf_counter()
+    corpus = load_corpus(csv_path)
+    results['load_csv'] = [(time.perf_counter() - start) * 1000]
+
+    def load_snapshot():
+        数据加载._corpus_cache.clear()  # 清掉内存缓存，只测读快照
+        load_corpus(csv_path)
+    results['load_snapshot'] = _time(load_snapshot, repeat)
+    corpus = load_corpus(csv_path)
+    filters = corpus.filters
+    chapters = (int(filters.chapters[0]), int(filters.chapters[-1]))
+    locs = list(corpus.df['location'].cat.categories)
+    acts = list(corpus.df['activity_type'].cat.categories)
+    chars = list(corpus.characters)
+
+    # 2. 页面1地点汇总（清掉掩码缓存，计入筛选本身）
+    def tab1_markers():
+        filters.masks.clear()
+        rows = filters.rows(chapters=chapters, locs=locs, acts=acts)
+        location_marker_table(corpus, rows, total_freq=filters.location_freq(chapters, dedup='distinct'))
+    results['tab1_markers'] = _time(tab1_markers, repeat)
+    rows = filters.rows(chapters=chapters)
+    occ = occurrences_in(corpus, rows)
+    # 3. 页面2节点、边（人物-地点倒排索引）
+    results['tab2_edges'] = _time(lambda: char_loc_index(occurrences_in(corpus, rows, chars), rows), repeat)
+    # 4. 页面3三张统计表
+    results['tab3_tables'] = _time(lambda: (
+        location_stat_table(corpus, rows, occ, chapters),
+        character_stat_table(corpus, occ),
+        activity_stat_table(corpus, rows, occ, chapters)
+    ), repeat)
+    # 5. 图谱HTML（页面默认的细节层次）
+    results['graph_char_loc'] = _time(
+        lambda: char_loc_graph_html(corpus, locs, chars, chapters, "physics", DEFAULT_LOD), repeat
+    )
+    results['graph_loc_act'] = _time(lambda: loc_act_graph_html(corpus, locs, acts, chapters, "physics"), repeat)
+    return results
+
+
+def run_suite(sizes, data_dir, repeat=3, **options):
+    """逐规模生成数据并计时，返回结果表：rows、stage、median_ms、min_ms"""
+    os.makedirs(data_dir, exist_ok=True)
+    records = []
+    for n_rows in sizes:
+        csv_path = os.path.join(data_dir, f"synthetic_{n_rows}.csv")
+        write_synthetic_csv(csv_path, n_rows, **options)
+        for stage, times in benchmark_corpus(csv_path, repeat).items():
+            records.append({
+                'rows': n_rows, 'stage': stage,
+                'median_ms': statistics.median(times), 'min_ms': min(times)
+            })
+        print(f"{n_rows}行 完成", flush=True)
+    return pd.DataFrame(records)
+
+
+def scaling_table(results):
+    """规模曲线：行=阶段，列=各规模的中位耗时；exponent为log(耗时)对log(行数)的斜率（1≈线性）"""
+    curves = results.pivot(index='stage', columns='rows', values='median_ms')
+    sizes = np.log(curves.columns.to_numpy(dtype=float))
+    if len(sizes) > 1:
+        logs = np.log(np.maximum(curves.to_numpy(dtype=float), 1e-3))
+        curves['exponent'] = np.polyfit(sizes, logs.T, 1)[0].round(2)
+    return curves
+
+
+def compare_baseline(results, baseline, tolerance=1.5, min_ms=20.0):
+    """
+    与基线比较：同一阶段同一规模的最短耗时超过基线tolerance倍（且多出min_ms以上）视为退化
+    用最短耗时而不是中位数：受机器上其他负载的干扰最小
+    """
+    merged = results.merge(baseline[['rows', 'stage', 'min_ms']], on=['rows', 'stage'], suffixes=('', '_baseline'))
+    merged['ratio'] = merged['min_ms'] / merged['min_ms_baseline']
+    merged['regression'] = (merged['ratio'] > tolerance) & (merged['min_ms'] - merged['min_ms_baseline'] > min_ms)
+    return merged
+
+
+def save_baseline(results, path, options):
+    """基线文件：环境信息、生成参数与各阶段结果"""
+    payload = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+        'machine': platform.machine(), 'options': options,
+        'results': results.to_dict(orient='records')
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return pd.DataFrame(json.load(f)['results'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成数据基准测试：各处理阶段的耗时与规模曲线")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="数据行数（可到1000000）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数（取中位数）")
+    parser.add_argument("--chapters", type=int, default=56, help="章回数")
+    parser.add_argument("--locations", type=int, default=500, help="地点数")
+    parser.add_argument("--characters", type=int, default=2000, help="人物数")
+    parser.add_argument("--acts", type=int, default=None, help="活动类型数（最多与现有类型数相同）")
+    parser.add_argument("--chars-per-row", type=int, default=4, help="每行最多几个人物")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(".cache", "benchmark"), help="合成数据存放目录")
+    parser.add_argument("--csv-out", default=None, help="结果另存为CSV")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果保存为基线（JSON）")
+    parser.add_argument("--compare", default=None, help="与基线比较，有退化时返回码为1")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="超过基线多少倍算退化")
+    args = parser.parse_args()
+    options = {
+        'n_chapters': args.chapters, 'n_locations': args.locations, 'n_characters': args.characters,
+        'n_acts': args.acts, 'max_chars_per_row': args.chars_per_row, 'seed': args.seed
+    }
+    results = run_suite(args.sizes, args.data_dir, args.repeat, **options)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print("\n各阶段中位耗时（毫秒）与增长指数：")
+        print(scaling_table(results).round(1).to_string())
+    if args.csv_out:
+        results.to_csv(args.csv_out, index=False)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline, options)
+        print(f"\n基线已保存：{args.save_baseline}")
+    if args.compare:
+        compared = compare_baseline(results, load_baseline(args.compare), args.tolerance)
+        print("\n与基线比较：")
+        print(compared[['rows', 'stage', 'min_ms', 'min_ms_baseline', 'ratio', 'regression']].round(2).to_string(index=False))
+        if compared['regression'].any():
+            print("\n发现性能退化")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
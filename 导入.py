@@ -0,0 +1,284 @@
+"""
+多语料增量导入：一个目录下的多个标注CSV（不同章回段、不同小说）分块流式读取，写入列式分区存储
+地点、人物、活动类型的ID只追加不重排（新名称取下一个编号，已有ID永不改变）
+重启时只处理新增或内容变化的文件，没变的文件直接用已有分区
+
+存储目录结构：
+    manifest.json                      已导入的文件：内容哈希、大小、修改时间、所属语料、分区文件、行数
+    ids/{location,character,activity_type}.parquet   名称 → 稳定ID（按登记先后编号）
+    partitions/<语料>/<文件名>.<内容哈希>.parquet    每个CSV一个分区（按块写入多个行组）
+
+用法：python 导入.py 标注数据目录 [--store 存储目录] [--chunk-rows 50000]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from 数据加载 import COLUMN_MAP, CHAR_SEP, file_digest, load_snapshot_or_build, snapshot_paths
+
+STORE_DIR = os.path.join(".cache", "store")  # 默认存储目录（放在标注数据目录下）
+CHUNK_ROWS = 50_000  # 每块读取的行数
+# 应用里重新扫描数据目录的最短间隔（秒，可用环境变量RULIN_SCAN_SECONDS调整）
+SCAN_SECONDS = float(os.environ.get("RULIN_SCAN_SECONDS", 60))
+# 分区的列与类型（与parse_csv输出的宽表一致，另加所属语料与来源文件）
+PARTITION_SCHEMA = pa.schema([
+    ('corpus', pa.string()),
+    ('source', pa.string()),
+    ('chapter', pa.int64()),
+    ('章節題目', pa.string()),
+    ('location', pa.string()),
+    ('lon', pa.float64()),
+    ('lat', pa.float64()),
+    ('loc_total_freq', pa.int64()),
+    ('characters', pa.string()),
+    ('activity_type', pa.string()),
+    ('plot_summary', pa.string()),
+    ('location_id', pa.string()),
+    ('activity_type_id', pa.string())
+])
+ID_PREFIXES = {'location': 'loc', 'character': 'char', 'activity_type': 'act'}
+
+_ingest_lock = threading.Lock()
+# 进程级缓存：(存储目录, 语料, 存储版本) → Corpus
+_store_cache = {}
+_store_lock = threading.Lock()
+# 上次扫描：(数据目录, 存储目录) → (扫描时间, 清单)
+_scans = {}
+_scan_lock = threading.Lock()
+
+
+class IdRegistry:
+    """名称 → 稳定ID（只追加）：新名称按登记先后取下一个编号，已登记的名称ID不变"""
+
+    def __init__(self, path, prefix):
+        self.path = path
+        self.prefix = prefix
+        self.ids = {}
+        if os.path.exists(path):
+            table = pd.read_parquet(path)
+            self.ids = dict(zip(table['name'], table['id']))
+        self._dirty = False
+
+    def assign(self, values):
+        """按值查ID，未登记的名称（按首次出现顺序）追加登记；返回与values对齐的ID（空值仍为空）"""
+        values = pd.Series(values, dtype=object)
+        for name in pd.unique(values.dropna()):
+            if name not in self.ids:
+                self.ids[name] = f"{self.prefix}_{str(len(self.ids) + 1).zfill(3)}"
+                self._dirty = True
+        return values.map(self.ids)
+
+    def save(self):
+        """有新登记时写回（先写临时文件再替换）"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        table = pd.DataFrame({'name': list(self.ids), 'id': list(self.ids.values())})
+        table.to_parquet(self.path + ".tmp", index=False)
+        os.replace(self.path + ".tmp", self.path)
+        self._dirty = False
+
+
+def open_registry(store, dim):
+    return IdRegistry(os.path.join(store, "ids", f"{dim}.parquet"), ID_PREFIXES[dim])
+
+
+def open_registries(store):
+    return {dim: open_registry(store, dim) for dim in ID_PREFIXES}
+
+
+def corpus_name(data_dir, path):
+    """所属语料：标注数据目录下的第一级子目录名；直接放在目录下的文件归入以目录命名的语料"""
+    parts = os.path.relpath(path, data_dir).split(os.sep)
+    return parts[0] if len(parts) > 1 else os.path.basename(os.path.abspath(data_dir))
+
+
+def normalize_chunk(chunk, registries, corpus, source):
+    """一块原始CSV → 分区的行：改列名、规范类型、查/登记稳定ID"""
+    chunk = chunk.rename(columns=COLUMN_MAP)
+    chunk['location_id'] = registries['location'].assign(chunk['location']).to_numpy()
+    chunk['activity_type_id'] = registries['activity_type'].assign(chunk['activity_type']).to_numpy()
+    people = chunk['characters'].astype(object).str.split(CHAR_SEP).explode().str.strip()
+    registries['character'].assign(people[people.notna() & (people != '')])
+    chunk['corpus'] = corpus
+    chunk['source'] = source
+    return pa.Table.from_pandas(chunk[PARTITION_SCHEMA.names], schema=PARTITION_SCHEMA, preserve_index=False)
+
+
+def ingest_file(path, data_dir, store, registries, digest, chunk_rows=CHUNK_ROWS):
+    """分块读取一个CSV，逐块写入分区文件（行组=块，内存占用与块大小成正比）；返回清单条目"""
+    corpus = corpus_name(data_dir, path)
+    source = os.path.relpath(path, data_dir)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    partition = os.path.join("partitions", corpus, f"{stem}.{digest[:16]}.parquet")
+    target = os.path.join(store, partition)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    rows = 0
+    with pq.ParquetWriter(target + ".tmp", PARTITION_SCHEMA) as writer:
+        for chunk in pd.read_csv(path, encoding='utf-8', chunksize=chunk_rows):
+            writer.write_table(normalize_chunk(chunk, registries, corpus, source))
+            rows += len(chunk)
+    os.replace(target + ".tmp", target)
+    stat = os.stat(path)
+    return {
+        'corpus': corpus, 'digest': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+        'partition': partition, 'rows': rows
+    }
+
+
+def read_manifest(store):
+    path = os.path.join(store, "manifest.json")
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(store, manifest):
+    path = os.path.join(store, "manifest.json")
+    with open(path + ".tmp", "w", encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def ingest(data_dir, store=None, chunk_rows=CHUNK_ROWS):
+    """
+    增量导入目录下全部CSV（含子目录）：大小、修改时间都没变的文件直接跳过；变了再算内容哈希，
+    内容也没变只更新清单，否则重写该文件的分区；已删除的文件连同分区一起移除
+    ID表只在有文件要导入时才读，清单只在有变化时才写回
+    返回 (清单, 本次处理的文件列表)
+    """
+    store = store or os.path.join(data_dir, STORE_DIR)
+    with _ingest_lock:
+        manifest = read_manifest(store)
+        files = manifest['files']
+        registries = None
+        found, processed, touched = set(), [], False
+        for root, dirs, names in os.walk(data_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))  # 跳过.cache等隐藏目录（存储目录在其中）
+            for name in sorted(names):
+                if not name.lower().endswith('.csv'):
+                    continue
+                path = os.path.join(root, name)
+                source = os.path.relpath(path, data_dir)
+                found.add(source)
+                stat = os.stat(path)
+                entry = files.get(source)
+                if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    continue
+                digest = file_digest(path)
+                if entry and entry['digest'] == digest:
+                    entry['mtime_ns'] = stat.st_mtime_ns
+                    touched = True
+                    continue
+                if registries is None:
+                    registries = open_registries(store)
+                new_entry = ingest_file(path, data_dir, store, registries, digest, chunk_rows)
+                if entry and entry['partition'] != new_entry['partition']:
+                    _remove(os.path.join(store, entry['partition']))
+                files[source] = new_entry
+                processed.append(source)
+        for source in [s for s in files if s not in found]:
+            _remove(os.path.join(store, files.pop(source)['partition']))
+            processed.append(source)
+        if registries is not None:
+            for registry in registries.values():  # ID表先于清单写出：清单引用的分区里的ID一定已登记
+                registry.save()
+        if processed or touched:
+            os.makedirs(store, exist_ok=True)
+            _write_manifest(store, manifest)
+        return manifest, processed
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def store_version(manifest, corpus=None):
+    """存储版本：所选语料各文件内容哈希的sha1（文件增删改都会改变版本）"""
+    items = sorted(
+        (source, entry['digest']) for source, entry in manifest['files'].items()
+        if corpus is None or entry['corpus'] == corpus
+    )
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def read_partitions(store, manifest, corpus=None):
+    """读取分区，拼成与parse_csv相同列的宽表（按来源文件排序，行号即row_id）"""
+    entries = [
+        manifest['files'][source] for source in sorted(manifest['files'])
+        if corpus is None or manifest['files'][source]['corpus'] == corpus
+    ]
+    tables = [pq.read_table(os.path.join(store, e['partition'])) for e in entries]
+    table = pa.concat_tables(tables) if tables else PARTITION_SCHEMA.empty_table()
+    return table.drop_columns(['corpus', 'source']).to_pandas()
+
+
+def corpora(manifest):
+    """存储中有哪些语料（按名称排序）"""
+    return sorted({entry['corpus'] for entry in manifest['files'].values()})
+
+
+def scanned_manifest(data_dir, store, refresh=False, max_age=SCAN_SECONDS):
+    """
+    进程内第一次调用（启动时）、refresh为True或距上次扫描超过max_age秒时才调用ingest扫描目录；
+    其余时候直接返回上次扫描得到的清单（不遍历目录、不读ID表）；多个会话同时到期时只扫描一次
+    """
+    key = (os.path.abspath(data_dir), os.path.abspath(store))
+    with _scan_lock:
+        scanned = _scans.get(key)
+        if scanned is None or refresh or time.monotonic() - scanned[0] > max_age:
+            manifest, _ = ingest(data_dir, store)
+            scanned = _scans[key] = (time.monotonic(), manifest)
+        return scanned[1]
+
+
+def load_ingested(data_dir, corpus=None, store=None, refresh=False):
+    """
+    增量导入后加载语料（corpus为None表示目录下全部文件）；目录按scanned_manifest的规则扫描，refresh=True立即扫描
+    ID取自只追加的ID表，新增文件不会改变已有地点、人物、活动类型的ID；
+    存储版本不变时命中进程缓存或磁盘快照，只有导入了新文件才由分区重建（加锁：同一版本只建一次、快照只写一次）
+    """
+    store = store or os.path.join(data_dir, STORE_DIR)
+    manifest = scanned_manifest(data_dir, store, refresh)
+    version = store_version(manifest, corpus)
+    key = (os.path.abspath(store), corpus, version)
+    with _store_lock:
+        cached = _store_cache.get(key)
+        if cached is not None:
+            return cached
+        paths = snapshot_paths(os.path.join(store, corpus or "全部语料"), version)
+        # 人物ID用ID表里的稳定ID（顺序仍按人物在本语料中首次出现的顺序）
+        loaded = load_snapshot_or_build(
+            paths, version, lambda: read_partitions(store, manifest, corpus),
+            char_ids=open_registry(store, 'character').ids
+        )
+        for old_key in [k for k in _store_cache if k[:2] == key[:2]]:
+            del _store_cache[old_key]
+        _store_cache[key] = loaded
+        return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量导入标注CSV（只处理新增或变化的文件）")
+    parser.add_argument("data_dir", help="标注数据目录（子目录名即语料名）")
+    parser.add_argument("--store", default=None, help=f"存储目录（默认<标注数据目录>/{STORE_DIR}）")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="每块读取的行数")
+    args = parser.parse_args()
+    manifest, processed = ingest(args.data_dir, args.store, args.chunk_rows)
+    print(f"本次处理{len(processed)}个文件：{', '.join(processed) if processed else '无'}")
+    for name in corpora(manifest):
+        entries = [e for e in manifest['files'].values() if e['corpus'] == name]
+        print(f"{name}：{len(entries)}个文件，{sum(e['rows'] for e in entries)}行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+导出当前筛选结果：统计表导出Parquet/CSV，地点汇总另可导出GeoJSON，关联图导出GraphML/JSON或节点表、边表
+各格式都按块写入文件对象（每块CHUNK_ROWS行），不在内存里拼出整个文件的字符串
+导出文件按筛选状态写到磁盘（.cache/exports），同一筛选状态再次导出直接复用
+"""
+import io
+import json
+import os
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CHUNK_ROWS = 50_000  # 每块写入的行数
+EXPORT_DIR = os.path.join(".cache", "exports")
+MAX_EXPORT_FILES = 64  # 导出目录最多保留的文件数（超出时删最早的）
+# 格式 → (扩展名, MIME类型)
+FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "csv": ("csv", "text/csv"),
+    "geojson": ("geojson", "application/geo+json"),
+    "graphml": ("graphml", "application/graphml+xml"),
+    "json": ("json", "application/json")
+}
+# GraphML属性类型（按列的dtype）
+GRAPHML_TYPES = {"b": "boolean", "i": "long", "u": "long", "f": "double"}
+
+_export_lock = threading.Lock()
+
+
+def _chunks(table, chunk_rows):
+    """按行切块（空表也返回一块，用于写表头/模式）"""
+    for start in range(0, max(len(table), 1), chunk_rows):
+        yield table.iloc[start:start + chunk_rows]
+
+
+def _jsonable(value):
+    """numpy标量、数组转成JSON可序列化的值"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _records(chunk):
+    """一块表 → 记录列表（缺失值为None，JSON里写成null而不是NaN）"""
+    chunk = chunk.astype(object)
+    return chunk.where(chunk.notna(), None).to_dict(orient='records')
+
+
+def _cell_text(value):
+    """列表类的单元格（涉及章回、参与活动等）拼成“a, b, c”，CSV和GraphML里都是一个字段"""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return ", ".join(map(str, value))
+    return value
+
+
+def write_parquet(table, f, chunk_rows=CHUNK_ROWS):
+    """每块写成一个行组（列类型以第一块为准）"""
+    writer = None
+    for chunk in _chunks(table, chunk_rows):
+        batch = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(f, batch.schema)
+        writer.write_table(batch)
+    writer.close()
+
+
+def write_csv(table, f, chunk_rows=CHUNK_ROWS):
+    """utf-8带BOM（Excel直接打开中文不乱码），列表类单元格拼成一个字段"""
+    text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+    for i, chunk in enumerate(_chunks(table, chunk_rows)):
+        chunk = chunk.apply(lambda col: col.map(_cell_text) if col.dtype == object else col)
+        chunk.to_csv(text, header=(i == 0), index=False)
+    text.flush()
+    text.detach()  # 交还文件对象，由调用方关闭
+
+
+def _write_items(f, items, written):
+    """接着已写的JSON数组元素写下去（元素之间加逗号），返回数组里是否已有元素"""
+    if not items:
+        return written
+    f.write(((", " if written else "") + ", ".join(items)).encode('utf-8'))
+    return True
+
+
+def write_geojson(table, f, lon='lon', lat='lat', chunk_rows=CHUNK_ROWS):
+    """每个地点一个点要素，其他列都作为属性（FeatureCollection，逐块写要素）"""
+    columns = [c for c in table.columns if c not in (lon, lat)]
+    f.write(b'{"type": "FeatureCollection", "features": [')
+    written = False
+    for chunk in _chunks(table, chunk_rows):
+        features = [
+            json.dumps({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [x, y]},
+                "properties": props
+            }, ensure_ascii=False, default=_jsonable)
+            for x, y, props in zip(chunk[lon].tolist(), chunk[lat].tolist(), _records(chunk[columns]))
+        ]
+        written = _write_items(f, features, written)
+    f.write(b"]}")
+
+
+def write_graph_json(nodes, edges, f, chunk_rows=CHUNK_ROWS):
+    """{"nodes": [...], "edges": [...]}：节点表、边表逐块写成对象数组"""
+    for i, (name, table) in enumerate((("nodes", nodes), ("edges", edges))):
+        f.write(f'{"{" if i == 0 else ", "}"{name}": ['.encode('utf-8'))
+        written = False
+        for chunk in _chunks(table, chunk_rows):
+            items = [json.dumps(r, ensure_ascii=False, default=_jsonable) for r in _records(chunk)]
+            written = _write_items(f, items, written)
+        f.write(b"]")
+    f.write(b"}")
+
+
+def _graphml_keys(table, domain, prefix, skip):
+    """GraphML属性声明：返回 (列 → key id, 声明文本)（中文列名只放在attr.name里）"""
+    columns = [c for c in table.columns if c not in skip]
+    keys = {col: f"{prefix}{i}" for i, col in enumerate(columns)}
+    lines = "".join(
+        f'<key id="{keys[col]}" for="{domain}" attr.name={quoteattr(str(col))} '
+        f'attr.type="{GRAPHML_TYPES.get(table[col].dtype.kind, "string")}"/>\n'
+        for col in columns
+    )
+    return keys, lines
+
+
+def _graphml_data(keys, record):
+    return "".join(
+        f'<data key="{keys[col]}">{escape(str(_cell_text(value)))}</data>'
+        for col, value in record.items() if col in keys and value is not None
+    )
+
+
+def write_graphml(nodes, edges, f, chunk_rows=CHUNK_ROWS):
+    """无向图：nodes需有id列，edges需有source、target列，其余列都写成属性"""
+    f.write(
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b'<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    )
+    node_keys, node_lines = _graphml_keys(nodes, "node", "n", {"id"})
+    edge_keys, edge_lines = _graphml_keys(edges, "edge", "e", {"source", "target"})
+    f.write((node_lines + edge_lines).encode('utf-8'))
+    f.write(b'<graph id="G" edgedefault="undirected">\n')
+    for chunk in _chunks(nodes, chunk_rows):
+        f.write("".join(
+            f'<node id={quoteattr(str(r["id"]))}>{_graphml_data(node_keys, r)}</node>\n' for r in _records(chunk)
+        ).encode('utf-8'))
+    for chunk in _chunks(edges, chunk_rows):
+        f.write("".join(
+            f'<edge source={quoteattr(str(r["source"]))} target={quoteattr(str(r["target"]))}>'
+            f'{_graphml_data(edge_keys, r)}</edge>\n' for r in _records(chunk)
+        ).encode('utf-8'))
+    f.write(b'</graph>\n</graphml>\n')
+
+
+def table_writers(table):
+    """统计表的导出方式：名称 → (格式, 写入函数)"""
+    return {
+        "Parquet": ("parquet", lambda f: write_parquet(table, f)),
+        "CSV": ("csv", lambda f: write_csv(table, f))
+    }
+
+
+def location_writers(table):
+    """地点汇总表：另可导出GeoJSON（地点坐标+汇总属性）"""
+    return {**table_writers(table), "GeoJSON": ("geojson", lambda f: write_geojson(table, f))}
+
+
+def graph_writers(build_frames):
+    """
+    关联图的导出方式；build_frames() → (节点表, 边表) 或 None（无数据）
+    点了导出才生成节点表、边表（不在每次重跑时计算）
+    """
+    def frames():
+        result = build_frames()
+        if result is None:
+            return pd.DataFrame(columns=['id']), pd.DataFrame(columns=['source', 'target'])
+        return result
+    return {
+        "GraphML": ("graphml", lambda f: write_graphml(*frames(), f)),
+        "JSON（节点+边）": ("json", lambda f: write_graph_json(*frames(), f)),
+        "边表 Parquet": ("parquet", lambda f: write_parquet(frames()[1], f)),
+        "边表 CSV": ("csv", lambda f: write_csv(frames()[1], f)),
+        "节点表 Parquet": ("parquet", lambda f: write_parquet(frames()[0], f)),
+        "节点表 CSV": ("csv", lambda f: write_csv(frames()[0], f))
+    }
+
+
+def export_path(name, key, fmt, folder=EXPORT_DIR):
+    """导出文件路径：<导出目录>/<名称>.<筛选状态哈希>.<扩展名>"""
+    return os.path.join(folder, f"{name}.{key[:16]}.{FORMATS[fmt][0]}")
+
+
+def export_file(name, key, fmt, write, folder=EXPORT_DIR):
+    """
+    写出导出文件并返回路径：已有同一筛选状态的文件直接复用；
+    先写临时文件再替换（并发会话导出同一文件时不会读到一半），写完清理过多的旧文件
+    """
+    path = export_path(name, key, fmt, folder)
+    if os.path.exists(path):
+        os.utime(path)  # 更新修改时间：清理时按最近使用保留
+        return path
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _prune(folder)
+    return path
+
+
+def _prune(folder, keep=MAX_EXPORT_FILES):
+    """只保留最近使用的keep个导出文件"""
+    with _export_lock:
+        files = [os.path.join(folder, n) for n in os.listdir(folder) if not n.endswith(".tmp")]
+        if len(files) <= keep:
+            return
+        files.sort(key=lambda p: os.stat(p).st_mtime_ns, reverse=True)
+        for path in files[keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
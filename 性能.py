@@ -0,0 +1,111 @@
+"""
+各处理阶段的耗时与数据量记录（可选开启）：墙钟时间、输入/输出行数、发送给浏览器的HTML字节数
+每条记录写成一行JSON（供日志系统收集），并按会话累计，计算各阶段的p50/p95
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# JSON行日志的默认位置（可用环境变量RULIN_PERF_LOG指定其他文件）
+DEFAULT_LOG_PATH = os.path.join(".cache", "perf.jsonl")
+HISTORY_SIZE = 200  # 每个会话每个页面的每个阶段最多保留的记录数
+
+_log_lock = threading.Lock()
+# 视图在工作线程里生成（见后台构建.py），各线程的阶段记录同时写入本会话的历史
+_history_lock = threading.Lock()
+
+
+def enabled_by_default():
+    """环境变量RULIN_PERF=1时默认开启（侧边栏仍可关闭）"""
+    return os.environ.get("RULIN_PERF", "") not in ("", "0")
+
+
+class StageRecorder:
+    """
+    一次重跑的阶段记录器：用 with recorder.stage(名称, rows_in=...) as rec 包住一个阶段，
+    阶段内可写 rec['rows_out']、rec['bytes']；未开启时不计时也不记录
+    在工作线程里生成视图时传view（提交任务时的页面），记录不随之后切换的perf.view变化
+    history：本会话各阶段的历史记录（(页面, 阶段) → deque），跨重跑保留在session_state里
+    （不同页面的同名阶段如filter数据量不同，分开统计）
+    """
+
+    def __init__(self, enabled, session_id, history, view=None, log_path=None):
+        self.enabled = enabled
+        self.session_id = session_id
+        self.history = history
+        self.view = view
+        self.log_path = log_path or os.environ.get("RULIN_PERF_LOG", DEFAULT_LOG_PATH)
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None, view=None):
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None, "bytes": None}
+        if view is not None:
+            record["view"] = view
+        if not self.enabled:
+            yield record
+            return
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["ms"] = (time.perf_counter() - start) * 1000
+            self.add(record)
+
+    def add(self, record):
+        """加入一条已计时的记录（如数据加载在记录器创建之前完成，可直接补记）"""
+        if not self.enabled:
+            return
+        record = {"ts": time.time(), "session": self.session_id, "view": self.view, **record}
+        with _history_lock:
+            self.records.append(record)
+            key = (record["view"], record["stage"])
+            self.history.setdefault(key, deque(maxlen=HISTORY_SIZE)).append(record)
+
+    def flush(self):
+        """本次重跑的记录追加写入JSON行日志（写失败不影响页面）"""
+        with _history_lock:
+            records, self.records = self.records, []
+        if not records:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False, default=_jsonable) + "\n" for r in records)
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError:
+            pass
+
+    def last_run(self):
+        """本次重跑各阶段的记录表"""
+        with _history_lock:
+            records = list(self.records)
+        return pd.DataFrame(records, columns=["stage", "view", "ms", "rows_in", "rows_out", "bytes"])
+
+
+def _jsonable(value):
+    """numpy标量等转成JSON可序列化的值"""
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+def summarize(history):
+    """本会话各页面各阶段的次数、p50/p95耗时（毫秒）与最近一次的行数、字节数"""
+    with _history_lock:
+        history = {key: list(records) for key, records in history.items()}
+    rows = []
+    for (view, stage), records in history.items():
+        ms = np.array([r["ms"] for r in records])
+        last = records[-1]
+        rows.append({
+            "view": view, "stage": stage, "n": len(ms),
+            "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "rows_out": last["rows_out"], "bytes": last["bytes"]
+        })
+    table = pd.DataFrame(rows, columns=["view", "stage", "n", "p50_ms", "p95_ms", "rows_out", "bytes"])
+    return table.sort_values("p95_ms", ascending=False, ignore_index=True)
@@ -0,0 +1,265 @@
+"""《儒林外史》标注数据读取：解析CSV、规范化字段、生成列式快照，并按文件版本在进程内缓存"""
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from 全文检索 import SearchIndex, build_index, document, query_terms, read_index
+from 筛选 import FilterEngine
+from 空间索引 import SpatialIndex
+
+# 原始中文列名 → 调用用的英文列名
+COLUMN_MAP = {
+    '回次': 'chapter',
+    '地名': 'location',
+    '经度': 'lon',
+    '纬度': 'lat',
+    '城市出现次数': 'loc_total_freq',  # 地点总出现次数
+    '涉及主要人物': 'characters',
+    '活动类型': 'activity_type',
+    '情节': 'plot_summary'
+}
+CHAR_SEP = '，'  # 多人物分隔符
+SNAPSHOT_DIR = ".cache"  # 快照目录（放在CSV同级目录下）
+SNAPSHOT_FORMAT = "v4"  # 快照格式版本：格式变化时旧快照自动作废
+# 主表中转为分类类型的文字列（每行重复的字符串只存一份）
+CATEGORY_COLUMNS = ['章節題目', 'location', 'activity_type', 'characters', 'location_id', 'activity_type_id']
+
+# 进程级缓存：(绝对路径, 修改时间, 文件大小) → Corpus，所有会话、所有重跑共用
+_corpus_cache = {}
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class Corpus:
+    """整理好的数据及其派生结果（只读，多个会话共用，不要原地修改）"""
+    df: pd.DataFrame  # 主表：分类/小整数列，不含经纬度与情节，索引即row_id
+    gazetteer: pd.DataFrame  # 地点坐标表：按location_id索引，含location、lon、lat
+    loc_id_map: dict
+    char_id_map: dict
+    act_id_map: dict
+    occurrences: pd.DataFrame  # 人物出现表：每个(行, 人物)一行，row_id对应df的索引
+    characters: pd.Index  # 全部人物（按首次出现顺序），位置即人物编码char_id
+    version: str  # 源文件内容哈希，用作下游缓存的版本号
+    filters: FilterEngine  # 三个页面共用的筛选引擎（掩码缓存、章回前缀和）
+    spatial: SpatialIndex  # 地点坐标的网格索引（视野查询、最近地点）
+    search_index: SearchIndex  # 情节+章節題目的二元组倒排索引
+    plot_path: str = None  # 情节快照（Arrow IPC文件），None表示情节只在内存里
+    _plots: pa.ChunkedArray = field(default=None, repr=False)
+    _plot_codes: np.ndarray = field(default=None, repr=False)
+
+    def char_codes(self, names):
+        """人物名 → 人物编码（不存在的人物忽略）"""
+        codes = self.characters.get_indexer(list(names))
+        return codes[codes >= 0]
+
+    def plots(self):
+        """情节文本列：第一次用到时才从快照内存映射读取（不占各会话的内存）"""
+        if self._plots is None:
+            self._plots = read_plots(self.plot_path)
+        return self._plots
+
+    def plot_codes(self):
+        """情节文本的整数编码（相同文本同一编码，缺失或空串为-1），按row_id下标取，供分组去重、找非空情节用"""
+        if self._plot_codes is None:
+            plots = self.plots()
+            plots = pc.if_else(pc.equal(plots, ""), pa.scalar(None, pa.string()), plots)
+            encoded = plots.dictionary_encode().combine_chunks()
+            self._plot_codes = pc.fill_null(encoded.indices, -1).to_numpy().astype(np.int32)
+        return self._plot_codes
+
+    def search_documents(self, row_ids):
+        """按row_id取检索文本（情节+章節題目，与建索引时一致）"""
+        titles = self.df['章節題目'].to_numpy()[row_ids]
+        return [document(plot, title) for plot, title in zip(self.plot_text(row_ids).to_numpy(), titles)]
+
+    def search_rows(self, query):
+        """全文检索：倒排索引求候选行，再按原文核对（二元组都命中不代表整词命中），返回升序row_id"""
+        terms = query_terms(query)
+        candidates = self.search_index.candidates(terms)
+        documents = self.search_documents(candidates)
+        keep = np.fromiter((all(t in d for t in terms) for d in documents), dtype=bool, count=len(documents))
+        return candidates[keep]
+
+    def plot_text(self, row_ids):
+        """按row_id取情节文本，返回以row_id为索引的Series（空情节为None）"""
+        row_ids = pd.Index(row_ids)
+        texts = self.plots().take(pa.array(row_ids.to_numpy(), type=pa.int64()))
+        return pd.Series(texts.to_pylist(), index=row_ids, dtype=object)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """分块计算文件内容的sha1"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_csv(path):
+    """读取CSV并改名、补ID列（完整的宽表，含经纬度与情节）"""
+    df = pd.read_csv(path, encoding='utf-8')
+    df = df.rename(columns=COLUMN_MAP)
+    # 地点ID、活动类型ID按首次出现顺序编号
+    loc_id_map, act_id_map = _ordered_id_map(df['location'], 'loc'), _ordered_id_map(df['activity_type'], 'act')
+    df['location_id'] = df['location'].map(loc_id_map)
+    df['activity_type_id'] = df['activity_type'].map(act_id_map)
+    return df.reset_index(drop=True)
+
+
+def _ordered_id_map(values, prefix):
+    """按首次出现顺序生成 值→ID（如 loc_001）"""
+    return {v: f'{prefix}_{str(i+1).zfill(3)}' for i, v in enumerate(pd.unique(pd.Series(values, dtype=object)))}
+
+
+def compact_frames(df):
+    """
+    把宽表拆成紧凑的三部分
+    1. 主表：文字列转分类（类别按首次出现顺序），章回/次数按取值范围降为小整数类型，去掉经纬度和情节
+    2. 地点坐标表：每个地点一行，按location_id索引
+    3. 情节：Arrow字符串数组，下标即row_id
+    4. 全文检索索引：情节+章節題目的二元组倒排表
+    """
+    gazetteer = df.drop_duplicates('location_id')[['location_id', 'location', 'lon', 'lat']].set_index('location_id')
+    hot = df.drop(columns=['lon', 'lat', 'plot_summary'])
+    for col in CATEGORY_COLUMNS:
+        hot[col] = pd.Categorical(hot[col], categories=hot[col].dropna().unique())
+    # 章回/次数按取值范围降为最小的整数类型（不会溢出回绕；多部小说合并后次数可能超出int16）
+    hot['chapter'] = pd.to_numeric(hot['chapter'], downcast='integer')
+    hot['loc_total_freq'] = pd.to_numeric(hot['loc_total_freq'], downcast='integer')
+    plots = pa.chunked_array([pa.array(df['plot_summary'], type=pa.string(), from_pandas=True)])
+    search = build_index([document(p, t) for p, t in zip(df['plot_summary'], df['章節題目'])])
+    return hot, gazetteer, plots, search
+
+
+def read_plots(plot_path):
+    """内存映射读取情节快照（Arrow IPC，无压缩，读取时不拷贝）"""
+    with pa.memory_map(plot_path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().column('plot_summary')
+
+
+def snapshot_paths(path, digest):
+    """快照文件路径：<CSV目录>/.cache/<文件名>.<内容哈希>.<格式版本>.{hot.parquet, gazetteer.parquet, plots.arrow, search.arrow}"""
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), SNAPSHOT_DIR)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(folder, f"{stem}.{digest[:16]}.{SNAPSHOT_FORMAT}")
+    return {
+        'hot': base + ".hot.parquet",
+        'gazetteer': base + ".gazetteer.parquet",
+        'plots': base + ".plots.arrow",
+        'search': base + ".search.arrow"
+    }
+
+
+def _write_ipc(table, path):
+    """写Arrow IPC文件（无压缩，读取时可直接内存映射）"""
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _write_snapshot(hot, gazetteer, plots, search, paths):
+    """写快照：先写临时文件再替换，并清理同一CSV的旧版本快照；目录只读时返回False"""
+    folder = os.path.dirname(paths['hot'])
+    prefix = os.path.basename(paths['hot'])[:-len("hot.parquet")]  # <文件名>.<内容哈希>.<格式版本>.
+    stem = prefix.rsplit('.', 3)[0]
+    try:
+        os.makedirs(folder, exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.tmp"
+        hot.to_parquet(paths['hot'] + tmp_suffix, index=True)
+        gazetteer.to_parquet(paths['gazetteer'] + tmp_suffix, index=True)
+        _write_ipc(pa.table({'plot_summary': plots}), paths['plots'] + tmp_suffix)
+        _write_ipc(search, paths['search'] + tmp_suffix)
+        for key in ('gazetteer', 'plots', 'search', 'hot'):  # 主表最后替换：主表存在即快照完整
+            os.replace(paths[key] + tmp_suffix, paths[key])
+        for name in os.listdir(folder):
+            if name.startswith(stem + ".") and not name.startswith(prefix):
+                os.remove(os.path.join(folder, name))
+        return True
+    except OSError:
+        return False
+
+
+def build_occurrences(df):
+    """
+    拆分多人物，生成整数编码的人物出现表（加载时只拆分一次，各页面复用）
+    返回 (出现表, 人物索引)：出现表含 row_id、char_id 与分类类型的 character
+    """
+    chars = df['characters'].astype(object).str.split(CHAR_SEP).explode().str.strip()
+    chars = chars[chars.notna() & (chars != '')]
+    characters = pd.Index(pd.unique(chars.to_numpy()), name='character')
+    character = pd.Categorical(chars.to_numpy(), categories=characters)
+    occurrences = pd.DataFrame({
+        'row_id': chars.index.to_numpy(dtype='int32'),
+        'char_id': character.codes.astype('int32'),
+        'character': character
+    })
+    return occurrences, characters
+
+
+def _prepare(hot, gazetteer, digest, search_index, plot_path=None, plots=None, char_ids=None):
+    """由紧凑主表生成ID映射与人物出现表；char_ids：人物名 → 已有的稳定ID（None表示按出现顺序编号）"""
+    occurrences, characters = build_occurrences(hot)
+    if char_ids is None:
+        char_id_map = _ordered_id_map(characters, 'char')
+    else:
+        char_id_map = {name: char_ids[name] for name in characters}
+    filters = FilterEngine(hot)
+    corpus = Corpus(
+        df=hot,
+        gazetteer=gazetteer,
+        loc_id_map=dict(zip(gazetteer['location'], gazetteer.index)),
+        char_id_map=char_id_map,
+        act_id_map=dict(zip(hot['activity_type'].cat.categories, hot['activity_type_id'].cat.categories)),
+        occurrences=occurrences,
+        characters=characters,
+        version=digest,
+        filters=filters,
+        spatial=SpatialIndex(gazetteer),
+        search_index=search_index,
+        plot_path=plot_path,
+        _plots=plots
+    )
+    filters.search = corpus.search_rows  # 全文检索维度：核对原文要读情节，由Corpus提供
+    return corpus
+
+
+def load_corpus(path="读取1.csv"):
+    """
+    读取数据（每个文件版本只解析一次）
+    1. 内存缓存：按 路径+修改时间+大小 命中，Streamlit重跑和新会话直接复用
+    2. 磁盘快照：按文件内容哈希命中，进程重启后直接读快照（含检索索引），不再解析CSV、不再建索引
+    """
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    key = (abs_path, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        corpus = _corpus_cache.get(key)
+        if corpus is not None:
+            return corpus
+        digest = file_digest(abs_path)
+        corpus = load_snapshot_or_build(snapshot_paths(abs_path, digest), digest, lambda: parse_csv(abs_path))
+        # 同一文件只保留最新版本
+        for old_key in [k for k in _corpus_cache if k[0] == abs_path]:
+            del _corpus_cache[old_key]
+        _corpus_cache[key] = corpus
+        return corpus
+
+
+def load_snapshot_or_build(paths, digest, build_wide, char_ids=None):
+    """有快照直接读快照；否则由build_wide()得到宽表，拆成紧凑结构并写快照（目录只读时不写，数据留在内存）"""
+    if os.path.exists(paths['hot']):
+        return _prepare(
+            pd.read_parquet(paths['hot']), pd.read_parquet(paths['gazetteer']), digest,
+            read_index(paths['search']), plot_path=paths['plots'], char_ids=char_ids
+        )
+    hot, gazetteer, plots, search = compact_frames(build_wide())
+    if _write_snapshot(hot, gazetteer, plots, search, paths):
+        return _prepare(hot, gazetteer, digest, SearchIndex(search), plot_path=paths['plots'], char_ids=char_ids)
+    return _prepare(hot, gazetteer, digest, SearchIndex(search), plots=plots, char_ids=char_ids)
@@ -0,0 +1,97 @@
+"""地点坐标表的网格空间索引：视野范围查询、最近N个地点查询、整体范围（用于地图自动定位）"""
+import math
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """球面距离（公里），参数可以是数组"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class SpatialIndex:
+    """
+    均匀网格索引（每个地点一个点，按location_id）
+    经度按平均纬度的cos缩放，网格近似正方形；每格平均约per_cell个地点，查询只看相关网格
+    """
+
+    def __init__(self, gazetteer, per_cell=4):
+        coords = gazetteer[['lat', 'lon']].dropna()
+        self.ids = coords.index.to_numpy()
+        self.names = gazetteer.loc[coords.index, 'location'].to_numpy()
+        self.lat = coords['lat'].to_numpy(dtype=float)
+        self.lon = coords['lon'].to_numpy(dtype=float)
+        self._scale = math.cos(math.radians(self.lat.mean())) if len(self.lat) else 1.0
+        x, y = self.lon * self._scale, self.lat
+        self._x0 = x.min() if len(x) else 0.0
+        self._y0 = y.min() if len(y) else 0.0
+        span = max(x.max() - self._x0, y.max() - self._y0, 1e-9) if len(x) else 1.0
+        cells_per_side = max(1, int(math.sqrt(max(len(x), 1) / per_cell)))
+        self.cell = span / cells_per_side
+        self._cols = cells_per_side + 1
+        cx, cy = self._cell_of(x, y)
+        # 网格 → 地点下标（按网格编号排序后切片，不用逐格的Python列表）
+        cell_ids = cy * self._cols + cx
+        self._order = np.argsort(cell_ids, kind='stable')
+        self._cell_starts = np.searchsorted(cell_ids[self._order], np.arange(self._cols * self._cols + 1))
+
+    def _cell_of(self, x, y):
+        cx = np.clip(((x - self._x0) / self.cell).astype(int), 0, self._cols - 1)
+        cy = np.clip(((y - self._y0) / self.cell).astype(int), 0, self._cols - 1)
+        return cx, cy
+
+    def _members(self, cx0, cy0, cx1, cy1):
+        """矩形范围内网格里的地点下标"""
+        parts = [
+            self._order[self._cell_starts[cy * self._cols + cx0]:self._cell_starts[cy * self._cols + cx1 + 1]]
+            for cy in range(cy0, cy1 + 1)
+        ]
+        return np.concatenate(parts) if parts else np.array([], dtype=int)
+
+    def bounds(self):
+        """全部地点的范围 [[南, 西], [北, 东]]（folium fit_bounds 的格式），没有地点时返回None"""
+        if not len(self.lat):
+            return None
+        return [[float(self.lat.min()), float(self.lon.min())], [float(self.lat.max()), float(self.lon.max())]]
+
+    def within(self, south, west, north, east):
+        """视野范围内的地点，返回 location_id → 地点名（按location_id顺序）"""
+        if not len(self.lat):
+            return pd.Series(dtype=object)
+        (cx0, cx1), (cy0, cy1) = self._cell_of(
+            np.array([west, east]) * self._scale, np.array([south, north])
+        )
+        idx = self._members(cx0, cy0, cx1, cy1)
+        keep = (self.lat[idx] >= south) & (self.lat[idx] <= north) & (self.lon[idx] >= west) & (self.lon[idx] <= east)
+        idx = np.sort(idx[keep])
+        return pd.Series(self.names[idx], index=self.ids[idx])
+
+    def nearest(self, lat, lon, n=5, exclude=()):
+        """
+        离某点最近的n个地点，返回含 location_id、location、distance_km 的表（按距离升序）
+        从点击处所在网格向外逐圈查找，已找到n个且下一圈不可能更近时停止
+        """
+        x, y = lon * self._scale, lat
+        (cx,), (cy,) = self._cell_of(np.array([x]), np.array([y]))
+        skip = np.isin(self.ids, list(exclude))
+        found = np.array([], dtype=int)
+        for ring in range(self._cols):
+            cells = self._members(max(cx - ring, 0), max(cy - ring, 0), min(cx + ring, self._cols - 1), min(cy + ring, self._cols - 1))
+            found = cells[~skip[cells]]
+            if len(found) >= n:
+                dist = np.hypot(self.lon[found] * self._scale - x, self.lat[found] - y)
+                # 第ring+1圈的点离查询点至少ring个网格宽
+                if np.sort(dist)[n - 1] <= ring * self.cell:
+                    break
+        dist = np.hypot(self.lon[found] * self._scale - x, self.lat[found] - y)
+        found = found[np.argsort(dist, kind='stable')[:n]]
+        return pd.DataFrame({
+            'location_id': self.ids[found],
+            'location': self.names[found],
+            'distance_km': haversine_km(lat, lon, self.lat[found], self.lon[found])
+        })
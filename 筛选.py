@@ -0,0 +1,130 @@
+"""三个页面共用的筛选引擎：按维度缓存掩码、按位与组合，章回范围统计用前缀和O(地点数)得到"""
+import numpy as np
+import pandas as pd
+
+from 缓存 import LRUCache, state_key
+
+
+class FilterEngine:
+    """
+    一个语料一个实例，多个会话共用（只读）
+    掩码按“维度+选择”缓存：拖动章回滑块时，地点、活动类型的掩码直接命中，只重算章回掩码再按位与
+    """
+
+    def __init__(self, df, max_masks=256):
+        self.df = df
+        self.masks = LRUCache(max_masks, max_bytes=64 * 1024 * 1024)
+        self.search = None  # 全文检索：检索词 → 命中的row_id（由Corpus设置）
+        # 章回排序一次：章回范围 → searchsorted得到连续区间
+        chapter = df['chapter'].to_numpy()
+        self._chapter_order = np.argsort(chapter, kind='stable')
+        self._sorted_chapters = chapter[self._chapter_order]
+        self.chapters = np.unique(chapter)  # 前缀和矩阵的列对应的章回
+        # 前缀和矩阵：第i行第j列 = 第i个类别在 self.chapters[:j] 里的累计值
+        self._loc_freq_first = self._prefix(df.drop_duplicates(['location', 'chapter']), 'location', 'loc_total_freq')
+        self._loc_freq_distinct = self._prefix(
+            df.drop_duplicates(['location', 'chapter', 'loc_total_freq']), 'location', 'loc_total_freq'
+        )
+        self._loc_chapters = self._prefix(df.drop_duplicates(['location', 'chapter']), 'location')
+        self._act_chapters = self._prefix(df.drop_duplicates(['activity_type', 'chapter']), 'activity_type')
+
+    def _prefix(self, rows, dim, value=None):
+        """按(类别, 章回)累加后沿章回方向求前缀和，返回 (类别数, 章回数+1) 的矩阵"""
+        categories = self.df[dim].cat.categories
+        totals = np.zeros((len(categories), len(self.chapters)), dtype=np.int64)
+        codes = rows[dim].cat.codes.to_numpy()
+        cols = np.searchsorted(self.chapters, rows['chapter'].to_numpy())
+        weights = rows[value].to_numpy() if value else np.ones(len(rows), dtype=np.int64)
+        keep = codes >= 0
+        np.add.at(totals, (codes[keep], cols[keep]), weights[keep])
+        return np.concatenate([np.zeros((len(categories), 1), dtype=np.int64), totals.cumsum(axis=1)], axis=1)
+
+    def _chapter_span(self, chapters):
+        """章回范围[a, b] → 前缀和矩阵的列区间 [lo, hi)"""
+        lo = np.searchsorted(self.chapters, chapters[0], side='left')
+        hi = np.searchsorted(self.chapters, chapters[1], side='right')
+        return lo, max(lo, hi)
+
+    def _category_mask(self, dim, selected):
+        """多选维度的掩码：选中类别查表，再按行的分类编码取值（编码-1即空值，落在表尾的False上）"""
+        col = self.df[dim]
+        codes = col.cat.categories.get_indexer(list(selected))
+        lookup = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+        lookup[codes[codes >= 0]] = True
+        return lookup[col.cat.codes.to_numpy()]
+
+    def _range_mask(self, chapters):
+        """章回范围掩码：在排好序的章回上二分，区间内的行置True"""
+        lo = np.searchsorted(self._sorted_chapters, chapters[0], side='left')
+        hi = np.searchsorted(self._sorted_chapters, chapters[1], side='right')
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[self._chapter_order[lo:hi]] = True
+        return mask
+
+    def _query_mask(self, query):
+        """全文检索掩码：命中的行置True"""
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[self.search(query)] = True
+        return mask
+
+    def dimension_mask(self, dim, selection):
+        """
+        单个维度的掩码（按选择缓存）
+        dim为'chapter'时selection是(起, 止)，为'query'时是检索词，否则是选中的类别
+        """
+        if dim == 'query':
+            query = " ".join(selection.split())
+            return self.masks.get_or_build(state_key(dim=dim, query=query), lambda: self._query_mask(query))
+        if dim == 'chapter':
+            selection = (int(selection[0]), int(selection[1]))
+            return self.masks.get_or_build(
+                state_key(dim=dim, chapters=selection), lambda: self._range_mask(selection)
+            )
+        selection = set(selection)
+        return self.masks.get_or_build(
+            state_key(dim=dim, selected=selection), lambda: self._category_mask(dim, selection)
+        )
+
+    def mask(self, chapters=None, locs=None, acts=None, query=None):
+        """各维度掩码按位与（None或空检索词表示该维度不筛选）"""
+        mask = np.ones(len(self.df), dtype=bool)
+        query = query.strip() if query else ""
+        dims = (('chapter', chapters), ('location', locs), ('activity_type', acts), ('query', query or None))
+        for dim, selection in dims:
+            if selection is not None:
+                mask &= self.dimension_mask(dim, selection)
+        return mask
+
+    def rows(self, chapters=None, locs=None, acts=None, query=None):
+        """筛选后的行（只读视图用，不要原地修改）"""
+        return self.df[self.mask(chapters, locs, acts, query)]
+
+    def location_freq(self, chapters, dedup='first', query=None):
+        """
+        章回范围内每个地点的总出现次数（同一地点同一章回只计一次），只含范围内出现过的地点
+        dedup='first'：每个(地点, 章回)取第一行的次数；'distinct'：(地点, 章回, 次数)去重后求和
+        有检索词时前缀和不适用，改为对命中的行分组计算
+        """
+        if query and query.strip():
+            cols = ['location', 'chapter'] if dedup == 'first' else ['location', 'chapter', 'loc_total_freq']
+            rows = self.rows(chapters, query=query).drop_duplicates(cols)
+            totals = rows.groupby('location', observed=True)['loc_total_freq'].sum().astype(np.int64)
+            return totals.set_axis(totals.index.astype(str))
+        cum = self._loc_freq_first if dedup == 'first' else self._loc_freq_distinct
+        return self._range_totals(cum, 'location', chapters)
+
+    def activity_chapter_count(self, chapters, query=None):
+        """章回范围内每种活动类型涉及的章回数，只含范围内出现过的活动类型（有检索词时按命中的行计算）"""
+        if query and query.strip():
+            rows = self.rows(chapters, query=query).drop_duplicates(['activity_type', 'chapter'])
+            counts = rows.groupby('activity_type', observed=True).size().astype(np.int64)
+            return counts.set_axis(counts.index.astype(str))
+        return self._range_totals(self._act_chapters, 'activity_type', chapters)
+
+    def _range_totals(self, cum, dim, chapters):
+        """前缀和矩阵两列相减得到范围内的合计；是否出现用章回数前缀和判断，不扫描行"""
+        lo, hi = self._chapter_span(chapters)
+        seen = self._act_chapters if dim == 'activity_type' else self._loc_chapters
+        present = (seen[:, hi] - seen[:, lo]) > 0
+        totals = cum[:, hi] - cum[:, lo]
+        return pd.Series(totals[present], index=self.df[dim].cat.categories[present].astype(str))
@@ -0,0 +1,276 @@
+"""地图、关联图、统计表共用的分组统计（一次分组得到整张结果表，不再逐个地点循环筛选）"""
+import numpy as np
+import pandas as pd
+
+
+def location_marker_table(corpus, filtered_df, total_freq=None, min_radius=12, radius_range=20):
+    """
+    按地点汇总筛选结果，地图标记与“筛选结果统计（地点维度）”表格共用
+    每个地点一行，顺序与地点在筛选结果中首次出现的顺序一致（分组用地点的分类编码）
+    total_freq：已算好的 地点→总出现次数（如筛选引擎的章回前缀和结果），None表示按筛选行分组计算
+    """
+    rows = filtered_df.assign(loc_code=filtered_df['location'].cat.codes)
+    # 1. 基础信息：取每个地点第1行的人物/情节，经纬度查地点坐标表
+    first_rows = rows[~rows['loc_code'].duplicated()]
+    table = pd.DataFrame({
+        'location': first_rows['location'].astype(str).to_numpy(),
+        'location_id': first_rows['location_id'].astype(str).to_numpy(),
+        'characters': first_rows['characters'].astype(object).to_numpy(),
+        'plot_summary': corpus.plot_text(first_rows.index).to_numpy()
+    }, index=first_rows['loc_code'].to_numpy())
+    coords = corpus.gazetteer.loc[table['location_id']]
+    table['lat'] = coords['lat'].to_numpy()
+    table['lon'] = coords['lon'].to_numpy()
+    # 2. 总出现次数：按“地点+章回+loc_total_freq”去重后求和（同一章回不同活动分不同行，防止重复统计）
+    loc_chapter_unique = rows[['loc_code', 'chapter', 'loc_total_freq']].drop_duplicates()
+    if total_freq is None:
+        table['total_freq'] = loc_chapter_unique.groupby('loc_code')['loc_total_freq'].sum().astype(int)
+    else:
+        table['total_freq'] = table['location'].map(total_freq).astype(int)
+    # 3. 涉及章回（排序去重）与每章出现次数
+    loc_chapter_unique = loc_chapter_unique.sort_values(['chapter', 'loc_total_freq'], kind='stable')
+    table['chapter_list'] = (
+        loc_chapter_unique.drop_duplicates(['loc_code', 'chapter'])
+        .groupby('loc_code')['chapter'].agg(lambda x: x.astype(int).tolist())
+    )
+    table['chapter_count'] = table['chapter_list'].str.len()
+    chapter_freq_str = (
+        "第" + loc_chapter_unique['chapter'].astype(str) + "回："
+        + loc_chapter_unique['loc_total_freq'].astype(str) + "次"
+    )
+    table['chapter_freq_str'] = chapter_freq_str.groupby(loc_chapter_unique['loc_code']).agg(list)
+    # 4. 活动类型统计：按次数降序（次数相同保持首次出现顺序），第一名即主要活动
+    act_freq = rows.groupby(['loc_code', 'activity_type'], sort=False, observed=True).size().reset_index(name='freq')
+    act_freq = act_freq.sort_values('freq', ascending=False, kind='stable')
+    act_freq_str = act_freq['activity_type'].astype(str) + "：" + act_freq['freq'].astype(str) + "次"
+    table['act_freq_str'] = act_freq_str.groupby(act_freq['loc_code']).agg("\n".join)
+    table['main_act'] = act_freq.drop_duplicates('loc_code').set_index('loc_code')['activity_type'].astype(str)
+    # 5. 主要涉及人物：出现最多的人物组合
+    char_freq = rows.groupby(['loc_code', 'characters'], sort=False, observed=True).size()
+    char_freq = char_freq.reset_index(name='freq').sort_values('freq', ascending=False, kind='stable')
+    table['main_char'] = char_freq.drop_duplicates('loc_code').set_index('loc_code')['characters'].astype(object)
+    table['main_char'] = table['main_char'].fillna("无")
+    # 6. 标记大小：按筛选后所有地点的最大总次数等比例缩放
+    table['radius'] = min_radius + table['total_freq'] / table['total_freq'].max() * radius_range
+    return table.reset_index(drop=True)
+
+
+def occurrences_in(corpus, rows, chars=None):
+    """取筛选行内的人物出现记录；chars不为空时只保留选中人物（按人物编码isin）"""
+    occ = corpus.occurrences
+    mask = occ['row_id'].isin(rows.index)
+    if chars is not None:
+        mask &= occ['char_id'].isin(corpus.char_codes(chars))
+    return occ[mask]
+
+
+def _group_ids(*cols):
+    """
+    多列整数编码 → 单列组号（组号按首次出现顺序编号）
+    各列按取值范围拼成一个int64，只在快溢出时先factorize压缩一次，通常整个过程只哈希一遍
+    """
+    ids = np.zeros(len(cols[0]), dtype=np.int64)
+    bound = 1
+    for col in cols:
+        col = np.asarray(col, dtype=np.int64) + 1  # 空值编码-1 → 0
+        width = int(col.max()) + 1 if len(col) else 1
+        if bound * width >= 2 ** 62:
+            ids, uniques = pd.factorize(ids)
+            bound = len(uniques)
+        ids = ids * width + col
+        bound *= width
+    return pd.factorize(ids)[0]
+
+
+def _first_positions(ids):
+    """每个值第一次出现的位置（按出现先后，即去重后保留首行；对组号而言也就是按组号顺序）"""
+    return np.flatnonzero(~pd.Series(ids).duplicated().to_numpy())
+
+
+def _join_groups(keys, labels, sep=', '):
+    """把同一key的标签按给定顺序连接成字符串，返回 key→字符串（每组只做一次join）"""
+    if len(keys) == 0:
+        return pd.Series(dtype=object)
+    order = np.argsort(keys, kind='stable')
+    keys, labels = keys[order], np.asarray(labels, dtype=object)[order].tolist()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    return pd.Series([sep.join(labels[a:b]) for a, b in zip(starts, ends)], index=keys[starts], dtype=object)
+
+
+def _chapter_summary(keys, chapters):
+    """每组去重排序后的章回，格式化为“X回（a, b, c）”"""
+    pos = _first_positions(_group_ids(keys, chapters))
+    keys, chapters = keys[pos], chapters[pos]
+    order = np.lexsort((chapters, keys))
+    keys, chapters = keys[order], chapters[order]
+    codes, uniques = pd.factorize(chapters)  # 不同章回只转一次字符串
+    joined = _join_groups(keys, uniques.astype(str).astype(object)[codes])
+    counts = pd.Series(keys).value_counts(sort=False)
+    return counts.astype(str) + "回（" + joined + "）"
+
+
+def _distinct_names(keys, codes, names):
+    """每组去重后的名称（按首次出现顺序），用“, ”连接；codes为names里的位置，-1（空值）忽略"""
+    pos = _first_positions(_group_ids(keys, codes))
+    pos = pos[codes[pos] >= 0]
+    return _join_groups(keys[pos], np.asarray(names.astype(str))[codes[pos]])
+
+
+def _count_summary(keys, codes, names):
+    """每组各类别的次数，按次数降序（次数相同按首次出现）格式化为“名（n次）, ...”"""
+    ids = _group_ids(keys, codes)
+    pos = _first_positions(ids)
+    freq = np.bincount(ids)
+    valid = codes[pos] >= 0
+    pos, freq = pos[valid], freq[valid]
+    order = np.lexsort((-freq, keys[pos]))
+    pos, freq = pos[order], freq[order]
+    labels = pd.Series(np.asarray(names.astype(str))[codes[pos]]) + "（" + pd.Series(freq).astype(str) + "次）"
+    return _join_groups(keys[pos], labels.to_numpy())
+
+
+def _first_plots(corpus, row_ids, keys, width):
+    """每组第一条非空情节的前width字（加“...”）；只取每组那一条情节文本"""
+    has_plot = corpus.plot_codes()[row_ids] >= 0
+    keys, row_ids = keys[has_plot], row_ids[has_plot]
+    pos = _first_positions(keys)
+    texts = corpus.plot_text(row_ids[pos]).str[:width] + "..."
+    return pd.Series(texts.to_numpy(), index=keys[pos])
+
+
+def _codes(corpus, dim):
+    """主表某分类列的 (编码数组, 类别)，编码按row_id下标取"""
+    col = corpus.df[dim]
+    return col.cat.codes.to_numpy(), col.cat.categories
+
+
+def _finish(table, names, name_col, columns):
+    """编码 → 名称，按名称排序，得到展示用的表格（格式化只在这张小表上做）"""
+    table.insert(0, name_col, names.take(table.index.to_numpy()).astype(str))
+    return table[[name_col] + columns].sort_values(name_col, ignore_index=True)
+
+
+def location_stat_table(corpus, rows, occ, chapters, query=None):
+    """
+    “按地点统计”表：地点、总出现次数、涉及章回、关联人物、活动类型统计、情节示例
+    rows：章回范围（及检索词）筛选后的行；occ：这些行的人物出现记录
+    chapters、query：筛选条件（总次数由筛选引擎的前缀和得到）
+    """
+    row_ids = rows.index.to_numpy()
+    loc_codes, loc_names = _codes(corpus, 'location')
+    act_codes, act_names = _codes(corpus, 'activity_type')
+    keys = loc_codes[row_ids]
+    table = pd.DataFrame(index=pd.unique(keys[keys >= 0]))
+    table['总出现次数'] = pd.Series(loc_names.take(table.index.to_numpy()).astype(str), index=table.index).map(
+        corpus.filters.location_freq(chapters, dedup='first', query=query))
+    table['涉及章回'] = _chapter_summary(keys, rows['chapter'].to_numpy())
+    occ_rows = occ['row_id'].to_numpy()
+    table['关联人物'] = _distinct_names(loc_codes[occ_rows], occ['char_id'].to_numpy(), corpus.characters)
+    table['关联人物'] = table['关联人物'].fillna('无')
+    table['活动类型统计'] = _count_summary(keys, act_codes[row_ids], act_names)
+    table['情节示例'] = _first_plots(corpus, row_ids, keys, 100)
+    table['情节示例'] = table['情节示例'].fillna("无相关情节")
+    return _finish(table, loc_names, '地点', ['总出现次数', '涉及章回', '关联人物', '活动类型统计', '情节示例'])
+
+
+def character_stat_table(corpus, occ):
+    """
+    “按人物统计”表：人物、涉及章回、关联地点、参与活动统计、情节
+    每个人物的(章回, 地点, 活动, 情节)组合先去重再计数，与逐行展开后去重的结果一致
+    """
+    occ_rows = occ['row_id'].to_numpy()
+    loc_codes, loc_names = _codes(corpus, 'location')
+    act_codes, act_names = _codes(corpus, 'activity_type')
+    keys = occ['char_id'].to_numpy()
+    chapters = corpus.df['chapter'].to_numpy()[occ_rows]
+    locs, acts = loc_codes[occ_rows], act_codes[occ_rows]
+    pos = _first_positions(_group_ids(keys, chapters, locs, acts, corpus.plot_codes()[occ_rows]))
+    keys, chapters, locs, acts, occ_rows = keys[pos], chapters[pos], locs[pos], acts[pos], occ_rows[pos]
+    table = pd.DataFrame(index=pd.unique(keys))
+    table['涉及章回'] = _chapter_summary(keys, chapters)
+    table['关联地点'] = _distinct_names(keys, locs, loc_names)
+    table['参与活动统计'] = _count_summary(keys, acts, act_names)
+    # 情节：每个人物第一条记录的情节前60字
+    first = _first_positions(keys)
+    plots = corpus.plot_text(occ_rows[first]).str[:60] + "..."
+    table['情节'] = pd.Series(plots.to_numpy(), index=keys[first]).fillna("无相关情节")
+    return _finish(table, corpus.characters, '人物', ['涉及章回', '关联地点', '参与活动统计', '情节'])
+
+
+def activity_stat_table(corpus, rows, occ, chapters, query=None):
+    """“按活动类型统计”表：活动类型、活动总次数、涉及章回、关联地点、关联人物、情节示例"""
+    row_ids = rows.index.to_numpy()
+    loc_codes, loc_names = _codes(corpus, 'location')
+    act_codes, act_names = _codes(corpus, 'activity_type')
+    keys = act_codes[row_ids]
+    table = pd.DataFrame(index=pd.unique(keys[keys >= 0]))
+    table['活动总次数'] = pd.Series(act_names.take(table.index.to_numpy()).astype(str), index=table.index).map(
+        corpus.filters.activity_chapter_count(chapters, query=query))
+    table['涉及章回'] = _chapter_summary(keys, rows['chapter'].to_numpy())
+    table['关联地点'] = _distinct_names(keys, loc_codes[row_ids], loc_names).fillna('无')
+    occ_rows = occ['row_id'].to_numpy()
+    table['关联人物'] = _distinct_names(act_codes[occ_rows], occ['char_id'].to_numpy(), corpus.characters)
+    table['关联人物'] = table['关联人物'].fillna('无')
+    table['情节示例'] = _first_plots(corpus, row_ids, keys, 80)
+    table['情节示例'] = table['情节示例'].fillna("无相关情节")
+    return _finish(table, act_names, '活动类型', ['活动总次数', '涉及章回', '关联地点', '关联人物', '情节示例'])
+
+
+def _split_groups(keys, values, n_groups):
+    """已按组号（0..n_groups-1）排好序的值 → 每组一段数组（没有值的组为空数组）；只按边界切分，不逐组建列表"""
+    parts = np.split(values, np.searchsorted(keys, np.arange(1, n_groups)))
+    out = np.empty(n_groups, dtype=object)
+    for i, part in enumerate(parts):
+        out[i] = part
+    return out
+
+
+def _grouped_by_first(keys, values, names):
+    """keys（编码）→ 各组的values（保持原顺序），组按keys首次出现顺序，返回 名称 → 数组"""
+    ids, uniques = pd.factorize(keys)
+    order = np.argsort(ids, kind='stable')
+    return pd.Series(_split_groups(ids[order], values[order], len(uniques)), index=names[uniques], dtype=object)
+
+
+def char_loc_index(occ, rows):
+    """
+    一次分组建立人物-地点倒排索引（构建关联图时按边线性遍历，不再逐边扫描全表）
+    返回 (edges, char_locs, loc_chars)：
+    edges：每个(人物, 地点)一行，含涉及章回 chapters、参与活动 acts、共同出现行数 weight
+    char_locs：人物 → 关联地点数组；loc_chars：地点 → 关联人物数组（均按首次出现顺序）
+    分组都用人物/地点/活动类型的分类编码，排序后按组边界切分，不对每组调用Python函数
+    """
+    pos = rows.index.get_indexer(occ['row_id'])
+    loc = rows['location'].cat.codes.to_numpy()[pos].astype(np.int64)
+    valid = loc >= 0  # 没有地点的记录不成边
+    pos, loc = pos[valid], loc[valid]
+    char = occ['char_id'].to_numpy()[valid].astype(np.int64)
+    chapter = rows['chapter'].to_numpy()[pos]
+    act = rows['activity_type'].cat.codes.to_numpy()[pos]
+    char_names = np.asarray(occ['character'].cat.categories.astype(str), dtype=object)
+    loc_names = np.asarray(rows['location'].cat.categories.astype(str), dtype=object)
+    act_names = np.asarray(rows['activity_type'].cat.categories.astype(str), dtype=object)
+    # 边号按(人物, 地点)首次出现顺序编号
+    edge = _group_ids(char, loc)
+    first = _first_positions(edge)
+    n_edges = len(first)
+    # 涉及章回：每条边去重后按章回排序
+    p = _first_positions(_group_ids(edge, chapter))
+    order = np.lexsort((chapter[p], edge[p]))
+    chapters = _split_groups(edge[p][order], chapter[p][order], n_edges)
+    # 参与活动：每条边去重后按首次出现顺序（空值忽略）
+    p = _first_positions(_group_ids(edge, act))
+    p = p[act[p] >= 0]
+    order = np.argsort(edge[p], kind='stable')
+    acts = _split_groups(edge[p][order], act_names[act[p][order]], n_edges)
+    edges = pd.DataFrame({
+        'char': char_names[char[first]],
+        'loc': loc_names[loc[first]],
+        'weight': np.bincount(edge, minlength=n_edges),
+        'chapters': chapters,
+        'acts': acts
+    })
+    char_locs = _grouped_by_first(char[first], loc_names[loc[first]], char_names)
+    loc_chars = _grouped_by_first(loc[first], char_names[char[first]], loc_names)
+    return edges, char_locs, loc_chars
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""进程内缓存工具：有容量上限的LRU缓存，以及把筛选状态规范化后哈希成缓存键"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _canonical(value):
+    """把筛选状态转成可稳定序列化的结构（集合排序、元组转列表、numpy标量转Python值）"""
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(v) for v in value), key=str)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def state_key(**state):
+    """筛选状态 → 规范化JSON的sha1（多选框的选择请传set，顺序不同也算同一状态）"""
+    payload = json.dumps(_canonical(state), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    线程安全的LRU缓存，多个会话共用
+    max_entries：最多保留的条目数；max_bytes：按 len(值) 估算的总大小上限（None表示不限）
+    """
+
+    def __init__(self, max_entries=32, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(value):
+        """字符串按长度、数组按nbytes估算，其他值不计"""
+        if isinstance(value, (str, bytes)):
+            return len(value)
+        return getattr(value, 'nbytes', 0)
+
+    def get_or_build(self, key, build):
+        """命中则返回缓存值，否则调用build()生成并放入缓存（生成过程不持锁，避免阻塞其他会话）"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = value
+                self._bytes += self._sizeof(value)
+            self._evict()
+        return value
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到满足条目数与大小上限（至少保留最新的一条）"""
+        while len(self._items) > 1 and (
+            len(self._items) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, old_value = self._items.popitem(last=False)
+            self._bytes -= self._sizeof(old_value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """命中/未命中次数与当前占用"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._items),
+                'bytes': self._bytes
+            }
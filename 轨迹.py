@@ -0,0 +1,128 @@
+"""人物行迹：按章回把每个人物出现的地点连成路线，各段球面距离对全部人物一次向量化计算"""
+from dataclasses import dataclass
+
+import folium
+import numpy as np
+import pandas as pd
+
+from 统计 import occurrences_in, _codes, _finish, _join_groups
+from 空间索引 import haversine_km
+from 缓存 import LRUCache, state_key
+
+# 行迹缓存：筛选状态 → Trajectories，全部会话共用
+trajectory_cache = LRUCache(max_entries=32)
+
+# 行迹配色（按人物在汇总表中的名次循环取色）
+TRAJECTORY_COLORS = ["#C0392B", "#2471A3", "#229954", "#D68910", "#7D3C98", "#17A589", "#A04000", "#2E4053"]
+
+
+@dataclass
+class Trajectories:
+    """全部人物的行迹：stops按人物、章回排列（连续停留同一地点合并为一站），legs为相邻两站之间的一段"""
+    stops: pd.DataFrame  # char_id、chapter、loc_code、lat、lon
+    legs: pd.DataFrame  # char_id、chapter（到达的章回）、from_code、to_code、distance_km
+    summary: pd.DataFrame  # 每个人物一行的汇总表（展示用）
+
+
+def character_trajectories(corpus, chapters=None, locs=None, acts=None, query=None):
+    """按筛选状态计算（并缓存）全部人物的行迹"""
+    key = state_key(
+        kind="trajectories", version=corpus.version, chapters=chapters,
+        locs=set(locs) if locs is not None else None, acts=set(acts) if acts is not None else None,
+        query=query or ""
+    )
+    return trajectory_cache.get_or_build(
+        key, lambda: build_trajectories(corpus, corpus.filters.rows(chapters, locs, acts, query))
+    )
+
+
+def build_trajectories(corpus, rows):
+    """
+    筛选行 → 行迹：人物出现记录按 (人物, 章回, 行号) 排序一次
+    相邻两条记录人物相同、地点不同即为一次移动，距离由经纬度数组整体做haversine
+    """
+    occ = occurrences_in(corpus, rows)
+    loc_codes, loc_names = _codes(corpus, 'location')
+    coords = corpus.gazetteer.drop_duplicates('location').set_index('location')[['lat', 'lon']]
+    coords = coords.reindex(loc_names)
+    lat_of, lon_of = coords['lat'].to_numpy(dtype=float), coords['lon'].to_numpy(dtype=float)
+    row_ids = occ['row_id'].to_numpy()
+    char_ids = occ['char_id'].to_numpy().astype(np.int64)
+    chapter = corpus.df['chapter'].to_numpy()[row_ids]
+    loc = loc_codes[row_ids].astype(np.int64)
+    keep = loc >= 0
+    keep[keep] = ~np.isnan(lat_of[loc[keep]]) & ~np.isnan(lon_of[loc[keep]])  # 没有坐标的地点不计入路线
+    row_ids, char_ids, chapter, loc = row_ids[keep], char_ids[keep], chapter[keep], loc[keep]
+    order = np.lexsort((row_ids, chapter, char_ids))
+    char_ids, chapter, loc = char_ids[order], chapter[order], loc[order]
+    # 连续停留同一地点合并为一站
+    new_stop = np.r_[True, (char_ids[1:] != char_ids[:-1]) | (loc[1:] != loc[:-1])] if len(loc) else np.array([], bool)
+    stops = pd.DataFrame({
+        'char_id': char_ids[new_stop], 'chapter': chapter[new_stop], 'loc_code': loc[new_stop],
+        'lat': lat_of[loc[new_stop]], 'lon': lon_of[loc[new_stop]]
+    })
+    # 相邻两站属于同一人物即为一段
+    s_char, s_loc = stops['char_id'].to_numpy(), stops['loc_code'].to_numpy()
+    same = s_char[1:] == s_char[:-1]
+    src, dst = np.flatnonzero(same), np.flatnonzero(same) + 1
+    legs = pd.DataFrame({
+        'char_id': s_char[dst], 'chapter': stops['chapter'].to_numpy()[dst],
+        'from_code': s_loc[src], 'to_code': s_loc[dst],
+        'distance_km': haversine_km(
+            stops['lat'].to_numpy()[src], stops['lon'].to_numpy()[src],
+            stops['lat'].to_numpy()[dst], stops['lon'].to_numpy()[dst]
+        )
+    })
+    return Trajectories(stops, legs, _summary(corpus, stops, legs, loc_names))
+
+
+def _summary(corpus, stops, legs, loc_names):
+    """每个人物：移动次数、总距离、最远一段、到访地点数、最常到访地点、路线（按总距离降序）"""
+    s_char, s_loc = stops['char_id'].to_numpy(), stops['loc_code'].to_numpy()
+    table = pd.DataFrame(index=pd.unique(s_char))
+    by_char = legs.groupby('char_id')['distance_km']
+    table['moves'] = by_char.size()
+    table['total_km'] = by_char.sum()
+    table['longest_km'] = by_char.max()
+    table[['total_km', 'longest_km']] = table[['total_km', 'longest_km']].fillna(0).round(1)
+    table['moves'] = table['moves'].fillna(0).astype(int)
+    visits = pd.DataFrame({'char_id': s_char, 'loc_code': s_loc}).value_counts(sort=False).reset_index(name='n')
+    table['places'] = visits.groupby('char_id').size()
+    # 最常到访：停留次数最多的地点，次数相同取先到的
+    first_seen = pd.DataFrame({'char_id': s_char, 'loc_code': s_loc}).drop_duplicates()
+    first_seen['rank'] = np.arange(len(first_seen))
+    visits = visits.merge(first_seen, on=['char_id', 'loc_code']).sort_values(['n', 'rank'], ascending=[False, True])
+    hub = visits.drop_duplicates('char_id').set_index('char_id')
+    table['hub'] = loc_names.take(hub['loc_code'].reindex(table.index).to_numpy()).astype(str)
+    table['route'] = _join_groups(s_char, loc_names.take(s_loc).astype(str), sep="→")
+    table = _finish(table, corpus.characters, '人物', ['moves', 'total_km', 'longest_km', 'places', 'hub', 'route'])
+    table['char_id'] = corpus.characters.get_indexer(table['人物'])
+    table = table.sort_values(['total_km', 'moves'], ascending=False, kind='stable', ignore_index=True)
+    return table.rename(columns={
+        'moves': '移动次数', 'total_km': '总距离（公里）', 'longest_km': '最远一段（公里）',
+        'places': '到访地点数', 'hub': '最常到访地点', 'route': '路线'
+    })
+
+
+def trajectory_layer(trajectories, top=10):
+    """总距离最长的前top位人物的行迹，放进一个GeoJSON图层（每人一条折线，悬浮显示人物与总距离）"""
+    summary = trajectories.summary[trajectories.summary['移动次数'] > 0].head(top)
+    stops = trajectories.stops.set_index('char_id')
+    features = []
+    for i, (char_id, name, km) in enumerate(zip(summary['char_id'], summary['人物'], summary['总距离（公里）'])):
+        path = stops.loc[[char_id]]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": path[['lon', 'lat']].to_numpy().tolist()},
+            "properties": {
+                "name": name,
+                "distance": f"{km:.0f}公里",
+                "color": TRAJECTORY_COLORS[i % len(TRAJECTORY_COLORS)]
+            }
+        })
+    return folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name="人物行迹",
+        style_function=lambda f: {"color": f["properties"]["color"], "weight": 3, "opacity": 0.8},
+        tooltip=folium.GeoJsonTooltip(fields=["name", "distance"], aliases=["人物", "总距离"])
+    )
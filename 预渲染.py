@@ -0,0 +1,144 @@
+"""
+离线预渲染：不启动streamlit，用与页面相同的函数把默认筛选条件下的地图、关联图、统计表导出为静态文件
+常用视图可直接放到静态文件服务器上，在线应用只处理自定义筛选
+
+用法：python 预渲染.py --out 预渲染 --windows 10-15 16-20 --block 5 --workers 4
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from 数据加载 import load_corpus
+from 统计 import location_marker_table, occurrences_in, location_stat_table, character_stat_table, activity_stat_table
+from 关联图 import char_loc_graph_html, loc_act_graph_html, DEFAULT_LOD
+from 地图 import base_map, location_markers
+
+# 与页面默认控件一致：全部地点/人物/活动类型、浏览器实时模拟布局、默认细节层次
+DEFAULT_LAYOUT = "physics"
+STAT_TABLES = {
+    "location_stats": "按地点统计",
+    "character_stats": "按人物统计",
+    "activity_stats": "按活动类型统计"
+}
+
+
+def window_name(chapters):
+    """章回范围 → 输出子目录名"""
+    return f"chapters_{chapters[0]}-{chapters[1]}"
+
+
+def parse_window(text):
+    """'10-15' → (10, 15)；单个数字表示只含这一回"""
+    start, _, end = text.partition("-")
+    return int(start), int(end or start)
+
+
+def chapter_windows(corpus, windows=(), block=None):
+    """要预渲染的章回范围：全书范围（默认视图）+ 指定范围 + 按block回一段切分（去重，保持顺序）"""
+    first, last = int(corpus.filters.chapters[0]), int(corpus.filters.chapters[-1])
+    result = [(first, last)] + [parse_window(w) for w in windows]
+    if block:
+        result += [(start, min(start + block - 1, last)) for start in range(first, last + 1, block)]
+    return list(dict.fromkeys(result))
+
+
+def _write_table(table, directory, name):
+    """统计表同时写Parquet（供程序读取）和JSON（供网页直接加载）"""
+    table.to_parquet(os.path.join(directory, f"{name}.parquet"), index=False)
+    table.to_json(os.path.join(directory, f"{name}.json"), orient="records", force_ascii=False)
+
+
+def render_window(csv_path, out_dir, chapters):
+    """
+    渲染一个章回范围的全部视图（在子进程中运行；语料从磁盘快照读取，不重新解析CSV）
+    返回该范围的清单：{章回范围, 文件相对路径}
+    """
+    corpus = load_corpus(csv_path)
+    directory = os.path.join(out_dir, window_name(chapters))
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    locs = list(corpus.df['location'].cat.categories)
+    acts = list(corpus.df['activity_type'].cat.categories)
+    chars = list(corpus.characters)
+    rows = corpus.filters.rows(chapters=chapters)
+    # 1. 地点地图：静态页面没有服务端详情面板，用完整模式（详细信息写在弹窗里）
+    if not rows.empty:
+        total_freq = corpus.filters.location_freq(chapters, dedup='distinct')
+        marker_table = location_marker_table(corpus, rows, total_freq=total_freq)
+        m = base_map(corpus)
+        location_markers(marker_table).add_to(m)
+        m.save(os.path.join(directory, "map.html"))
+        files["map"] = "map.html"
+    # 2. 两张关联图
+    graphs = {
+        "char_loc": lambda: char_loc_graph_html(corpus, locs, chars, chapters, DEFAULT_LAYOUT, DEFAULT_LOD),
+        "loc_act": lambda: loc_act_graph_html(corpus, locs, acts, chapters, DEFAULT_LAYOUT)
+    }
+    for name, build in graphs.items():
+        html = build()
+        if html is not None:
+            with open(os.path.join(directory, f"{name}.html"), "w", encoding="utf-8") as f:
+                f.write(html)
+            files[name] = f"{name}.html"
+    # 3. 三张统计表
+    occ = occurrences_in(corpus, rows)
+    tables = {
+        "location_stats": location_stat_table(corpus, rows, occ, chapters),
+        "character_stats": character_stat_table(corpus, occ),
+        "activity_stats": activity_stat_table(corpus, rows, occ, chapters)
+    }
+    for name, table in tables.items():
+        _write_table(table, directory, name)
+        files[name] = {"parquet": f"{name}.parquet", "json": f"{name}.json"}
+    return {"chapters": list(chapters), "directory": window_name(chapters), "files": files}
+
+
+def _write_index(out_dir, manifest):
+    """清单（JSON）和一个简单的目录页"""
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    labels = {"map": "地点坐标地图", "char_loc": "人物-地点关联图谱", "loc_act": "地点-活动类型关联图谱"}
+    labels.update({name: title for name, title in STAT_TABLES.items()})
+    items = []
+    for entry in manifest["windows"]:
+        links = []
+        for name, target in entry["files"].items():
+            target = target if isinstance(target, str) else target["json"]
+            links.append(f'<a href="{entry["directory"]}/{target}">{labels[name]}</a>')
+        start, end = entry["chapters"]
+        items.append(f"<li>第{start}-{end}回：{' | '.join(links)}</li>")
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(
+            "<!DOCTYPE html><html><head><meta charset='utf-8'><title>《儒林外史》可视化分析（预渲染）</title></head>"
+            f"<body><h1>《儒林外史》可视化分析（预渲染）</h1><ul>{''.join(items)}</ul></body></html>"
+        )
+
+
+def prerender(csv_path="读取1.csv", out_dir="预渲染", windows=(), block=None, workers=None):
+    """预渲染全部章回范围（进程池并行），写出清单与目录页，返回清单"""
+    corpus = load_corpus(csv_path)  # 主进程先加载一次：确保快照已写好，子进程直接读快照
+    targets = chapter_windows(corpus, windows, block)
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.abspath(csv_path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(render_window, [csv_path] * len(targets), [out_dir] * len(targets), targets))
+    manifest = {"source": os.path.basename(csv_path), "version": corpus.version, "windows": results}
+    _write_index(out_dir, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把默认筛选条件下的地图、关联图、统计表预渲染为静态文件")
+    parser.add_argument("--csv", default="读取1.csv", help="数据文件")
+    parser.add_argument("--out", default="预渲染", help="输出目录")
+    parser.add_argument("--windows", nargs="*", default=[], help="额外的章回范围，如 10-15 16-20")
+    parser.add_argument("--block", type=int, default=None, help="把全书按每block回切分，逐段预渲染")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数（默认CPU核数）")
+    args = parser.parse_args()
+    manifest = prerender(args.csv, args.out, args.windows, args.block, args.workers)
+    print(f"已预渲染{len(manifest['windows'])}个章回范围 → {os.path.abspath(args.out)}")
+
+
+if __name__ == "__main__":
+    main()